@@ -0,0 +1,116 @@
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from library.metrics import Histogram
+
+
+class Command(BaseCommand):
+    help = ('Credential-stuffing load test in this process: --threads attackers post wrong passwords '
+            'to the login view while one client reads the catalogue and another logs in with the right '
+            'password, with the rate limiter on and off. Reports login attempts/s, how many reached the '
+            'password hasher, CPU seconds per second, the catalogue latency and the latency and 429s '
+            'of the legitimate logins.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--distributed', action='store_true',
+                            help='every attempt from another address and for another username')
+        parser.add_argument('--site-limit', metavar='BURST,SECONDS',
+                            help="also enable the opt-in 'login:site' bucket with this limit")
+
+    def handle(self, *args, **options):
+        User.objects.filter(username='bench-victim').delete()
+        User.objects.create_user('bench-victim', password='correct horse battery staple')
+        User.objects.filter(username='bench-member').delete()
+        User.objects.create_user('bench-member', password='correct horse battery staple')
+        host = next((host for host in settings.ALLOWED_HOSTS if host not in ('*', '')), 'localhost')
+        self.host = host.lstrip('.')
+
+        self.stdout.write(f"{'limiter':<8} {'attempts/s':>10} {'hashed/s':>9} {'429':>6} {'cpu s/s':>8} "
+                          f"{'list p50':>9} {'list p95':>9} {'login p50':>10} {'login p95':>10} {'login 429':>10}")
+        # one "Too Many Requests" warning per rejected attempt otherwise
+        request_logger = logging.getLogger('django.request')
+        level, request_logger.level = request_logger.level, logging.ERROR
+        try:
+            limits = dict(getattr(settings, 'ACCOUNTS_RATELIMITS', {}))
+            if options['site_limit']:
+                burst, seconds = options['site_limit'].split(',')
+                limits['login:site'] = (int(burst), int(seconds))
+            for enabled in (False, True):
+                cache.clear()
+                with override_settings(ACCOUNTS_RATELIMIT_ENABLED=enabled, ACCOUNTS_RATELIMITS=limits):
+                    self.run(enabled, options)
+        finally:
+            request_logger.setLevel(level)
+            User.objects.filter(username__in=['bench-victim', 'bench-member']).delete()
+            cache.clear()
+
+    def run(self, enabled, options):
+        deadline = time.monotonic() + options['seconds']
+        counts = {'attempts': 0, 'limited': 0, 'members_limited': 0}
+        lock = threading.Lock()
+        latency = Histogram()
+        login_latency = Histogram()
+
+        def attacker(n):
+            client = Client(HTTP_HOST=self.host)
+            rng = random.Random(n)
+            attempts = limited = 0
+            while time.monotonic() < deadline:
+                if options['distributed']:
+                    address = f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}'
+                    username = f'user{rng.randrange(10 ** 6)}'
+                else:
+                    address, username = '203.0.113.7', 'bench-victim'
+                response = client.post(reverse('login'), {'username': username, 'password': f'guess{attempts}'},
+                                       REMOTE_ADDR=address)
+                attempts += 1
+                limited += response.status_code == 429
+            with lock:
+                counts['attempts'] += attempts
+                counts['limited'] += limited
+
+        def reader():
+            client = Client(HTTP_HOST=self.host)
+            while time.monotonic() < deadline:
+                start = time.perf_counter_ns()
+                client.get(reverse('book_list'))
+                latency.record((time.perf_counter_ns() - start) // 1000)
+
+        def member():
+            # a user who knows the password, from an address the attack doesn't use
+            client = Client(HTTP_HOST=self.host)
+            data = {'username': 'bench-member', 'password': 'correct horse battery staple'}
+            while time.monotonic() < deadline:
+                start = time.perf_counter_ns()
+                response = client.post(reverse('login'), data, REMOTE_ADDR='198.51.100.20')
+                login_latency.record((time.perf_counter_ns() - start) // 1000)
+                counts['members_limited'] += response.status_code == 429
+                client.logout()
+
+        threads = [threading.Thread(target=attacker, args=(n,)) for n in range(options['threads'])]
+        threads += [threading.Thread(target=reader), threading.Thread(target=member)]
+        wall, cpu = time.perf_counter(), time.process_time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+        summary, logins = latency.summary(), login_latency.summary()
+        hashed = counts['attempts'] - counts['limited']
+        self.stdout.write(
+            f"{'on' if enabled else 'off':<8} {counts['attempts'] / wall:10.0f} {hashed / wall:9.1f} "
+            f"{counts['limited']:6d} {cpu / wall:8.2f} {summary['p50'] / 1000:9.1f} {summary['p95'] / 1000:9.1f} "
+            f"{logins['p50'] / 1000:10.1f} {logins['p95'] / 1000:10.1f} {counts['members_limited']:10d}"
+        )
@@ -0,0 +1,67 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from library.models import Book
+
+DATABASE_AUTH = {'SESSION_ENGINE': 'django.contrib.sessions.backends.db', 'ACCOUNTS_CACHED_AUTH': False}
+# one process, so its cache is shared even when it is locmem
+CACHED_AUTH = {'SESSION_ENGINE': 'accounts.sessions', 'ACCOUNTS_CACHED_AUTH': True}
+
+
+class Command(BaseCommand):
+    help = ('Queries and latency per request of the catalogue (BookListView) for a logged-in user: '
+            'database sessions and user lookup against the cached ones (accounts.sessions/middleware).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300)
+        parser.add_argument('--per-page', type=int, default=24)
+
+    def handle(self, *args, **options):
+        if not Book.objects.exists():
+            raise CommandError('the catalogue is empty, run import_catalogue first')
+        User.objects.filter(username='bench-reader').delete()
+        user = User.objects.create_user('bench-reader')
+        host = next((host for host in settings.ALLOWED_HOSTS if host not in ('*', '')), 'localhost')
+
+        self.stdout.write(f"{'setup':<10} {'queries':>7} {'auth q':>7} {'p50 ms':>8} {'mean ms':>8}")
+        try:
+            for label, overrides in (('database', DATABASE_AUTH), ('cached', CACHED_AUTH)):
+                cache.clear()
+                with override_settings(**overrides):
+                    client = Client(HTTP_HOST=host.lstrip('.'))
+                    client.force_login(user)
+                    self.run(label, client, options)
+        finally:
+            User.objects.filter(username='bench-reader').delete()
+
+    def run(self, label, client, options):
+        url, params = reverse('book_list'), {'per_page': options['per_page']}
+        client.get(url, params)  # warm up
+        # not CaptureQueriesContext: request_started resets connection.queries
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            client.get(url, params)
+        auth_queries = sum('django_session' in sql or 'auth_user' in sql for sql in queries)
+
+        timings = []
+        for _ in range(options['requests']):
+            start = time.perf_counter()
+            response = client.get(url, params)
+            timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200 or not response.wsgi_request.user.is_authenticated:
+                raise CommandError(f'{url} returned {response.status_code} or lost the login')
+        self.stdout.write(f'{label:<10} {len(queries):7d} {auth_queries:7d} {statistics.median(timings):8.2f} '
+                          f'{statistics.fmean(timings):8.2f}')
@@ -0,0 +1,109 @@
+import hashlib
+from functools import partial
+
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+# AuthenticationMiddleware with the user loaded from the cache.
+#
+# Only with ACCOUNTS_CACHED_AUTH, which settings turn on when the default cache is shared by
+# all processes (file based or external). With a per-process cache (locmem) a logout,
+# password change or deactivation in one worker would never reach the users the other
+# workers cached, so they run the stock middleware instead.
+#
+# The entry is keyed by user id and holds the user with a digest of the session auth hash
+# it was loaded for and the user's version, a digest of the password hash and is_active.
+# accounts.signals deletes the entry whenever the user is saved or deleted and stores the
+# new version after the commit; an entry whose session hash or version isn't the current
+# one (e.g. written by a request that read the user before the change committed) falls
+# back to django.contrib.auth.get_user(), which reads the database and verifies the session
+# as usual. Only verified users are cached.
+
+USER_PREFIX = 'accounts:user:'
+VERSION_PREFIX = 'accounts:user-version:'
+
+
+def user_key(user_id):
+    return f'{USER_PREFIX}{user_id}'
+
+
+def version_key(user_id):
+    return f'{VERSION_PREFIX}{user_id}'
+
+
+def _digest(value):
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def user_version(user):
+    return _digest(f'{user.password}:{user.is_active}')[:16]
+
+
+def cache_timeout():
+    return getattr(settings, 'ACCOUNTS_USER_CACHE_TIMEOUT', 300)
+
+
+def _session_user(session):
+    # -> (user id, session hash), or None if the session can't have a cached user
+    user_id = session.get(auth.SESSION_KEY)
+    session_hash = session.get(auth.HASH_SESSION_KEY)
+    backend = session.get(auth.BACKEND_SESSION_KEY)
+    if user_id is None or not session_hash or backend not in settings.AUTHENTICATION_BACKENDS:
+        return None
+    return user_id, session_hash
+
+
+def _cached(values, user_id, session_hash):
+    entry, version = values.get(user_key(user_id)), values.get(version_key(user_id))
+    if (entry is not None and version is not None and constant_time_compare(entry[0], _digest(session_hash))
+            and constant_time_compare(entry[1], version)):
+        return entry[2]
+    return None
+
+
+def get_user(request):
+    if not hasattr(request, '_cached_user'):
+        found = _session_user(request.session)
+        user = None
+        if found:
+            user = _cached(cache.get_many([user_key(found[0]), version_key(found[0])]), *found)
+        if user is None:
+            user = auth.get_user(request)
+            if found and user.is_authenticated:
+                # add: a version the signal stored after a change is never overwritten
+                version = user_version(user)
+                cache.add(version_key(user.pk), version, cache_timeout())
+                cache.set(user_key(user.pk), (_digest(found[1]), version, user), cache_timeout())
+        request._cached_user = user
+    return request._cached_user
+
+
+async def auser(request):
+    if not hasattr(request, '_acached_user'):
+        # loads the session, the reads of _session_user() then stay off the database
+        await request.session.aget(auth.SESSION_KEY)
+        found = _session_user(request.session)
+        user = None
+        if found:
+            user = _cached(await cache.aget_many([user_key(found[0]), version_key(found[0])]), *found)
+        if user is None:
+            user = await auth.aget_user(request)
+            if found and user.is_authenticated:
+                version = user_version(user)
+                await cache.aadd(version_key(user.pk), version, cache_timeout())
+                await cache.aset(user_key(user.pk), (_digest(found[1]), version, user), cache_timeout())
+        request._acached_user = user
+    return request._acached_user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    def process_request(self, request):
+        super().process_request(request)
+        if not getattr(settings, 'ACCOUNTS_CACHED_AUTH', False):
+            return
+        request.user = SimpleLazyObject(lambda: get_user(request))
+        request.auser = partial(auser, request)
@@ -0,0 +1,158 @@
+import hashlib
+import ipaddress
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Token buckets for the login and registration views, kept in the cache.
+#
+# Every password check costs a full PBKDF2 run, so the views ask guard() before they hash
+# anything and a request over the limit is answered 429 without touching the hasher.
+# A bucket holds up to `burst` tokens and refills `burst` tokens per `seconds`:
+#
+#   login:ip        every login attempt of a client address (IPv6 per /64)
+#   login:username  failed logins of one username, reset by a successful login
+#   register:ip     the same for the registration form
+#
+# When an ip/username bucket runs dry the key is also locked out for ACCOUNTS_LOCKOUT[0]
+# seconds, doubled for every further lockout within a day, up to ACCOUNTS_LOCKOUT[1].
+#
+# Opt-in, off by default: login:site / register:site, one bucket for all attempts, caps
+# the hashing CPU when an attack is spread over many addresses. It only throttles, and
+# never a login for a username without recent failures - otherwise a few attacking
+# addresses would keep it empty and lock every user out.
+#
+# Bucket updates are read-modify-write on the cache: concurrent requests can overshoot a
+# limit by a few attempts, which doesn't matter for throttling.
+
+PREFIX = 'accounts:rl:'
+STRIKE_MEMORY = 24 * 60 * 60
+
+DEFAULT_LIMITS = {
+    'login:ip': (20, 300),
+    'login:username': (5, 900),
+    'register:ip': (5, 3600),
+}
+DEFAULT_LOCKOUT = (60, 3600)
+
+
+class RateLimited(Exception):
+    def __init__(self, scope, retry_after):
+        super().__init__(f'{scope} rate limit, retry after {retry_after}s')
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+def _enabled():
+    return getattr(settings, 'ACCOUNTS_RATELIMIT_ENABLED', True)
+
+
+def _limit(scope):
+    return {**DEFAULT_LIMITS, **getattr(settings, 'ACCOUNTS_RATELIMITS', {})}.get(scope)
+
+
+def client_ip(request):
+    # REMOTE_ADDR as set by the WSGI/ASGI server; behind a proxy it has to put the client there
+    address = request.META.get('REMOTE_ADDR', '')
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return address
+    if ip.version == 6:
+        return str(ipaddress.ip_network(f'{ip}/64', strict=False))
+    return str(ip)
+
+
+def _key(kind, scope, ident):
+    digest = hashlib.md5(ident.encode(), usedforsecurity=False).hexdigest()
+    return f'{PREFIX}{kind}:{scope}:{digest}'
+
+
+class TokenBucket:
+    def __init__(self, scope, ident):
+        self.scope = scope
+        self.ident = ident
+        self.burst, self.seconds = _limit(scope)
+        self.rate = self.burst / self.seconds
+        self.key = _key('bucket', scope, ident)
+        self.lockable = not scope.endswith(':site')
+
+    def _tokens(self, now):
+        state = cache.get(self.key)
+        if state is None:
+            return float(self.burst)
+        tokens, updated = state
+        return min(float(self.burst), tokens + (now - updated) * self.rate)
+
+    def retry_after(self, now=None):
+        # seconds until an attempt is allowed, 0 if it is now
+        now = now or time.time()
+        if self.lockable:
+            locked_until = cache.get(_key('lock', self.scope, self.ident))
+            if locked_until and locked_until > now:
+                return math.ceil(locked_until - now)
+        tokens = self._tokens(now)
+        return 0 if tokens >= 1 else math.ceil((1 - tokens) / self.rate)
+
+    def take(self, now=None):
+        now = now or time.time()
+        tokens = self._tokens(now) - 1
+        cache.set(self.key, (max(tokens, 0.0), now), self.seconds)
+        if tokens < 1 and self.lockable:
+            self._lock_out(now)
+
+    def _lock_out(self, now):
+        strikes_key = _key('strikes', self.scope, self.ident)
+        strikes = cache.get(strikes_key, 0)
+        base, longest = getattr(settings, 'ACCOUNTS_LOCKOUT', DEFAULT_LOCKOUT)
+        duration = min(base * 2 ** strikes, longest)
+        cache.set(_key('lock', self.scope, self.ident), now + duration, duration)
+        cache.set(strikes_key, strikes + 1, STRIKE_MEMORY)
+
+    def touched(self):
+        # whether anything was taken from the bucket lately (it expires once full again)
+        return cache.get(self.key) is not None
+
+    def reset(self):
+        cache.delete_many([self.key, _key('lock', self.scope, self.ident), _key('strikes', self.scope, self.ident)])
+
+
+def _buckets(request, action, username=None):
+    buckets = [TokenBucket(f'{action}:ip', client_ip(request))]
+    if _limit(f'{action}:site'):
+        buckets.insert(0, TokenBucket(f'{action}:site', ''))
+    if username and _limit(f'{action}:username'):
+        buckets.append(TokenBucket(f'{action}:username', username.lower()))
+    return buckets
+
+
+def guard(request, action, username=None):
+    # call before hashing; raises RateLimited, otherwise counts the attempt
+    if not _enabled():
+        return
+    now = time.time()
+    buckets = _buckets(request, action, username)
+    # the site bucket counts every attempt but never holds up a username without failures
+    spared = any(b.scope.endswith(':username') and not b.touched() for b in buckets)
+    for bucket in buckets:
+        if spared and bucket.scope.endswith(':site'):
+            continue
+        retry_after = bucket.retry_after(now)
+        if retry_after:
+            raise RateLimited(bucket.scope, retry_after)
+    for bucket in buckets:
+        # the username bucket only counts failures, see failed()
+        if not bucket.scope.endswith(':username'):
+            bucket.take(now)
+
+
+def failed(request, action, username):
+    if _enabled() and username and _limit(f'{action}:username'):
+        TokenBucket(f'{action}:username', username.lower()).take()
+
+
+def succeeded(request, action, username):
+    if _enabled() and username and _limit(f'{action}:username'):
+        TokenBucket(f'{action}:username', username.lower()).reset()
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db
+
+# SESSION_ENGINE: sessions read from the cache and written through to the database
+# (cached_db), plus no write at all when a request marked the session modified but left
+# its data as it was loaded - e.g. re-setting the same value on every request.
+
+
+class SessionStore(cached_db.SessionStore):
+    _loaded_state = None
+
+    def _snapshot(self, data):
+        return self.serializer().dumps(data)
+
+    def load(self):
+        data = super().load()
+        self._loaded_state = self._snapshot(data)
+        return data
+
+    async def aload(self):
+        data = await super().aload()
+        self._loaded_state = self._snapshot(data)
+        return data
+
+    def _unchanged(self, must_create):
+        # SESSION_SAVE_EVERY_REQUEST saves to extend the expiry, that has to happen
+        return (not must_create and not settings.SESSION_SAVE_EVERY_REQUEST and self.session_key is not None
+                and self._loaded_state is not None
+                and self._snapshot(self._get_session(no_load=True)) == self._loaded_state)
+
+    def save(self, must_create=False):
+        if self._unchanged(must_create):
+            return
+        super().save(must_create)
+        self._loaded_state = self._snapshot(self._get_session(no_load=True))
+
+    async def asave(self, must_create=False):
+        if self._unchanged(must_create):
+            return
+        await super().asave(must_create)
+        self._loaded_state = self._snapshot(self._get_session(no_load=True))
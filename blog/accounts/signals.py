@@ -0,0 +1,28 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .middleware import cache_timeout, user_key, user_version, version_key
+
+
+# the cached request user (accounts.middleware), dropped after the change commits; the new
+# version also turns away entries written meanwhile from a read of the old row
+
+@receiver(post_save, sender=get_user_model())
+def forget_cached_user(sender, instance, **kwargs):
+    key, version = user_key(instance.pk), user_version(instance)
+    cache.delete(key)
+
+    def forget():
+        cache.delete(key)
+        cache.set(version_key(instance.pk), version, cache_timeout())
+    transaction.on_commit(forget)
+
+
+@receiver(post_delete, sender=get_user_model())
+def forget_deleted_user(sender, instance, **kwargs):
+    keys = [user_key(instance.pk), version_key(instance.pk)]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
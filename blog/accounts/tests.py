@@ -1,3 +1,196 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from library import maintenance
+
+from . import middleware, ratelimit
+from .sessions import SessionStore
+
+
+# the limiter doesn't care which hasher runs behind it, MD5 keeps the tests fast
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+                   ACCOUNTS_RATELIMIT_ENABLED=True, ACCOUNTS_LOCKOUT=(60, 600), ACCOUNTS_RATELIMITS={
+    'login:ip': (5, 300), 'login:username': (3, 900), 'register:ip': (2, 3600),
+})
+class LoginRateLimitTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('nino', password='sakartvelo-1991')
+
+    def setUp(self):
+        cache.clear()
+        maintenance.invalidate()
+
+    def login(self, password, username='nino', ip='198.51.100.1'):
+        return self.client.post(reverse('login'), {'username': username, 'password': password}, REMOTE_ADDR=ip)
+
+    def test_failed_login_renders_the_form(self):
+        response = self.login('wrong')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Invalid username or password.')
+        self.assertRedirects(self.login('sakartvelo-1991'), reverse('book_list'), fetch_redirect_response=False)
+
+    def test_username_is_locked_out_before_hashing(self):
+        for _ in range(3):
+            self.assertEqual(self.login('wrong', ip='198.51.100.2').status_code, 200)
+        with mock.patch('accounts.views.authenticate', wraps=authenticate) as hashing:
+            response = self.login('sakartvelo-1991', ip='198.51.100.3')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        hashing.assert_not_called()
+
+        # once the bucket has refilled a token, the next lockout is twice as long
+        with mock.patch('time.time', return_value=ratelimit.time.time() + 301):
+            self.assertEqual(self.login('wrong', ip='198.51.100.4').status_code, 200)
+            self.assertEqual(self.login('wrong', ip='198.51.100.4').status_code, 429)
+            self.assertEqual(self.login('wrong', ip='198.51.100.4')['Retry-After'], '120')
+
+    def test_ip_bucket_counts_every_username(self):
+        for i in range(5):
+            self.assertEqual(self.login('wrong', username=f'user{i}').status_code, 200)
+        self.assertEqual(self.login('sakartvelo-1991').status_code, 429)
+        # another address, and IPv6 clients per /64
+        self.assertEqual(self.login('wrong', ip='2001:db8::1').status_code, 200)
+        self.assertEqual(ratelimit.client_ip(mock.Mock(META={'REMOTE_ADDR': '2001:db8::ffff'})), '2001:db8::/64')
+
+    def test_success_resets_the_username_bucket(self):
+        self.login('wrong')
+        self.login('wrong')
+        self.login('sakartvelo-1991')
+        self.client.logout()
+        for _ in range(2):
+            self.assertEqual(self.login('wrong').status_code, 200)
+
+    def test_register_is_throttled_per_address(self):
+        data = {'username': 'giorgi', 'email': 'g@example.com', 'password1': 'x', 'password2': 'y'}
+        for _ in range(2):
+            self.assertEqual(self.client.post(reverse('register'), data).status_code, 200)
+        self.assertEqual(self.client.post(reverse('register'), data).status_code, 429)
+
+    def test_spread_attack_does_not_lock_out_other_users(self):
+        # every address stays within its own allowance
+        for i in range(30):
+            self.login('wrong', username=f'user{i}', ip=f'203.0.113.{i}')
+        self.assertRedirects(self.login('sakartvelo-1991'), reverse('book_list'), fetch_redirect_response=False)
+
+    @override_settings(ACCOUNTS_RATELIMITS={'login:ip': (5, 300), 'login:username': (3, 900),
+                                            'login:site': (3, 60)})
+    def test_site_bucket_spares_usernames_without_failures(self):
+        for i in range(3):
+            self.assertEqual(self.login('wrong', username=f'user{i}', ip=f'203.0.113.{i}').status_code, 200)
+        # the site bucket is empty: usernames with failures wait, the others get through
+        self.assertEqual(self.login('wrong', username='user0', ip='203.0.113.9').status_code, 429)
+        self.assertRedirects(self.login('sakartvelo-1991'), reverse('book_list'), fetch_redirect_response=False)
+
+    @override_settings(ACCOUNTS_RATELIMIT_ENABLED=False)
+    def test_can_be_switched_off(self):
+        for _ in range(8):
+            self.assertEqual(self.login('wrong').status_code, 200)
+
+
+# what settings pick for a cache every process shares; the tests' locmem is one process
+@override_settings(ACCOUNTS_CACHED_AUTH=True, SESSION_ENGINE='accounts.sessions')
+class CachedSessionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('levan', password='pw')
+
+    def setUp(self):
+        cache.clear()
+        maintenance.invalidate()
+        maintenance.active_prefixes()
+        self.client.force_login(self.user)
+
+    def test_logged_in_request_needs_no_session_or_user_query(self):
+        self.client.get(reverse('profile'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('profile'))
+        self.assertEqual(response.context['user'], self.user)
+
+    def test_user_changes_invalidate_the_cached_user(self):
+        self.client.get(reverse('profile'))
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.user.pk).update(first_name='Levan')
+            self.user.first_name = 'Levan'
+            self.user.save(update_fields=['first_name'])
+        self.assertEqual(self.client.get(reverse('profile')).context['user'].first_name, 'Levan')
+
+        # a new password ends the sessions made with the old one, cached or not
+        self.user.set_password('new')
+        self.user.save()
+        response = self.client.get(reverse('profile'))
+        self.assertFalse(response.context['user'].is_authenticated)
+
+    def test_stale_entry_of_another_password_is_not_used(self):
+        self.client.get(reverse('profile'))
+        # the user as another process cached it before a password change
+        stale = User.objects.get(pk=self.user.pk)
+        stale.is_superuser = True
+        key = middleware.user_key(self.user.pk)
+        cache.set(key, ('not-the-session-hash', middleware.user_version(stale), stale))
+        self.assertFalse(self.client.get(reverse('profile')).context['user'].is_superuser)
+
+    def test_entry_written_before_a_deactivation_is_not_used(self):
+        self.client.get(reverse('profile'))
+        entry = cache.get(middleware.user_key(self.user.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        # a request that read the row before the commit caches it afterwards
+        cache.set(middleware.user_key(self.user.pk), entry)
+        self.assertFalse(self.client.get(reverse('profile')).context['user'].is_authenticated)
+
+    def test_unchanged_session_is_not_written(self):
+        session = self.client.session
+        store = SessionStore(session.session_key)
+        store.load()
+        store['_auth_user_id'] = store['_auth_user_id']
+        with self.assertNumQueries(0):
+            store.save()
+        store['seen'] = True
+        with self.assertNumQueries(3):  # savepoint, UPDATE, release
+            store.save()
+        self.assertTrue(SessionStore(session.session_key).load()['seen'])
+
+
+class PerProcessCacheTests(TestCase):
+    # two workers with a locmem cache each, the default CACHES
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('tamar', password='pw')
+
+    def worker(self, name):
+        return override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                                     'LOCATION': f'worker-{name}'}})
+
+    def profile_user(self):
+        return self.client.get(reverse('profile')).context['user']
+
+    def test_logout_and_password_change_reach_the_other_worker(self):
+        self.assertFalse(settings.ACCOUNTS_CACHED_AUTH)
+        self.client.login(username='tamar', password='pw')
+        session_key = self.client.session.session_key
+        for name in 'ab':
+            with self.worker(name):
+                self.assertTrue(self.profile_user().is_authenticated)
+        with self.worker('a'):
+            self.client.post(reverse('logout'))
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+        with self.worker('b'):
+            self.assertFalse(self.profile_user().is_authenticated)
+
+        self.client.login(username='tamar', password='pw')
+        with self.worker('b'):
+            self.assertTrue(self.profile_user().is_authenticated)
+        with self.worker('a'), self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('new')
+            self.user.save()
+        with self.worker('b'):
+            self.assertFalse(self.profile_user().is_authenticated)
@@ -1,14 +1,27 @@
 from django.contrib.auth import login, logout, authenticate
 from django.shortcuts import render, redirect
 
+from accounts import ratelimit
 from accounts.forms import LoginForm, RegistrationForm
 
 
+def too_many_attempts(request, template_name, form, exc):
+    form.add_error(None, f'Too many attempts, try again in {exc.retry_after} seconds.')
+    response = render(request, template_name, {'form': form}, status=429)
+    response['Retry-After'] = exc.retry_after
+    return response
+
+
 def register_view(request):
     if request.user.is_authenticated:
         return redirect('book_list')
     if request.method == 'POST':
         form = RegistrationForm(request.POST)
+        # before is_valid(): the password validators and save() hash the password
+        try:
+            ratelimit.guard(request, 'register')
+        except ratelimit.RateLimited as exc:
+            return too_many_attempts(request, 'register.html', form, exc)
         if form.is_valid():
             user = form.save()
             login(request, user)
@@ -27,13 +40,21 @@ def login_view(request):
             username = form.cleaned_data.get('username')
             password = form.cleaned_data.get('password')
 
+            # throttled before authenticate() runs the password hasher
+            try:
+                ratelimit.guard(request, 'login', username)
+            except ratelimit.RateLimited as exc:
+                return too_many_attempts(request, 'login.html', form, exc)
             user = authenticate(request, username=username, password=password)
             if user is not None:
+                ratelimit.succeeded(request, 'login', username)
                 login(request, user)
                 return redirect('book_list')
+            ratelimit.failed(request, 'login', username)
+            form.add_error(None, 'Invalid username or password.')
     else:
         form = LoginForm()
-        return render(request, 'login.html', {'form': form})
+    return render(request, 'login.html', {'form': form})
 
 
 def logout_view(request):
@@ -43,4 +64,4 @@ def logout_view(request):
 
 
 def profile_view(request):
-    return render(request, 'profile.html')
\ No newline at end of file
+    return render(request, 'profile.html')
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'blog.settings')
+# route the read views to their native async versions (library.views.abook_list & co.)
+os.environ.setdefault('LIBRARY_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -10,21 +10,53 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-# Quick-start development settings - unsuitable for production
-# See https://docs.djangoproject.com/en/6.0/howto/deployment/checklist/
+
+# Everything deployment specific comes from the environment. DJANGO_PROFILE=production
+# switches the defaults to the production ones (DEBUG off, tuned/persistent database
+# connections, secure cookies); each value can still be overridden by its own variable.
+
+def env(name, default=None):
+    return os.environ.get(name, default)
+
+
+def env_bool(name, default):
+    value = os.environ.get(name)
+    return default if value is None else value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    return default if value in (None, '') else int(value)
+
+
+def env_list(name, default=()):
+    value = os.environ.get(name)
+    return list(default) if value is None else [item.strip() for item in value.split(',') if item.strip()]
+
+
+PROFILE = env('DJANGO_PROFILE', 'development')
+PRODUCTION = PROFILE == 'production'
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-s%2q43rjd7tuoxh@-j!z@tt+hesp)rc2a$+nb4gy067^3((+mr'
+SECRET_KEY = env('DJANGO_SECRET_KEY')
+if not SECRET_KEY:
+    if PRODUCTION:
+        raise ImproperlyConfigured('DJANGO_SECRET_KEY must be set in the production profile')
+    SECRET_KEY = 'django-insecure-s%2q43rjd7tuoxh@-j!z@tt+hesp)rc2a$+nb4gy067^3((+mr'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# (with DEBUG on, every SQL query is also kept in memory)
+DEBUG = env_bool('DJANGO_DEBUG', not PRODUCTION)
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = env_list('DJANGO_ALLOWED_HOSTS')
 
 # Application definition
 
@@ -41,17 +73,19 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so the timing covers the whole middleware stack
+    'library.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # AuthenticationMiddleware, with the request user from the cache if ACCOUNTS_CACHED_AUTH
+    'accounts.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 
-    # # chveni damatebuli middleware
-    # "library.middleware.RequestLoggingMiddleware",
-    # "library.middleware.MaintenanceModeMiddleware"
+    # chveni damatebuli middleware
+    "library.middleware.MaintenanceModeMiddleware",
 ]
 
 ROOT_URLCONF = 'blog.urls'
@@ -76,12 +110,81 @@ WSGI_APPLICATION = 'blog.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
+# DJANGO_DB_ENGINE=sqlite (default) or postgres.
+#
+# SQLite, production profile: WAL so readers never block the writer, synchronous=NORMAL
+# (durable in WAL mode except for the last commits on power loss), a busy timeout instead of
+# "database is locked", BEGIN IMMEDIATE so writers queue up front rather than failing on
+# lock upgrade, a memory-mapped file and connections kept open between requests.
+#
+# PostgreSQL uses Django's built-in connection pool (psycopg[pool]), which replaces
+# CONN_MAX_AGE.
+
+DB_ENGINE = env('DJANGO_DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': env('DJANGO_DB_NAME', BASE_DIR / 'db.sqlite3'),
+            # file based test database (ignored by git): threaded tests need real SQLite locking,
+            # the shared-cache in-memory default fails with "table is locked" instead of waiting
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
+    }
+    if env_bool('DJANGO_SQLITE_TUNED', PRODUCTION):
+        DATABASES['default'].update({
+            'CONN_MAX_AGE': env_int('DJANGO_CONN_MAX_AGE', 600),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'timeout': env_int('DJANGO_SQLITE_BUSY_TIMEOUT', 20),
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    f"PRAGMA mmap_size={env_int('DJANGO_SQLITE_MMAP_SIZE', 256 * 1024 * 1024)};"
+                    'PRAGMA cache_size=-20000;'
+                    'PRAGMA temp_store=MEMORY;'
+                ),
+            },
+        })
+elif DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': env('DJANGO_DB_NAME', 'library'),
+            'USER': env('DJANGO_DB_USER', ''),
+            'PASSWORD': env('DJANGO_DB_PASSWORD', ''),
+            'HOST': env('DJANGO_DB_HOST', ''),
+            'PORT': env('DJANGO_DB_PORT', ''),
+            'CONN_MAX_AGE': 0,  # the pool keeps the connections
+            'OPTIONS': {
+                'pool': {
+                    'min_size': env_int('DJANGO_DB_POOL_MIN', 2),
+                    'max_size': env_int('DJANGO_DB_POOL_MAX', 10),
+                    'timeout': env_int('DJANGO_DB_POOL_TIMEOUT', 10),
+                },
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f'unknown DJANGO_DB_ENGINE {DB_ENGINE!r}, expected sqlite or postgres')
+
+# Cache: local memory by default; set DJANGO_CACHE_DIR to share it between processes through files
+# (see library.caching for the catalogue fragment/page caches)
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'library',
+        'OPTIONS': {'MAX_ENTRIES': 50000},
     }
 }
+if env('DJANGO_CACHE_DIR'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': env('DJANGO_CACHE_DIR'),
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    }
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -120,13 +223,75 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
 
+STATIC_ROOT = env('DJANGO_STATIC_ROOT')
+
 MEDIA_URL = 'media/'
-MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_ROOT = env('DJANGO_MEDIA_ROOT', BASE_DIR / 'media')
+
+STORAGES = {
+    # media URLs carry a content hash, see library.assets
+    'default': {'BACKEND': 'library.assets.HashedFileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
 
 LOGIN_REDIRECT_URL = '/library'
 LOGOUT_REDIRECT_URL = '/library'
 
 LOGIN_URL = 'login'
 
-
-MAINTENANCE_MODE = False
\ No newline at end of file
+# Sessions and the request user from the cache (accounts.sessions, accounts.middleware) only when
+# every process shares it: with per-process caches a logout or password change in one worker
+# wouldn't reach the others. Otherwise database sessions and the stock user lookup.
+ACCOUNTS_CACHED_AUTH = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache',
+)
+SESSION_ENGINE = 'accounts.sessions' if ACCOUNTS_CACHED_AUTH else 'django.contrib.sessions.backends.db'
+SESSION_SAVE_EVERY_REQUEST = False
+ACCOUNTS_USER_CACHE_TIMEOUT = 300
+
+SESSION_COOKIE_SECURE = env_bool('DJANGO_SECURE_COOKIES', PRODUCTION)
+CSRF_COOKIE_SECURE = SESSION_COOKIE_SECURE
+
+
+# True closes the whole site; per-prefix switches are toggled at runtime (library.maintenance)
+MAINTENANCE_MODE = False
+LIBRARY_MAINTENANCE_MEMO_TTL = 2
+LIBRARY_MAINTENANCE_CACHE_TIMEOUT = 5
+
+# native async read views instead of the sync ones; blog/asgi.py switches it on
+LIBRARY_ASYNC_VIEWS = env_bool('LIBRARY_ASYNC_VIEWS', False)
+
+# library.events: domain events are handled by background workers after commit
+LIBRARY_EVENTS_SYNC = False
+LIBRARY_EVENTS_QUEUE_SIZE = 1000
+LIBRARY_EVENTS_WORKERS = 2
+
+# library.reports: a loan not returned within this many days is overdue
+LIBRARY_LOAN_DAYS = 14
+
+# accounts.ratelimit: token buckets in front of the password hasher, (burst, seconds to refill it).
+# 'login:site' / 'register:site' add an opt-in site-wide bucket, see accounts.ratelimit
+ACCOUNTS_RATELIMIT_ENABLED = env_bool('ACCOUNTS_RATELIMIT_ENABLED', True)
+ACCOUNTS_RATELIMITS = {
+    'login:ip': (20, 300),
+    'login:username': (5, 900),
+    'register:ip': (5, 3600),
+}
+ACCOUNTS_LOCKOUT = (60, 3600)  # first lockout, doubled per repeat up to the second value
+
+# library.metrics: per-process request histograms, dumped here for request_stats
+LIBRARY_METRICS_DIR = None  # defaults to <tmp>/library-metrics
+LIBRARY_METRICS_FLUSH_INTERVAL = 10
+LIBRARY_METRICS_MAX_AGE = 3600  # older dumps are left out of the merged numbers
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # DJANGO_LIBRARY_LOG_LEVEL=INFO shows the event handlers' messages
+        'library': {'handlers': ['console'], 'level': env('DJANGO_LIBRARY_LOG_LEVEL', 'WARNING')},
+    },
+}
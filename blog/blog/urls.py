@@ -15,20 +15,25 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.conf.urls.static import static
 from django.urls import path, include
 
 from django.contrib.auth import views as auth_views
 
 from blog import settings
 from djangoapp import views
+from library import views as library_views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('library.urls')),
+    path('', include('djangoapp.urls')),
     path('account/', include('accounts.urls')),
     path('password-change/', auth_views.PasswordChangeView.as_view(), name='password_change')
 
 ]
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# content-hashed covers and CSS with far-future caching (library.assets), in production too
+urlpatterns += [
+    path(f'{settings.MEDIA_URL.strip("/")}/<path:path>', library_views.serve_media, name='media'),
+    path('assets/<path:path>', library_views.serve_static, name='hashed_static'),
+]
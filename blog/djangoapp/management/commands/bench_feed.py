@@ -0,0 +1,107 @@
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from djangoapp import search
+from djangoapp.models import Post, summarize
+from djangoapp.views import FEED_ORDERING, FEED_PAGE_SIZE, feed_queryset
+from library.pagination import encode_cursor, paginate_keyset
+
+SYLLABLES = ('ga', 'mar', 'jo', 'ba', 'sa', 'qar', 'tve', 'lo', 'tbi', 'li', 'si', 'mte', 'zghva', 'wig',
+             'ni', 'sko', 'la', 'da', 've', 'ri', 'khe', 'mo', 'tsa', 'ne')
+
+
+def vocabulary(rng, size=20_000):
+    # synthetic words with Zipf frequencies, so searches hit common and rare terms alike
+    words = sorted({''.join(rng.choices(SYLLABLES, k=rng.randint(1, 4))) for _ in range(size * 2)})[:size]
+    rng.shuffle(words)
+    return words, [1 / rank for rank in range(1, len(words) + 1)]
+
+
+def seed_posts(count, words, stdout=None):
+    # bulk_create sends no signals, so the search index is rebuilt afterwards
+    missing = count - Post.objects.count()
+    if missing <= 0:
+        return
+    if stdout:
+        stdout.write(f'seeding {missing} posts...')
+    rng = random.Random(count)
+    vocab, weights = vocabulary(rng)
+    batch = []
+    for i in range(missing):
+        content = ' '.join(rng.choices(vocab, weights, k=rng.randint(words // 2, words * 3 // 2)))
+        excerpt, word_count = summarize(content)
+        title = ' '.join(rng.choices(vocab, weights, k=4)).capitalize()
+        batch.append(Post(title=title, content=content, excerpt=excerpt, word_count=word_count))
+        if len(batch) == 2000:
+            Post.objects.bulk_create(batch)
+            batch = []
+    Post.objects.bulk_create(batch)
+    search.rebuild_index()
+
+
+class Command(BaseCommand):
+    help = ('Queries, time and peak Python memory of the post feed against loading every post, '
+            'on the configured database (seeded up to --posts posts).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=100_000)
+        parser.add_argument('--words', type=int, default=300, help='words per seeded post')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--depth', type=int, default=1000, help='page number of the deep page')
+
+    def handle(self, *args, **options):
+        seed_posts(options['posts'], options['words'], self.stdout)
+        total = Post.objects.count()
+        depth = min(options['depth'], max(total // FEED_PAGE_SIZE - 1, 0))
+        # the cursor the "load more" link of page `depth` carries
+        last = (Post.objects.order_by(*FEED_ORDERING)
+                .values_list('create_date', 'id')[depth * FEED_PAGE_SIZE:depth * FEED_PAGE_SIZE + 1].first())
+        cursor = encode_cursor(list(last)) if last else None
+        host = next((host for host in settings.ALLOWED_HOSTS if host not in ('*', '')), 'localhost')
+        client = Client(HTTP_HOST=host.lstrip('.'))
+
+        cases = [
+            ('all posts, full rows (before)', lambda: len(list(Post.objects.all()))),
+            ('feed, first page', lambda: len(paginate_keyset(feed_queryset(), FEED_ORDERING, None, FEED_PAGE_SIZE))),
+            (f'feed, page {depth + 1}',
+             lambda: len(paginate_keyset(feed_queryset(), FEED_ORDERING, cursor, FEED_PAGE_SIZE))),
+            ('GET /posts/', lambda: self.get(client, {})),
+            (f'GET /posts/ page {depth + 1}', lambda: self.get(client, {'cursor': cursor})),
+        ]
+        self.stdout.write(f'{total} posts')
+        self.stdout.write(f"{'case':<32} {'queries':>7} {'ms':>9} {'peak KiB':>10}")
+        for label, run in cases:
+            queries, ms, peak = self.measure(run, options['repeat'])
+            self.stdout.write(f'{label:<32} {queries:7d} {ms:9.2f} {peak / 1024:10.0f}')
+
+    def get(self, client, params):
+        response = client.get(reverse('all_post'), params)
+        if response.status_code != 200:
+            raise CommandError(f'/posts/ returned {response.status_code}')
+        return len(response.content)
+
+    def measure(self, run, repeat):
+        run()  # warm up
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - start) * 1000)
+
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return len(queries), statistics.median(timings), peak
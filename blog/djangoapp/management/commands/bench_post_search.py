@@ -0,0 +1,80 @@
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from djangoapp import search
+from djangoapp.models import Post
+from djangoapp.views import FEED_PAGE_SIZE, feed_queryset
+
+from .bench_feed import seed_posts
+
+
+class Command(BaseCommand):
+    help = ('Latency of the post search (first result page with snippets) for common, rare, '
+            'prefix and multi-word queries, on the configured database seeded up to --posts posts.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=100_000)
+        parser.add_argument('--words', type=int, default=300, help='words per seeded post')
+        parser.add_argument('--queries', type=int, default=50, help='queries per kind')
+        parser.add_argument('--http', action='store_true', help='through the full request stack')
+
+    def handle(self, *args, **options):
+        seed_posts(options['posts'], options['words'], self.stdout)
+        rng = random.Random(0)
+        # words of the titles, by how often they occur in them
+        sample = list(Post.objects.order_by('?').values_list('title', flat=True)[:2000])
+        if not sample:
+            raise CommandError('no posts')
+        counts = {}
+        for title in sample:
+            for word in title.lower().split():
+                counts[word] = counts.get(word, 0) + 1
+        by_frequency = sorted(counts, key=counts.get, reverse=True)
+        common, rare = by_frequency[:20], by_frequency[-200:]
+
+        kinds = {
+            'common word': lambda: rng.choice(common),
+            'rare word': lambda: rng.choice(rare),
+            'prefix': lambda: rng.choice(rare)[:3],
+            'two words': lambda: f'{rng.choice(common)} {rng.choice(rare)}',
+        }
+        host = next((host for host in settings.ALLOWED_HOSTS if host not in ('*', '')), 'localhost')
+        client = Client(HTTP_HOST=host.lstrip('.'))
+
+        self.stdout.write(f'{Post.objects.count()} posts, {options["queries"]} queries per kind')
+        self.stdout.write(f"{'query':<12} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'hits':>6}")
+        for kind, make in kinds.items():
+            timings, hits = [], 0
+            for _ in range(options['queries']):
+                q = make()
+                start = time.perf_counter()
+                if options['http']:
+                    response = client.get(reverse('search_posts'), {'q': q})
+                    if response.status_code != 200:
+                        raise CommandError(f'search returned {response.status_code}')
+                    found = len(response.context['posts'])
+                else:
+                    page = search.search_posts(feed_queryset(), q, None, FEED_PAGE_SIZE)
+                    found = len(search.add_snippets(page.object_list, q))
+                timings.append((time.perf_counter() - start) * 1000)
+                hits += bool(found)
+            self.report(kind, timings, hits)
+
+        # for reference: content__icontains of a word that is in no post reads every post
+        timings = []
+        for _ in range(min(options['queries'], 5)):
+            start = time.perf_counter()
+            search.FallbackBackend().ranked(None, ['xyzzy'], None, FEED_PAGE_SIZE + 1)
+            timings.append((time.perf_counter() - start) * 1000)
+        self.report('icontains', timings, 0)
+
+    def report(self, kind, timings, hits):
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(f'{kind:<12} {statistics.median(timings):8.2f} {p95:8.2f} {timings[-1]:8.2f} {hits:6d}')
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from djangoapp import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the post full-text search index from scratch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def progress(done, total):
+            self.stdout.write(f'  indexed up to id {done}/{total}')
+
+        count = search.rebuild_index(batch_size=options['batch_size'], progress=progress)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} posts in {elapsed:.2f}s'))
@@ -0,0 +1,53 @@
+# Generated by Django 6.0.1 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+# a copy of djangoapp.models.summarize as of this migration, so later changes to it
+# don't change what the backfill does
+EXCERPT_LENGTH = 280
+
+
+def summarize(content):
+    words = content.split()
+    excerpt = ' '.join(words)
+    if len(excerpt) > EXCERPT_LENGTH:
+        cut = excerpt[:EXCERPT_LENGTH + 1].rsplit(' ', 1)[0][:EXCERPT_LENGTH]
+        excerpt = (cut.rstrip('.,;:!?-') or cut) + '…'
+    return excerpt, len(words)
+
+
+def backfill_excerpts(apps, schema_editor):
+    Post = apps.get_model('djangoapp', 'Post')
+    batch = []
+    for post in Post.objects.only('id', 'content').iterator(chunk_size=1000):
+        post.excerpt, post.word_count = summarize(post.content)
+        batch.append(post)
+        if len(batch) == 1000:
+            Post.objects.bulk_update(batch, ['excerpt', 'word_count'])
+            batch = []
+    Post.objects.bulk_update(batch, ['excerpt', 'word_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangoapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=281),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['create_date', 'id'], name='djangoapp_post_feed_idx'),
+        ),
+        migrations.RunPython(backfill_excerpts, migrations.RunPython.noop),
+    ]
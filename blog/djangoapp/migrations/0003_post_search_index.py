@@ -0,0 +1,51 @@
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE djangoapp_post_fts USING fts5("
+    "title, content, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    "INSERT INTO djangoapp_post_fts (rowid, title, content) SELECT id, title, content FROM djangoapp_post",
+]
+SQLITE_BACKWARD = [
+    "DROP TABLE IF EXISTS djangoapp_post_fts",
+]
+
+POSTGRES_FORWARD = [
+    "CREATE TABLE djangoapp_post_search ("
+    "post_id bigint PRIMARY KEY REFERENCES djangoapp_post (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+    "document tsvector NOT NULL)",
+    "CREATE INDEX djangoapp_post_search_document_gin ON djangoapp_post_search USING GIN (document)",
+    "INSERT INTO djangoapp_post_search (post_id, document) "
+    "SELECT id, setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', content), 'D') "
+    "FROM djangoapp_post",
+]
+POSTGRES_BACKWARD = [
+    "DROP TABLE IF EXISTS djangoapp_post_search",
+]
+
+STATEMENTS = {
+    'sqlite': (SQLITE_FORWARD, SQLITE_BACKWARD),
+    'postgresql': (POSTGRES_FORWARD, POSTGRES_BACKWARD),
+}
+
+
+def create_search_index(apps, schema_editor):
+    forward, _ = STATEMENTS.get(schema_editor.connection.vendor, ([], []))
+    for sql in forward:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    _, backward = STATEMENTS.get(schema_editor.connection.vendor, ([], []))
+    for sql in backward:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangoapp', '0002_post_excerpts'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,12 +1,41 @@
 from django.db import models
 
+EXCERPT_LENGTH = 280
+
+
+def summarize(content):
+    # -> (excerpt, word count); the feed shows these instead of loading the content
+    words = content.split()
+    excerpt = ' '.join(words)
+    if len(excerpt) > EXCERPT_LENGTH:
+        # at the last word boundary, a hard cut when the text starts with a word longer than that
+        cut = excerpt[:EXCERPT_LENGTH + 1].rsplit(' ', 1)[0][:EXCERPT_LENGTH]
+        excerpt = (cut.rstrip('.,;:!?-') or cut) + '…'
+    return excerpt, len(words)
+
 
 # Create your models here.
 class Post(models.Model):
     title = models.CharField(max_length=200)
     content = models.TextField()
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH + 1, blank=True, editable=False)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
     create_date = models.DateTimeField(auto_now_add=True)
     update_date = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # the feed: ORDER BY create_date DESC, id DESC and its keyset pages
+            models.Index(fields=['create_date', 'id'], name='djangoapp_post_feed_idx'),
+        ]
+
     def __str__(self):
         return self.title
+
+    def save(self, *args, update_fields=None, **kwargs):
+        # a deferred content (feed instances) is not loaded just to summarize it
+        if 'content' in self.__dict__ and (update_fields is None or 'content' in update_fields):
+            self.excerpt, self.word_count = summarize(self.content)
+            if update_fields is not None:
+                update_fields = {*update_fields, 'excerpt', 'word_count'}
+        super().save(*args, update_fields=update_fields, **kwargs)
@@ -0,0 +1,252 @@
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from library.pagination import KeysetPage, decode_cursor, encode_cursor
+from library.search import tokenize
+
+from .models import Post
+
+# Full-text index over post title and content, the same layout as library.search:
+#   sqlite     -> FTS5 virtual table djangoapp_post_fts (rowid = post id), ranked by bm25
+#   postgresql -> djangoapp_post_search table with a weighted tsvector + GIN index, ranked by ts_rank
+#   other      -> icontains fallback
+# Tables are created in migration 0003_post_search_index and kept current by the receivers
+# in djangoapp.signals.
+#
+# As in library.search the ranking runs inside the index query, ORDER BY rank LIMIT n with a
+# (rank, id) keyset for the next pages: a correlated rank subquery per matching row repeats
+# the MATCH for every row, which is quadratic on a common word over long posts. Only the
+# posts of the page are then loaded. search_rank is lower for better matches.
+#
+# Snippets are built only for the posts of the page being shown. The database marks the
+# matches with START/STOP, the text is escaped and the markers become <mark>.
+
+BATCH_SIZE = 500
+SNIPPET_WORDS = 32
+START, STOP = '\x02', '\x03'
+
+
+class SQLiteBackend:
+    # column weights: title, content
+    rank = "bm25(djangoapp_post_fts, 8.0, 1.0)"
+    ranked_sql = (
+        f"SELECT rowid, {rank} FROM djangoapp_post_fts WHERE djangoapp_post_fts MATCH %s {{after}} "
+        f"ORDER BY {rank}, rowid LIMIT %s"
+    )
+    after_sql = f"AND ({rank}, rowid) > (%s, %s)"
+    insert_sql = "INSERT INTO djangoapp_post_fts (rowid, title, content) SELECT id, title, content FROM djangoapp_post WHERE {where}"
+    snippet_sql = (
+        f"SELECT rowid, snippet(djangoapp_post_fts, 1, '{START}', '{STOP}', '…', {SNIPPET_WORDS}) "
+        "FROM djangoapp_post_fts WHERE djangoapp_post_fts MATCH %s AND rowid IN ({placeholders})"
+    )
+
+    def build_query(self, tokens):
+        # every token as a quoted prefix term, so user input can't inject FTS syntax
+        return ' '.join('"%s"*' % token.replace('"', '""') for token in tokens)
+
+    def ranked(self, cursor, tokens, after, limit):
+        query = self.build_query(tokens)
+        if after:
+            cursor.execute(self.ranked_sql.format(after=self.after_sql), [query, *after, limit])
+        else:
+            cursor.execute(self.ranked_sql.format(after=''), [query, limit])
+        return cursor.fetchall()
+
+    def snippets(self, cursor, tokens, post_ids):
+        placeholders = ', '.join(['%s'] * len(post_ids))
+        cursor.execute(self.snippet_sql.format(placeholders=placeholders), [self.build_query(tokens), *post_ids])
+        return dict(cursor.fetchall())
+
+    def remove(self, cursor, post_ids):
+        placeholders = ', '.join(['%s'] * len(post_ids))
+        cursor.execute(f"DELETE FROM djangoapp_post_fts WHERE rowid IN ({placeholders})", post_ids)
+
+    def index(self, cursor, post_ids):
+        self.remove(cursor, post_ids)
+        placeholders = ', '.join(['%s'] * len(post_ids))
+        cursor.execute(self.insert_sql.format(where=f"id IN ({placeholders})"), post_ids)
+
+    def index_range(self, cursor, start, end):
+        cursor.execute("DELETE FROM djangoapp_post_fts WHERE rowid > %s AND rowid <= %s", [start, end])
+        cursor.execute(self.insert_sql.format(where="id > %s AND id <= %s"), [start, end])
+
+    def clear(self, cursor):
+        cursor.execute("DELETE FROM djangoapp_post_fts")
+
+    def optimize(self, cursor):
+        # merge the b-trees left behind by incremental updates
+        cursor.execute("INSERT INTO djangoapp_post_fts (djangoapp_post_fts) VALUES ('optimize')")
+
+
+class PostgresBackend:
+    rank = "-ts_rank(document, to_tsquery('simple', %s))"
+    ranked_sql = (
+        f"SELECT post_id, {rank} FROM djangoapp_post_search WHERE document @@ to_tsquery('simple', %s) {{after}} "
+        f"ORDER BY 2, post_id LIMIT %s"
+    )
+    after_sql = f"AND ({rank}, post_id) > (%s, %s)"
+    insert_sql = (
+        "INSERT INTO djangoapp_post_search (post_id, document) "
+        "SELECT id, setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', content), 'D') "
+        "FROM djangoapp_post WHERE {where} "
+        "ON CONFLICT (post_id) DO UPDATE SET document = EXCLUDED.document"
+    )
+    snippet_sql = (
+        "SELECT id, ts_headline('simple', content, to_tsquery('simple', %s), "
+        f"'StartSel={START}, StopSel={STOP}, MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 2}') "
+        "FROM djangoapp_post WHERE id = ANY(%s)"
+    )
+
+    def build_query(self, tokens):
+        return ' & '.join(f'{token}:*' for token in tokens)
+
+    def ranked(self, cursor, tokens, after, limit):
+        query = self.build_query(tokens)
+        if after:
+            cursor.execute(self.ranked_sql.format(after=self.after_sql), [query, query, query, *after, limit])
+        else:
+            cursor.execute(self.ranked_sql.format(after=''), [query, query, limit])
+        return cursor.fetchall()
+
+    def snippets(self, cursor, tokens, post_ids):
+        cursor.execute(self.snippet_sql, [self.build_query(tokens), list(post_ids)])
+        return dict(cursor.fetchall())
+
+    def remove(self, cursor, post_ids):
+        cursor.execute("DELETE FROM djangoapp_post_search WHERE post_id = ANY(%s)", [list(post_ids)])
+
+    def index(self, cursor, post_ids):
+        cursor.execute(self.insert_sql.format(where="id = ANY(%s)"), [list(post_ids)])
+
+    def index_range(self, cursor, start, end):
+        cursor.execute(self.insert_sql.format(where="id > %s AND id <= %s"), [start, end])
+
+    def clear(self, cursor):
+        cursor.execute("TRUNCATE djangoapp_post_search")
+
+    def optimize(self, cursor):
+        pass
+
+
+class FallbackBackend:
+    def ranked(self, cursor, tokens, after, limit):
+        condition = Q()
+        for token in tokens:
+            condition &= Q(title__icontains=token) | Q(content__icontains=token)
+        posts = Post.objects.filter(condition).order_by('id')
+        if after:
+            posts = posts.filter(id__gt=after[1])
+        return [(post_id, 0.0) for post_id in posts.values_list('id', flat=True)[:limit]]
+
+    def snippets(self, cursor, tokens, post_ids):
+        return {}
+
+    def remove(self, cursor, post_ids):
+        pass
+
+    def index(self, cursor, post_ids):
+        pass
+
+    def index_range(self, cursor, start, end):
+        pass
+
+    def clear(self, cursor):
+        pass
+
+    def optimize(self, cursor):
+        pass
+
+
+BACKENDS = {
+    'sqlite': SQLiteBackend,
+    'postgresql': PostgresBackend,
+}
+
+
+def get_backend():
+    return BACKENDS.get(connection.vendor, FallbackBackend)()
+
+
+def _after(cursor):
+    values = decode_cursor(cursor)
+    if values and len(values) == 2 and all(isinstance(value, (int, float)) for value in values):
+        return values
+    # no or a tampered cursor, start from the first page
+    return None
+
+
+def search_posts(queryset, q, cursor=None, page_size=20):
+    # a KeysetPage of the posts of `queryset` matching q, best first, each with .search_rank
+    tokens = tokenize(q)
+    if not tokens:
+        return KeysetPage([], None)
+    with connection.cursor() as db_cursor:
+        rows = get_backend().ranked(db_cursor, tokens, _after(cursor), page_size + 1)
+    posts = queryset.in_bulk([post_id for post_id, _ in rows[:page_size]])
+    items = []
+    for post_id, rank in rows[:page_size]:
+        if post_id in posts:
+            posts[post_id].search_rank = rank
+            items.append(posts[post_id])
+    next_cursor = None
+    if len(rows) > page_size:
+        last_id, last_rank = rows[page_size - 1]
+        next_cursor = encode_cursor([last_rank, last_id])
+    return KeysetPage(items, next_cursor)
+
+
+def highlight(text):
+    return mark_safe(escape(text).replace(START, '<mark>').replace(STOP, '</mark>'))
+
+
+def add_snippets(posts, q):
+    # post.snippet: the best matching passage of the content, falling back to the excerpt
+    tokens = tokenize(q)
+    found = {}
+    if posts and tokens:
+        with connection.cursor() as cursor:
+            found = get_backend().snippets(cursor, tokens, [post.pk for post in posts])
+    for post in posts:
+        post.snippet = highlight(found[post.pk]) if found.get(post.pk) else escape(post.excerpt)
+    return posts
+
+
+def _chunks(ids, size=BATCH_SIZE):
+    ids = list(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def index_posts(post_ids):
+    backend = get_backend()
+    with connection.cursor() as cursor:
+        for chunk in _chunks(post_ids):
+            backend.index(cursor, chunk)
+
+
+def remove_posts(post_ids):
+    backend = get_backend()
+    with connection.cursor() as cursor:
+        for chunk in _chunks(post_ids):
+            backend.remove(cursor, chunk)
+
+
+def rebuild_index(batch_size=5000, progress=None):
+    # id ranges instead of OFFSET, one short transaction per batch
+    backend = get_backend()
+    max_id = Post.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    with connection.cursor() as cursor:
+        backend.clear(cursor)
+    start = 0
+    while start < max_id:
+        end = start + batch_size
+        with transaction.atomic(), connection.cursor() as cursor:
+            backend.index_range(cursor, start, end)
+        if progress:
+            progress(min(end, max_id), max_id)
+        start = end
+    with connection.cursor() as cursor:
+        backend.optimize(cursor)
+    return Post.objects.count()
@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import search
+from .models import Post
+
+
+# add_post / edit_post / delete_post keep the full-text index current (djangoapp.search)
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is None or {'title', 'content'} & set(update_fields):
+        search.index_posts([instance.pk])
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    search.remove_posts([instance.pk])
@@ -1,3 +1,106 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+
+from library import maintenance
+
+from .models import EXCERPT_LENGTH, Post, summarize
+
+
+class PostFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.posts = [Post.objects.create(title=f'Post {i:02d}', content=f'sityva {i} ' * 200) for i in range(45)]
+
+    def setUp(self):
+        cache.clear()
+        # the maintenance middleware's memoised switch, outside the assertNumQueries
+        maintenance.invalidate()
+        maintenance.active_prefixes()
+
+    def test_excerpt_and_word_count_are_stored(self):
+        post = self.posts[0]
+        self.assertEqual(post.word_count, 400)
+        self.assertLessEqual(len(post.excerpt), EXCERPT_LENGTH + 1)
+        self.assertTrue(post.excerpt.endswith('…'))
+        self.assertEqual(summarize('  ori   sityva '), ('ori sityva', 2))
+        # no space to cut at: a hard cut, still within the column
+        excerpt, _ = summarize('x' * 400)
+        self.assertEqual(excerpt, 'x' * EXCERPT_LENGTH + '…')
+        self.assertEqual(len(summarize('ab ' + 'x' * 400)[0]), 3)
+
+        post.content = 'axali teqsti'
+        post.save(update_fields=['content'])
+        post.refresh_from_db()
+        self.assertEqual((post.excerpt, post.word_count), ('axali teqsti', 2))
+
+    def test_feed_defers_content_and_pages_newest_first(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('all_post'))
+        posts = response.context['posts']
+        self.assertEqual([post.pk for post in posts], [post.pk for post in reversed(self.posts)][:20])
+        self.assertEqual(posts[0].get_deferred_fields(), {'content'})
+        self.assertNotContains(response, 'sityva 44 ' * 100)
+
+        seen = [post.pk for post in posts]
+        while 'next_page_query' in response.context:
+            response = self.client.get(reverse('all_post') + '?' + response.context['next_page_query'])
+            seen += [post.pk for post in response.context['posts']]
+        self.assertEqual(seen, [post.pk for post in reversed(self.posts)])
+
+    def test_posts_created_in_the_same_millisecond(self):
+        Post.objects.update(create_date=self.posts[0].create_date)
+        response = self.client.get(reverse('all_post'))
+        response = self.client.get(reverse('all_post') + '?' + response.context['next_page_query'])
+        self.assertEqual(response.context['posts'][0].pk, self.posts[-21].pk)
+
+
+class PostSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tbilisi = Post.objects.create(title='Tbilisi in autumn', content='Rtveli, wine and the old town.')
+        cls.mention = Post.objects.create(title='Travel notes', content='We spent a week in Tbilisi <b>eating</b>.')
+        cls.other = Post.objects.create(title='Mountains', content='Kazbegi and Svaneti.')
+
+    def search(self, q, **params):
+        return self.client.get(reverse('search_posts'), {'q': q, **params})
+
+    def test_ranked_results_with_highlighted_snippets(self):
+        response = self.search('tbilis')
+        self.assertEqual(list(response.context['posts']), [self.tbilisi, self.mention])
+        self.assertContains(response, '<mark>Tbilisi</mark> &lt;b&gt;eating&lt;/b&gt;')
+        # FTS syntax in the query is matched as text
+        self.assertEqual(list(self.search('"old" AND town*').context['posts']), [self.tbilisi])
+        self.assertEqual(list(self.search('"').context['posts']), [])
+
+    def test_pages_continue_after_the_last_rank(self):
+        Post.objects.bulk_create([Post(title=f'Sighnaghi {i}', content='sighnaghi ' * (i + 1)) for i in range(25)])
+        call_command('rebuild_post_search_index', stdout=StringIO())
+        response = self.search('sighnaghi')
+        seen = list(response.context['posts'])
+        response = self.search('sighnaghi', cursor=response.context['page_obj'].next_cursor)
+        seen += response.context['posts']
+        self.assertEqual(len({post.pk for post in seen}), 25)
+        self.assertEqual([post.search_rank for post in seen], sorted(post.search_rank for post in seen))
+        self.assertEqual(len(self.search('sighnaghi', cursor='garbage').context['posts']), 20)
+
+    def test_index_follows_add_edit_and_delete(self):
+        self.client.post(reverse('add_post'), {'title': 'Batumi', 'content': 'The Black Sea coast'})
+        batumi = Post.objects.get(title='Batumi')
+        self.assertEqual(list(self.search('black sea').context['posts']), [batumi])
+
+        self.client.post(reverse('edit_post', args=[batumi.pk]), {'title': 'Batumi', 'content': 'Boulevard'})
+        self.assertEqual(list(self.search('black').context['posts']), [])
+        self.assertEqual(list(self.search('boulevard').context['posts']), [batumi])
+
+        self.client.post(reverse('delete_post', args=[batumi.pk]))
+        self.assertEqual(list(self.search('batumi').context['posts']), [])
 
-# Create your tests here.
+    def test_rebuild(self):
+        Post.objects.bulk_create([Post(title='Kutaisi', content='Bagrati')])
+        self.assertEqual(list(self.search('bagrati').context['posts']), [])
+        call_command('rebuild_post_search_index', stdout=StringIO())
+        self.assertEqual(self.search('bagrati').context['posts'][0].title, 'Kutaisi')
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.urls import path
+
+from djangoapp import views
+
+if settings.LIBRARY_ASYNC_VIEWS:
+    all_posts, detail_post = views.aall_posts, views.adetail_post
+else:
+    all_posts, detail_post = views.all_posts, views.detail_post
+
+urlpatterns = [
+    path('posts/', all_posts, name='all_post'),
+    path('posts/search/', views.search_posts, name='search_posts'),
+    path('posts/add/', views.add_post, name='add_post'),
+    path('posts/<int:post_id>/', detail_post, name='detail_post'),
+    path('posts/<int:post_id>/edit/', views.edit_post, name='edit_post'),
+    path('posts/<int:post_id>/delete/', views.delete_post, name='delete_post'),
+]
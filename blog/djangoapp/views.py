@@ -1,13 +1,42 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import aget_object_or_404, get_object_or_404, render, redirect
 
+from library.pagination import apaginate_keyset, paginate_keyset
+
+from . import search
 from .forms import AddPostForm
 from .models import Post
 
+# newest first; ?cursor= continues after the last post of the previous page
+FEED_ORDERING = ('-create_date', '-id')
+FEED_PAGE_SIZE = 20
+
+
+def feed_queryset():
+    # the feed shows the stored excerpt, the content is only read by the detail page
+    return Post.objects.defer('content')
+
+
+def feed_context(request, page):
+    context = {'posts': page.object_list, 'page_obj': page}
+    if page.has_next:
+        params = request.GET.copy()
+        params['cursor'] = page.next_cursor
+        context['next_page_query'] = params.urlencode()
+    return context
+
 
 # Create your views here.
 def all_posts(request):
-    posts = Post.objects.all()
-    return render(request, 'all_post.html', {"posts": posts})
+    page = paginate_keyset(feed_queryset(), FEED_ORDERING, request.GET.get('cursor'), FEED_PAGE_SIZE)
+    return render(request, 'all_post.html', feed_context(request, page))
+
+
+def search_posts(request):
+    # ?q=: ranked by relevance, each result with a highlighted snippet of the content
+    q = request.GET.get('q', '').strip()
+    page = search.search_posts(feed_queryset(), q, request.GET.get('cursor'), FEED_PAGE_SIZE)
+    search.add_snippets(page.object_list, q)
+    return render(request, 'post_search.html', {'q': q, **feed_context(request, page)})
 
 
 def add_post(request):
@@ -29,7 +58,18 @@ def delete_post(request, post_id):
 
 
 def detail_post(request, post_id):
-    post = Post.objects.get(id=post_id)
+    post = get_object_or_404(Post, id=post_id)
+    return render(request, 'detailed_post.html', {'detailed_post': post})
+
+
+# async versions of the read views, routed under ASGI (see djangoapp/urls.py)
+async def aall_posts(request):
+    page = await apaginate_keyset(feed_queryset(), FEED_ORDERING, request.GET.get('cursor'), FEED_PAGE_SIZE)
+    return render(request, 'all_post.html', feed_context(request, page))
+
+
+async def adetail_post(request, post_id):
+    post = await aget_object_or_404(Post, id=post_id)
     return render(request, 'detailed_post.html', {'detailed_post': post})
 
 
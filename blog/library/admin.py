@@ -1,23 +1,114 @@
 from django.contrib import admin
-
-from library.models import Book, Loan, Student, Tag, Author
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.db.models import Q
+
+from library import maintenance, names
+from library.models import Book, Loan, Student, Tag, Author, MaintenanceMode
+from library.pagination import EstimatedCountPaginator
+from library.search import search_books
+
+
+class AutocompleteFilter(admin.RelatedFieldListFilter):
+    # a search box backed by the admin autocomplete view instead of one link per related
+    # object, so the changelist doesn't load the whole related table
+    template = 'admin/library/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.admin_site = model_admin.admin_site
+        super().__init__(field, request, params, model, model_admin, field_path)
+
+    def field_choices(self, field, request, model_admin):
+        return []
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        yield from super().choices(changelist)
+        widget = AutocompleteSelect(self.field, self.admin_site, attrs={'onchange': 'this.form.submit()'})
+        # the widget looks up the label of the selected object only
+        select = self.field.formfield(widget=widget).widget
+        yield {
+            'form': select.render(self.lookup_kwarg, self.lookup_val[-1] if self.lookup_val else None),
+            'hidden': [(name, value) for name, value in changelist.params.items()
+                       if name not in (self.lookup_kwarg, self.lookup_kwarg_isnull)],
+        }
+
+
+class DecadeFilter(admin.SimpleListFilter):
+    # instead of SELECT DISTINCT published_year over the whole table
+    title = 'published'
+    parameter_name = 'decade'
+
+    def lookups(self, request, model_admin):
+        # two index lookups; SQLite only optimises a lone MIN() or MAX()
+        years = Book.objects.filter(published_year__isnull=False).values_list('published_year', flat=True)
+        first = years.order_by('published_year').first()
+        if first is None:
+            return []
+        last = years.order_by('-published_year').first()
+        return [(str(decade), f'{decade}s') for decade in range(first // 10 * 10, last + 1, 10)]
+
+    def queryset(self, request, queryset):
+        value = self.value() or ''
+        if not value.lstrip('-').isdigit():
+            return queryset
+        return queryset.filter(published_year__gte=int(value), published_year__lt=int(value) + 10)
+
+
+class NamePrefixSearchMixin:
+    # search_fields are matched as a prefix of the normalized name (library.names),
+    # a range on the search_name index instead of icontains
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(names.prefix_filter(search_term)), False
+
+
+class PerformanceAdmin(admin.ModelAdmin):
+    # changelists of big tables: no second, unfiltered COUNT(*) for "N total", an estimate
+    # instead of counting the whole table (see library.pagination) and no facet counts
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+    paginator = EstimatedCountPaginator
+
+    @property
+    def media(self):
+        media = super().media
+        if any(isinstance(spec, tuple) and issubclass(spec[1], AutocompleteFilter) for spec in self.list_filter):
+            media += AutocompleteSelect(None, self.admin_site).media
+        return media
 
 
 # Register your models here.
 #  ავტომატური იქნება
 # admin.site.register(Loan)
 @admin.register(Loan)
-class LoanAdmin(admin.ModelAdmin):
+class LoanAdmin(PerformanceAdmin):
     list_display = ('book', 'student', 'borrowed_at', 'returned_at')
+    list_select_related = ('book', 'student')
     search_fields = ('book__title', 'student__full_name')
     list_filter = ('borrowed_at', 'returned_at')
+    ordering = ('-borrowed_at',)
+    autocomplete_fields = ('book', 'student')
+
+    def get_search_results(self, request, queryset, search_term):
+        # books through the full-text index and students by name prefix, as subqueries
+        # rather than icontains across the joins
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        books = search_books(Book.objects.all(), term).values('id')
+        students = Student.objects.filter(names.prefix_filter(term)).values('id')
+        return queryset.filter(Q(book__in=books) | Q(student__in=students)), False
 
 
 @admin.register(Student)
-class StudentAdmin(admin.ModelAdmin):
+class StudentAdmin(NamePrefixSearchMixin, PerformanceAdmin):
     list_display = ('full_name', 'grade')
     search_fields = ('full_name',)
     list_filter = ('grade',)
+    ordering = ('full_name', 'id')
 
 
 # ნახევრად ავტომატური
@@ -26,15 +117,26 @@ class StudentAdmin(admin.ModelAdmin):
 
 
 @admin.register(Book)
-class BookAdmin(admin.ModelAdmin):
+class BookAdmin(PerformanceAdmin):
     list_display = ('title', 'author', 'published_year', 'is_active')
+    list_select_related = ('author',)
+    # served by the full-text index, see get_search_results
     search_fields = ('title', 'author__name')
-    list_filter = ('is_active', 'published_year', 'author')
+    list_filter = ('is_active', DecadeFilter, ('author', AutocompleteFilter))
     ordering = ('-published_year',)
-    filter_horizontal = ('tags',)
+    autocomplete_fields = ('author', 'tags')
 
+    def get_search_results(self, request, queryset, search_term):
+        # also used by the book autocomplete of LoanAdmin
+        if not search_term.strip():
+            return queryset, False
+        return search_books(queryset, search_term), False
 
-admin.site.register(Author)
+
+@admin.register(Author)
+class AuthorAdmin(NamePrefixSearchMixin, PerformanceAdmin):
+    search_fields = ('name',)
+    ordering = ('name', 'id')
 
 
 # ხელით შესაყვანი
@@ -44,3 +146,20 @@ admin.site.register(Author)
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
     search_fields = ('name', 'id')
+
+
+@admin.register(MaintenanceMode)
+class MaintenanceModeAdmin(admin.ModelAdmin):
+    list_display = ('path_prefix', 'is_enabled', 'updated_at')
+    list_editable = ('is_enabled',)
+    actions = ('enable', 'disable')
+
+    @admin.action(description='chartva (maintenance on)')
+    def enable(self, request, queryset):
+        queryset.update(is_enabled=True)
+        maintenance.invalidate()
+
+    @admin.action(description='gamortva (maintenance off)')
+    def disable(self, request, queryset):
+        queryset.update(is_enabled=False)
+        maintenance.invalidate()
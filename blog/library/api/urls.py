@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.urls import path
+
+from library.api import views
+
+# mounted at library/api/v1/; the async twins under ASGI (LIBRARY_ASYNC_VIEWS)
+if settings.LIBRARY_ASYNC_VIEWS:
+    book_list, book_detail, author_list, loan_list = (
+        views.abook_list, views.abook_detail, views.aauthor_list, views.aloan_list)
+else:
+    book_list, book_detail, author_list, loan_list = (
+        views.book_list, views.book_detail, views.author_list, views.loan_list)
+
+urlpatterns = [
+    path('books/', book_list, name='api_book_list'),
+    path('books/<int:book_id>/', book_detail, name='api_book_detail'),
+    path('authors/', author_list, name='api_author_list'),
+    path('loans/', loan_list, name='api_loan_list'),
+]
@@ -0,0 +1,323 @@
+from collections import defaultdict
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.exceptions import BadRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import condition, require_safe
+
+from library import caching
+from library.catalogue_io import chunked
+from library.models import Author, Book, Loan
+from library.pagination import apaginate_keyset, paginate_keyset
+from library.search import search_books, search_page
+from library.views import filter_books
+
+# Read-only JSON API (v1).
+#
+# Rows are fetched with values() and turned into dicts straight away, no model instance is
+# built. Every resource declares its public fields as name -> (values() lookup, converter):
+#
+#   ?fields=id,title        sparse fieldset (default: the resource's DEFAULT fields)
+#   ?per_page=&cursor=      keyset pages, {"results": [...], "next": "<url>" | null}
+#   ?format=ndjson          the whole result set streamed, one object per line
+#   ?q= (books)             ranked pages from the full-text index; the ndjson stream of a
+#                           search goes by id, ranking all matches is what the pages avoid
+#
+# ETags come from the same cache versions as the HTML pages (library.caching).
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+STREAM_CHUNK = 2000
+
+
+def _cover_url(name):
+    return Book._meta.get_field('cover').storage.url(name) if name else None
+
+
+BOOK_FIELDS = {
+    'id': ('id', None),
+    'title': ('title', None),
+    'author_id': ('author_id', None),
+    'author': ('author__name', None),
+    'published_year': ('published_year', None),
+    'is_active': ('is_active', None),
+    'available': ('current_loan_id', lambda value: value is None),
+    'borrowed_by': ('current_loan__student__full_name', None),
+    'cover': ('cover', _cover_url),
+    'tags': (None, None),  # one query per page, see _book_tags
+}
+BOOK_DEFAULT = ('id', 'title', 'author_id', 'author', 'published_year', 'available', 'tags')
+BOOK_ORDERING = ('title', 'id')
+
+AUTHOR_FIELDS = {
+    'id': ('id', None),
+    'name': ('name', None),
+    'birth_year': ('birth_year', None),
+    'book_count': ('book_count', None),  # annotated only when asked for
+}
+AUTHOR_DEFAULT = ('id', 'name', 'birth_year')
+
+LOAN_FIELDS = {
+    'id': ('id', None),
+    'book_id': ('book_id', None),
+    'book': ('book__title', None),
+    'student_id': ('student_id', None),
+    'student': ('student__full_name', None),
+    'borrowed_at': ('borrowed_at', None),
+    'returned_at': ('returned_at', None),
+}
+LOAN_DEFAULT = tuple(LOAN_FIELDS)
+
+
+def api_view(view):
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                return await view(request, *args, **kwargs)
+            except BadRequest as exc:
+                return JsonResponse({'error': str(exc)}, status=400)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            try:
+                return view(request, *args, **kwargs)
+            except BadRequest as exc:
+                return JsonResponse({'error': str(exc)}, status=400)
+    return require_safe(wrapper)
+
+
+def select_fields(request, fields, default):
+    requested = request.GET.get('fields', '')
+    if not requested.strip():
+        return list(default)
+    names = list(dict.fromkeys(name.strip() for name in requested.split(',') if name.strip()))
+    unknown = [name for name in names if name not in fields]
+    if unknown:
+        raise BadRequest(f"unknown fields: {', '.join(unknown)}")
+    return names
+
+
+def _lookups(fields, names, ordering=()):
+    # id is always fetched (tags, cursors), ordering fields for the keyset cursor
+    lookups = {'id'}
+    lookups.update(fields[name][0] for name in names if fields[name][0])
+    lookups.update(field.lstrip('-') for field in ordering)
+    return sorted(lookups)
+
+
+def _book_tags_query(rows):
+    return (Book.tags.through.objects.filter(book_id__in=[row['id'] for row in rows])
+            .order_by('tag__name').values_list('book_id', 'tag__name'))
+
+
+def _group_tags(tag_rows):
+    tags = defaultdict(list)
+    for book_id, name in tag_rows:
+        tags[book_id].append(name)
+    return tags
+
+
+def serialize(rows, fields, names):
+    tags = _group_tags(_book_tags_query(rows)) if 'tags' in names else None
+    return _items(rows, fields, names, tags)
+
+
+async def aserialize(rows, fields, names):
+    tags = None
+    if 'tags' in names:
+        tags = _group_tags([row async for row in _book_tags_query(rows)])
+    return _items(rows, fields, names, tags)
+
+
+def _items(rows, fields, names, tags):
+    plan = [(name, fields[name][0], fields[name][1]) for name in names if fields[name][0]]
+    items = []
+    for row in rows:
+        item = {name: convert(row[lookup]) if convert else row[lookup] for name, lookup, convert in plan}
+        if tags is not None:
+            item['tags'] = tags.get(row['id'], [])
+        items.append(item)
+    return items
+
+
+def _page_size(request):
+    per_page = request.GET.get('per_page', '')
+    if per_page.isdigit() and int(per_page) > 0:
+        return min(int(per_page), MAX_PAGE_SIZE)
+    return PAGE_SIZE
+
+
+def _stream(queryset, ordering, fields, names):
+    rows = queryset.order_by(*ordering).values(*_lookups(fields, names)).iterator(chunk_size=STREAM_CHUNK)
+
+    def lines():
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+        for chunk in chunked(rows, STREAM_CHUNK):
+            yield ''.join(encoder.encode(item) + '\n' for item in serialize(chunk, fields, names))
+
+    return StreamingHttpResponse(lines(), content_type='application/x-ndjson; charset=utf-8')
+
+
+def _astream(queryset, ordering, fields, names):
+    rows = queryset.order_by(*ordering).values(*_lookups(fields, names)).aiterator(chunk_size=STREAM_CHUNK)
+
+    async def lines():
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+        chunk = []
+        async for row in rows:
+            chunk.append(row)
+            if len(chunk) == STREAM_CHUNK:
+                yield ''.join(encoder.encode(item) + '\n' for item in await aserialize(chunk, fields, names))
+                chunk = []
+        if chunk:
+            yield ''.join(encoder.encode(item) + '\n' for item in await aserialize(chunk, fields, names))
+
+    return StreamingHttpResponse(lines(), content_type='application/x-ndjson; charset=utf-8')
+
+
+def _page_response(request, page, items):
+    next_url = None
+    if page.has_next:
+        params = request.GET.copy()
+        params['cursor'] = page.next_cursor
+        next_url = request.build_absolute_uri('?' + params.urlencode())
+    return JsonResponse({'results': items, 'next': next_url}, json_dumps_params={'ensure_ascii': False})
+
+
+def list_response(request, queryset, ordering, fields, default, q=''):
+    names = select_fields(request, fields, default)
+    if request.GET.get('format') == 'ndjson':
+        if q:
+            return _stream(search_books(queryset, q), ('id',), fields, names)
+        return _stream(queryset, ordering, fields, names)
+
+    cursor, page_size = request.GET.get('cursor'), _page_size(request)
+    if q:
+        page = search_page(queryset.values(*_lookups(fields, names)), q, cursor, page_size)
+    else:
+        page = paginate_keyset(queryset.values(*_lookups(fields, names, ordering)), ordering, cursor, page_size)
+    return _page_response(request, page, serialize(page.object_list, fields, names))
+
+
+async def alist_response(request, queryset, ordering, fields, default, q=''):
+    names = select_fields(request, fields, default)
+    if request.GET.get('format') == 'ndjson':
+        if q:
+            return _astream(search_books(queryset, q), ('id',), fields, names)
+        return _astream(queryset, ordering, fields, names)
+
+    cursor, page_size = request.GET.get('cursor'), _page_size(request)
+    if q:
+        # raw SQL on the index has no async API
+        page = await sync_to_async(search_page)(queryset.values(*_lookups(fields, names)), q, cursor, page_size)
+    else:
+        page = await apaginate_keyset(queryset.values(*_lookups(fields, names, ordering)), ordering,
+                                      cursor, page_size)
+    return _page_response(request, page, await aserialize(page.object_list, fields, names))
+
+
+def list_etag(request, *args, **kwargs):
+    # every change of a book, loan or tag and every author save/delete bumps the catalogue version
+    # (library.signals)
+    return caching.etag('api', caching.catalogue_version(), request.get_full_path())
+
+
+def detail_etag(request, book_id, **kwargs):
+    return caching.etag('api', caching.book_version(book_id), request.get_full_path())
+
+
+def _books(request):
+    queryset = filter_books(Book.objects.all(), request.GET)
+    if request.GET.get('available') == '1':
+        queryset = queryset.filter(is_active=True, current_loan__isnull=True)
+    return queryset
+
+
+def _search(request):
+    return request.GET.get('q', '').strip()
+
+
+def _authors(request):
+    queryset = Author.objects.all()
+    if 'book_count' in select_fields(request, AUTHOR_FIELDS, AUTHOR_DEFAULT):
+        queryset = queryset.annotate(book_count=Count('books'))
+    return queryset
+
+
+def _loans(request):
+    queryset = Loan.objects.all()
+    if request.GET.get('open') == '1':
+        queryset = queryset.filter(returned_at__isnull=True)
+    for param in ('book', 'student'):
+        value = request.GET.get(param, '')
+        if value.isdigit():
+            queryset = queryset.filter(**{f'{param}_id': value})
+    return queryset
+
+
+def _book_detail_query(request, book_id):
+    names = select_fields(request, BOOK_FIELDS, BOOK_DEFAULT)
+    return names, Book.objects.filter(pk=book_id).values(*_lookups(BOOK_FIELDS, names))
+
+
+def _detail_response(items):
+    if not items:
+        return JsonResponse({'error': 'not found'}, status=404)
+    return JsonResponse(items[0], json_dumps_params={'ensure_ascii': False})
+
+
+@condition(etag_func=list_etag)
+@api_view
+def book_list(request):
+    return list_response(request, _books(request), BOOK_ORDERING, BOOK_FIELDS, BOOK_DEFAULT, _search(request))
+
+
+@condition(etag_func=detail_etag)
+@api_view
+def book_detail(request, book_id):
+    names, rows = _book_detail_query(request, book_id)
+    return _detail_response(serialize(list(rows), BOOK_FIELDS, names))
+
+
+@condition(etag_func=list_etag)
+@api_view
+def author_list(request):
+    return list_response(request, _authors(request), ('name', 'id'), AUTHOR_FIELDS, AUTHOR_DEFAULT)
+
+
+@condition(etag_func=list_etag)
+@api_view
+def loan_list(request):
+    return list_response(request, _loans(request), ('-id',), LOAN_FIELDS, LOAN_DEFAULT)
+
+
+# async twins, routed under ASGI (LIBRARY_ASYNC_VIEWS, see library/api/urls.py)
+
+@condition(etag_func=list_etag)
+@api_view
+async def abook_list(request):
+    return await alist_response(request, _books(request), BOOK_ORDERING, BOOK_FIELDS, BOOK_DEFAULT,
+                                _search(request))
+
+
+@condition(etag_func=detail_etag)
+@api_view
+async def abook_detail(request, book_id):
+    names, rows = _book_detail_query(request, book_id)
+    return _detail_response(await aserialize([row async for row in rows], BOOK_FIELDS, names))
+
+
+@condition(etag_func=list_etag)
+@api_view
+async def aauthor_list(request):
+    return await alist_response(request, _authors(request), ('name', 'id'), AUTHOR_FIELDS, AUTHOR_DEFAULT)
+
+
+@condition(etag_func=list_etag)
+@api_view
+async def aloan_list(request):
+    return await alist_response(request, _loans(request), ('-id',), LOAN_FIELDS, LOAN_DEFAULT)
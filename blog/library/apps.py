@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class LibraryConfig(AppConfig):
@@ -6,3 +7,7 @@ class LibraryConfig(AppConfig):
 
     def ready(self):
         import library.signals
+        import library.handlers
+        from library import metrics
+
+        connection_created.connect(metrics.install_query_timer)
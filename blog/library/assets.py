@@ -0,0 +1,171 @@
+import hashlib
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags
+
+# Content-addressed URLs for media and static files.
+#
+#   book_covers/scan.png  ->  /media/book_covers/scan.3fa91c0e22b7.png
+#
+# The hash is the start of the file's sha256, so a URL always names the same bytes and
+# the response can be cached by browsers for a year ("immutable"): repeat visits don't
+# even revalidate. A URL whose hash no longer matches the file (or has none) is still
+# served, but must be revalidated (ETag / If-None-Match).
+#
+# Digests are memoised per process by (path, mtime, size) and shared between processes
+# through the cache, so building a URL costs one stat().
+
+HASH_LENGTH = 12
+HASHED_NAME = re.compile(rf'^(?P<stem>.+)\.(?P<hash>[0-9a-f]{{{HASH_LENGTH}}})(?P<ext>\.[^./]+)?$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+CHUNK_SIZE = 64 * 1024
+
+_digests = {}
+
+
+def file_digest(path):
+    stat = os.stat(path)
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    digest = _digests.get(key)
+    if digest is None:
+        cache_key = 'library:digest:' + hashlib.md5(repr(key).encode(), usedforsecurity=False).hexdigest()
+        digest = cache.get(cache_key)
+        if digest is None:
+            with open(path, 'rb') as f:
+                digest = hashlib.file_digest(f, 'sha256').hexdigest()[:HASH_LENGTH]
+            cache.set(cache_key, digest, None)
+        _digests[key] = digest
+    return digest
+
+
+def hashed_name(name, digest):
+    root, ext = os.path.splitext(name)
+    return f'{root}.{digest}{ext}'
+
+
+def split_hashed_name(name):
+    # -> (name without the hash, hash or None)
+    match = HASHED_NAME.match(name)
+    if match is None:
+        return name, None
+    return match['stem'] + (match['ext'] or ''), match['hash']
+
+
+class HashedFileSystemStorage(FileSystemStorage):
+    # STORAGES['default']: FileField.url and storage.url() return content-hashed URLs
+
+    def url(self, name):
+        try:
+            digest = file_digest(self.path(name))
+        except (OSError, SuspiciousFileOperation):
+            return super().url(name)
+        return super().url(hashed_name(name, digest))
+
+
+def static_path(name):
+    if settings.STATIC_ROOT:
+        try:
+            path = safe_join(settings.STATIC_ROOT, name)
+        except SuspiciousFileOperation:
+            return None
+        if os.path.isfile(path):
+            return path
+    return finders.find(name)
+
+
+def hashed_static_name(name):
+    path = static_path(name)
+    return hashed_name(name, file_digest(path)) if path else name
+
+
+def _parse_range(header, size):
+    # a single "bytes=" range -> (start, end) inclusive; None to ignore it, False if unsatisfiable
+    if not header.startswith('bytes=') or ',' in header:
+        return None
+    start, _, end = header[6:].strip().partition('-')
+    try:
+        if not start:
+            length = int(end)
+            if length <= 0:
+                return False
+            return max(size - length, 0), size - 1
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve(request, name, path):
+    # `name` is the requested (possibly hashed) name, `path` the file it resolved to
+    if path is None or not os.path.isfile(path):
+        raise Http404(name)
+    stat = os.stat(path)
+    digest = file_digest(path)
+    _, requested = split_hashed_name(name)
+
+    headers = {
+        'ETag': f'"{digest}"',
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': IMMUTABLE if requested == digest else REVALIDATE,
+        'Accept-Ranges': 'bytes',
+    }
+    if digest in {etag.strip('"') for etag in parse_etags(request.headers.get('If-None-Match', ''))}:
+        response = HttpResponseNotModified()
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    byte_range = None
+    if 'Range' in request.headers and request.headers.get('If-Range', headers['ETag']) == headers['ETag']:
+        byte_range = _parse_range(request.headers['Range'], stat.st_size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+    elif byte_range:
+        start, end = byte_range
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        response = StreamingHttpResponse(_read_range(path, start, end - start + 1),
+                                         status=206, content_type=content_type)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    else:
+        # the WSGI server can send a whole FileResponse with sendfile()
+        response = FileResponse(open(path, 'rb'))
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+def media_path(name):
+    original, _ = split_hashed_name(name)
+    try:
+        path = safe_join(settings.MEDIA_ROOT, original)
+        # an unhashed name that merely looks hashed
+        return path if os.path.isfile(path) else safe_join(settings.MEDIA_ROOT, name)
+    except SuspiciousFileOperation:
+        return None
@@ -0,0 +1,137 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+
+# Versioned cache keys for the catalogue pages.
+#
+# Every book has a version token (time_ns of its last change) and so does the catalogue as
+# a whole. Cached fragments and pages embed the version in their key, so invalidation is a
+# version bump - old entries are never deleted, they just stop being read and age out.
+# The signal receivers bump exactly the books a Book/Author/Tag/Loan/Student change
+# affects, after the transaction commits.
+#
+# A version that fell out of the cache is recreated as "now", which only costs a re-render.
+#
+# A bump only reaches the cache of the process that made the change. In a shared cache
+# (file based, Redis, memcached) versions never expire; in a per-process one (locmem)
+# they expire after PAGE_TIMEOUT, so other processes serve stale cards and 304s for
+# at most that long.
+
+VERSION_PREFIX = 'library:v:'
+CATALOGUE = 'catalogue'
+FRAGMENT_TIMEOUT = 24 * 60 * 60
+PAGE_TIMEOUT = 10 * 60
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cache_is_shared(alias='default'):
+    # whether every process reads and writes the same cache
+    return settings.CACHES[alias]['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+
+def _version_timeout():
+    return None if cache_is_shared() else PAGE_TIMEOUT
+
+
+def _book_key(book_id):
+    return f'{VERSION_PREFIX}book:{book_id}'
+
+
+def _new_version():
+    return time.time_ns()
+
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        version = _new_version()
+        cache.add(key, version, _version_timeout())
+    return version
+
+
+def catalogue_version():
+    return _version(VERSION_PREFIX + CATALOGUE)
+
+
+def _names_key(model):
+    return f'{VERSION_PREFIX}names:{model._meta.model_name}'
+
+
+def names_version(model):
+    # the name picker pages of Student / Author
+    return _version(_names_key(model))
+
+
+def book_versions(book_ids):
+    keys = {_book_key(book_id): book_id for book_id in book_ids}
+    found = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, _version_timeout())
+        found.update(missing)
+    return {keys[key]: version for key, version in found.items()}
+
+
+def book_version(book_id):
+    return book_versions([book_id])[book_id]
+
+
+def version_time(version):
+    # for Last-Modified
+    return datetime.fromtimestamp(version / 1e9, tz=timezone.utc)
+
+
+def bump_books(book_ids):
+    book_ids = list(book_ids)
+
+    def bump():
+        version = _new_version()
+        values = {_book_key(book_id): version for book_id in book_ids}
+        values[VERSION_PREFIX + CATALOGUE] = version
+        cache.set_many(values, _version_timeout())
+
+    # after commit, so a concurrent request can't re-cache the old data under the new version
+    transaction.on_commit(bump)
+
+
+def bump_catalogue():
+    transaction.on_commit(lambda: cache.set(VERSION_PREFIX + CATALOGUE, _new_version(), _version_timeout()))
+
+
+def bump_names(model):
+    transaction.on_commit(lambda: cache.set(_names_key(model), _new_version(), _version_timeout()))
+
+
+def etag(*parts):
+    return hashlib.md5(':'.join(str(part) for part in parts).encode(), usedforsecurity=False).hexdigest()
+
+
+def render_book_cards(books, template_name='library/book_card.html'):
+    # [(book, html)] - one get_many for versions, one for fragments, render only the misses
+    versions = book_versions([book.pk for book in books])
+    keys = {book.pk: f'library:card:{book.pk}:{versions[book.pk]}' for book in books}
+    cached = cache.get_many(keys.values())
+
+    cards = []
+    rendered = {}
+    for book in books:
+        key = keys[book.pk]
+        html = cached.get(key)
+        if html is None:
+            html = rendered[key] = render_to_string(template_name, {'book': book})
+        cards.append((book, html))
+    if rendered:
+        cache.set_many(rendered, FRAGMENT_TIMEOUT)
+    return cards
+
+
+def page_key(request, version):
+    return f'library:page:{etag(request.get_full_path(), version)}'
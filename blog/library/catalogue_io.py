@@ -0,0 +1,77 @@
+import csv
+import json
+from itertools import islice
+
+# Row format shared by the import_catalogue / export_catalogue commands.
+# CSV keeps tags in one column separated by TAG_SEPARATOR, JSONL keeps them as a list.
+
+FIELDS = ('id', 'title', 'author', 'published_year', 'is_active', 'tags')
+TAG_SEPARATOR = '|'
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return 'jsonl' if str(path).endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() not in ('0', 'false', 'no', 'off', '')
+
+
+def _parse_int(value):
+    if value in (None, ''):
+        return None
+    return int(value)
+
+
+def normalize(row):
+    tags = row.get('tags') or []
+    if isinstance(tags, str):
+        tags = tags.split(TAG_SEPARATOR)
+    return {
+        'id': _parse_int(row.get('id')),
+        'title': (row.get('title') or '').strip(),
+        'author': (row.get('author') or '').strip(),
+        'published_year': _parse_int(row.get('published_year')),
+        'is_active': _parse_bool(row.get('is_active', True)),
+        'tags': [tag.strip() for tag in tags if tag and tag.strip()],
+    }
+
+
+def read_rows(stream, fmt):
+    if fmt == 'jsonl':
+        for line in stream:
+            if line.strip():
+                yield normalize(json.loads(line))
+    else:
+        for row in csv.DictReader(stream):
+            yield normalize(row)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class RowWriter:
+    def __init__(self, stream, fmt):
+        self.stream = stream
+        self.fmt = fmt
+        if fmt == 'csv':
+            self.writer = csv.writer(stream)
+            self.writer.writerow(FIELDS)
+
+    def write(self, row):
+        if self.fmt == 'jsonl':
+            self.stream.write(json.dumps(row, ensure_ascii=False))
+            self.stream.write('\n')
+        else:
+            values = dict(row, tags=TAG_SEPARATOR.join(row['tags']))
+            self.writer.writerow([values[field] for field in FIELDS])
@@ -0,0 +1,134 @@
+import hashlib
+import logging
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from . import caching
+from .models import Book
+
+logger = logging.getLogger('library.covers')
+
+# Cover image variants.
+#
+# After a cover is uploaded, an event bus worker (see library.handlers) resizes it to
+# WIDTHS in every format of FORMATS and stores the result on the book:
+#
+#   cover_hash      sha256 of the original file
+#   cover_variants  [{'width': 320, 'height': 480, 'format': 'webp', 'name': 'book_covers/...'}]
+#
+# Variants live under a directory named after the content hash, so identical covers share
+# one set of files: a book whose cover hashes to an already processed one is pointed at
+# that book's original and variants, and its own duplicate upload is deleted.
+# Until a cover has been processed the templates fall back to the original.
+
+WIDTHS = (160, 320, 640)
+FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+VARIANT_DIR = 'book_covers/variants'
+
+
+def storage():
+    return Book._meta.get_field('cover').storage
+
+
+def content_hash(field_file):
+    digest = hashlib.sha256()
+    with field_file.open('rb') as source:
+        for chunk in source.chunks():
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def variant_dir(digest):
+    return f'{VARIANT_DIR}/{digest[:2]}/{digest}'
+
+
+def _flatten(image):
+    # JPEG has no alpha channel
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_variants(source, digest):
+    store = storage()
+    variants = []
+    with Image.open(source) as image:
+        # JPEG sources are decoded at a reduced scale straight away
+        image.draft('RGB', (WIDTHS[-1], WIDTHS[-1] * 4))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'P') else 'RGB')
+
+        # largest first, every smaller size is resized from the previous one
+        for width in sorted({min(width, image.width) for width in WIDTHS}, reverse=True):
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            for ext, fmt, options in FORMATS:
+                name = f'{variant_dir(digest)}/{width}.{ext}'
+                if not store.exists(name):
+                    buffer = BytesIO()
+                    (image if fmt == 'WEBP' else _flatten(image)).save(buffer, fmt, **options)
+                    saved = store.save(name, ContentFile(buffer.getvalue()))
+                    if saved != name:
+                        # another worker rendered the same cover meanwhile, the files are identical
+                        store.delete(saved)
+                variants.append({'width': width, 'height': height, 'format': ext, 'name': name})
+    variants.sort(key=lambda variant: variant['width'])
+    return variants
+
+
+def process_cover(book_id):
+    # returns the variants, or None if the book has no (readable) cover or it changed meanwhile
+    book = Book.objects.filter(pk=book_id).only('id', 'cover').first()
+    if book is None or not book.cover:
+        return None
+    name = book.cover.name
+
+    try:
+        digest = content_hash(book.cover)
+        processed = (Book.objects.filter(cover_hash=digest).exclude(pk=book_id)
+                     .values('cover', 'cover_variants').first())
+        if processed:
+            cover_name, variants = processed['cover'], processed['cover_variants']
+        else:
+            cover_name = name
+            with book.cover.open('rb') as source:
+                variants = render_variants(source, digest)
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as exc:
+        logger.warning('cover of book %s (%s) not processed: %s', book_id, name, exc)
+        return None
+
+    with transaction.atomic():
+        # only if nobody uploaded another cover in the meantime
+        updated = (Book.objects.filter(pk=book_id, cover=name)
+                   .update(cover=cover_name, cover_hash=digest, cover_variants=variants))
+        if updated:
+            caching.bump_books([book_id])
+    if not updated:
+        return None
+    if cover_name != name and not Book.objects.filter(cover=name).exists():
+        storage().delete(name)
+    return variants
+
+
+def delete_cover(name, digest):
+    # files are shared between books with identical covers
+    store = storage()
+    if name and not Book.objects.filter(cover=name).exists():
+        store.delete(name)
+    if digest and not Book.objects.filter(cover_hash=digest).exists():
+        try:
+            _, files = store.listdir(variant_dir(digest))
+        except FileNotFoundError:
+            return
+        for filename in files:
+            store.delete(f'{variant_dir(digest)}/{filename}')
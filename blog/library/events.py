@@ -0,0 +1,162 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger('library.events')
+
+# In-process domain event bus. Receivers in library.signals publish events, they are
+# queued only once the surrounding transaction commits (transaction.on_commit) and then
+# handled by a small pool of worker threads, off the request path.
+#
+# Settings (all optional):
+#   LIBRARY_EVENTS_SYNC         handle events inline on publish (tests, management commands)
+#   LIBRARY_EVENTS_QUEUE_SIZE   bounded queue capacity
+#   LIBRARY_EVENTS_WORKERS      number of worker threads
+#   LIBRARY_EVENTS_PUT_TIMEOUT  seconds to wait for room in a full queue
+#
+# Backpressure: a publisher waits at most PUT_TIMEOUT for room in a full queue, then the
+# event is dropped, counted and logged with its payload. Handlers never run on the request
+# thread and a flood of events can't grow memory. The counters are updated under the bus
+# lock, publishers and workers update them concurrently.
+
+BOOK_CREATED = 'book.created'
+BOOK_UPDATED = 'book.updated'
+BOOK_DELETED = 'book.deleted'
+LOAN_OPENED = 'loan.opened'
+LOAN_CLOSED = 'loan.closed'
+
+
+class Event:
+    __slots__ = ('name', 'payload', 'published_at')
+
+    def __init__(self, name, payload):
+        self.name = name
+        self.payload = payload
+        self.published_at = time.monotonic()
+
+    def __repr__(self):
+        return f'<Event {self.name} {self.payload}>'
+
+
+class EventBus:
+    def __init__(self):
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._workers = []
+        self._stats = {'published': 0, 'handled': 0, 'failed': 0, 'dropped': 0, 'max_depth': 0}
+
+    # -- configuration
+
+    @property
+    def sync(self):
+        return getattr(settings, 'LIBRARY_EVENTS_SYNC', False)
+
+    def subscribe(self, name, handler=None):
+        if handler is None:
+            # decorator form: @bus.subscribe(BOOK_DELETED)
+            return lambda func: self.subscribe(name, func)
+        self._handlers.setdefault(name, []).append(handler)
+        return handler
+
+    # -- publishing
+
+    def publish(self, name, **payload):
+        event = Event(name, payload)
+        # nothing is published for a transaction that rolls back
+        transaction.on_commit(lambda: self._enqueue(event), robust=True)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _enqueue(self, event):
+        self._count('published')
+        if self.sync:
+            self._dispatch(event)
+            return
+
+        self._ensure_workers()
+        try:
+            self._queue.put(event, timeout=getattr(settings, 'LIBRARY_EVENTS_PUT_TIMEOUT', 0.05))
+        except queue.Full:
+            self._count('dropped')
+            logger.error('event queue full, dropped %r', event)
+            return
+        depth = self._queue.qsize()
+        with self._lock:
+            self._stats['max_depth'] = max(self._stats['max_depth'], depth)
+
+    def _dispatch(self, event):
+        for handler in self._handlers.get(event.name, ()):
+            try:
+                handler(event)
+            except Exception:
+                self._count('failed')
+                logger.exception('event handler %r failed for %r', handler, event)
+        self._count('handled')
+
+    # -- workers
+
+    def _ensure_workers(self):
+        # (re)start lazily, and again in a forked child whose threads did not survive the fork
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=getattr(settings, 'LIBRARY_EVENTS_QUEUE_SIZE', 1000))
+            self._workers = [
+                threading.Thread(target=self._work, name=f'library-events-{i}', daemon=True)
+                for i in range(getattr(settings, 'LIBRARY_EVENTS_WORKERS', 2))
+            ]
+            for worker in self._workers:
+                worker.start()
+            self._pid = os.getpid()
+
+    def _work(self):
+        events = self._queue
+        while True:
+            event = events.get()
+            try:
+                self._dispatch(event)
+            finally:
+                close_old_connections()
+                events.task_done()
+
+    def drain(self, timeout=5.0):
+        # wait until queued events are handled; True if the queue emptied in time
+        if self._queue is None or self._pid != os.getpid():
+            return True
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def metrics(self):
+        running = self._queue is not None and self._pid == os.getpid()
+        with self._lock:
+            stats = dict(self._stats)
+        return {
+            **stats,
+            'depth': self._queue.qsize() if running else 0,
+            'capacity': self._queue.maxsize if running else 0,
+            'workers': sum(worker.is_alive() for worker in self._workers) if running else 0,
+            'sync': self.sync,
+        }
+
+
+bus = EventBus()
+publish = bus.publish
+subscribe = bus.subscribe
+
+atexit.register(bus.drain)
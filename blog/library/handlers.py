@@ -0,0 +1,56 @@
+import logging
+
+from . import covers, events, reports
+
+logger = logging.getLogger('library')
+
+# Event handlers run on the event bus workers (see library.events), never on the request thread.
+
+
+@events.subscribe(events.BOOK_CREATED)
+def log_book_created(event):
+    logger.info('book created: %(book_id)s %(title)r (author %(author_id)s)', event.payload)
+
+
+@events.subscribe(events.BOOK_UPDATED)
+def log_book_updated(event):
+    logger.info('book updated: %(book_id)s %(title)r changed=%(changed)s', event.payload)
+
+
+@events.subscribe(events.BOOK_DELETED)
+def log_book_deleted(event):
+    logger.info('book deleted: %(book_id)s %(title)r', event.payload)
+
+
+@events.subscribe(events.BOOK_CREATED)
+@events.subscribe(events.BOOK_UPDATED)
+def process_cover(event):
+    if event.payload.get('cover') and (event.name == events.BOOK_CREATED or 'cover' in event.payload['changed']):
+        covers.process_cover(event.payload['book_id'])
+
+
+@events.subscribe(events.BOOK_DELETED)
+def delete_cover_file(event):
+    covers.delete_cover(event.payload.get('cover'), event.payload.get('cover_hash'))
+
+
+@events.subscribe(events.LOAN_OPENED)
+def log_loan_opened(event):
+    logger.info('loan %(loan_id)s opened: book %(book_id)s -> student %(student_id)s', event.payload)
+
+
+@events.subscribe(events.LOAN_CLOSED)
+def log_loan_closed(event):
+    logger.info('loan %(loan_id)s closed: book %(book_id)s returned by student %(student_id)s', event.payload)
+
+
+# daily circulation aggregates, see library.reports
+
+@events.subscribe(events.LOAN_OPENED)
+def count_loan_opened(event):
+    reports.record_loan_opened(event.payload['loan_id'])
+
+
+@events.subscribe(events.LOAN_CLOSED)
+def count_loan_closed(event):
+    reports.record_loan_closed(event.payload['loan_id'])
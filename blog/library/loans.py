@@ -0,0 +1,70 @@
+from django.db import IntegrityError, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from . import caching, events
+from .models import Book, Loan
+
+# Borrow/return go through here. The partial unique constraint
+# library_loan_one_open_per_book is what makes borrowing race-free: the INSERT of a
+# second open loan for a book fails inside the database, so there is no
+# check-then-insert window between two circulation desks.
+# Any other IntegrityError (a book or student that doesn't exist) is re-raised as is.
+
+
+class BookUnavailable(Exception):
+    def __init__(self, book_ids):
+        self.book_ids = list(book_ids)
+        super().__init__(f"books already on loan: {self.book_ids}")
+
+
+def _on_loan(book_ids):
+    # after an IntegrityError: which of the books the open-loan constraint rejected
+    return list(Loan.objects.filter(book_id__in=book_ids, returned_at__isnull=True)
+                .order_by('book_id').values_list('book_id', flat=True))
+
+
+def borrow(book_id, student):
+    try:
+        with transaction.atomic():
+            # Loan.save() points book.current_loan at the new loan in the same transaction
+            return Loan.objects.create(book_id=book_id, student=student)
+    except IntegrityError:
+        if not _on_loan([book_id]):
+            raise
+        raise BookUnavailable([book_id])
+
+
+def borrow_many(book_ids, student):
+    # a whole cart in one INSERT + one UPDATE; either every book is lent or none is.
+    # bulk_create skips Loan.save() and the post_save receivers, so current_loan is
+    # set with a single correlated UPDATE and the loan events are published here.
+    book_ids = list(dict.fromkeys(book_ids))
+    try:
+        with transaction.atomic():
+            loans = Loan.objects.bulk_create(Loan(book_id=book_id, student=student) for book_id in book_ids)
+            open_loan = Loan.objects.filter(book=OuterRef('pk'), returned_at__isnull=True).values('id')[:1]
+            Book.objects.filter(pk__in=book_ids).update(current_loan=Subquery(open_loan))
+            caching.bump_books(book_ids)
+            for loan in loans:
+                events.publish(events.LOAN_OPENED, loan_id=loan.pk, book_id=loan.book_id,
+                               student_id=student.pk)
+    except IntegrityError:
+        unavailable = _on_loan(book_ids)
+        if not unavailable:
+            raise
+        raise BookUnavailable(unavailable)
+    return loans
+
+
+def return_loan(loan_id):
+    # returns False when the loan was already closed, without writing anything
+    with transaction.atomic():
+        loan = (Loan.objects.select_for_update()
+                .filter(pk=loan_id, returned_at__isnull=True)
+                .first())
+        if loan is None:
+            return False
+        loan.returned_at = timezone.now()
+        loan.save(update_fields=['returned_at'])
+    return True
@@ -0,0 +1,85 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import MaintenanceMode
+
+# Runtime maintenance switch. The enabled path prefixes live in the MaintenanceMode table,
+# are cached under CACHE_KEY and memoised per process for LIBRARY_MAINTENANCE_MEMO_TTL
+# seconds, so the middleware check is a clock read and a comparison on the hot path.
+#
+# Every process sees a change within MEMO_TTL + CACHE_TIMEOUT seconds, even with a
+# per-process cache like locmem; with a shared cache it is within MEMO_TTL.
+
+CACHE_KEY = 'library:maintenance:prefixes'
+
+_memo = (0.0, ())
+
+
+def _memo_ttl():
+    return getattr(settings, 'LIBRARY_MAINTENANCE_MEMO_TTL', 2)
+
+
+def _cache_timeout():
+    return getattr(settings, 'LIBRARY_MAINTENANCE_CACHE_TIMEOUT', 5)
+
+
+def _load():
+    prefixes = cache.get(CACHE_KEY)
+    if prefixes is None:
+        prefixes = tuple(MaintenanceMode.objects.filter(is_enabled=True)
+                         .order_by('path_prefix').values_list('path_prefix', flat=True))
+        cache.set(CACHE_KEY, prefixes, _cache_timeout())
+    return prefixes
+
+
+async def _aload():
+    prefixes = await cache.aget(CACHE_KEY)
+    if prefixes is None:
+        prefixes = tuple([prefix async for prefix in MaintenanceMode.objects.filter(is_enabled=True)
+                          .order_by('path_prefix').values_list('path_prefix', flat=True)])
+        await cache.aset(CACHE_KEY, prefixes, _cache_timeout())
+    return prefixes
+
+
+def _memoised():
+    expires, prefixes = _memo
+    return prefixes if time.monotonic() < expires else None
+
+
+def _remember(prefixes):
+    global _memo
+    _memo = (time.monotonic() + _memo_ttl(), prefixes)
+    return prefixes
+
+
+def active_prefixes():
+    prefixes = _memoised()
+    if prefixes is not None:
+        return prefixes
+    if getattr(settings, 'MAINTENANCE_MODE', False):
+        # the old static setting still closes the whole site
+        return _remember(('/',))
+    return _remember(_load())
+
+
+async def aactive_prefixes():
+    # same as active_prefixes(), for the async middleware path
+    prefixes = _memoised()
+    if prefixes is not None:
+        return prefixes
+    if getattr(settings, 'MAINTENANCE_MODE', False):
+        return _remember(('/',))
+    return _remember(await _aload())
+
+
+def invalidate():
+    global _memo
+    cache.delete(CACHE_KEY)
+    _memo = (0.0, ())
+
+
+def set_enabled(path_prefix='/', enabled=True):
+    MaintenanceMode.objects.update_or_create(path_prefix=path_prefix, defaults={'is_enabled': enabled})
+    invalidate()
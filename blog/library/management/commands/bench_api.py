@@ -0,0 +1,53 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from library.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Compare the throughput of the JSON API with the HTML catalogue views on the current database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--per-page', type=int, default=24)
+        parser.add_argument('--cold', action='store_true',
+                            help='clear the cache before every request (no cached pages or cards)')
+
+    def handle(self, *args, **options):
+        book_id = Book.objects.order_by('id').values_list('id', flat=True).first()
+        if book_id is None:
+            raise CommandError('the catalogue is empty, run import_catalogue first')
+
+        per_page = {'per_page': options['per_page']}
+        pairs = [
+            ('list', (reverse('book_list'), per_page), (reverse('api_book_list'), per_page)),
+            ('detail', (reverse('book_detail', args=[book_id]), {}),
+             (reverse('api_book_detail', args=[book_id]), {})),
+        ]
+        host = next((host for host in settings.ALLOWED_HOSTS if host not in ('*', '')), 'localhost')
+        client = Client(HTTP_HOST=host.lstrip('.'))
+
+        self.stdout.write(f"{'route':<8} {'kind':<5} {'req/s':>9} {'ms/req':>8} {'bytes':>8}")
+        for name, html, api in pairs:
+            for kind, (url, params) in (('html', html), ('json', api)):
+                rate, size = self.measure(client, url, params, options['requests'], options['cold'])
+                self.stdout.write(f'{name:<8} {kind:<5} {rate:9.0f} {1000 / rate:8.2f} {size:8d}')
+
+    def measure(self, client, url, params, requests, cold):
+        client.get(url, params)  # warm up
+        size = 0
+        start = time.perf_counter()
+        for _ in range(requests):
+            if cold:
+                cache.clear()
+            response = client.get(url, params)
+            if response.status_code != 200:
+                raise CommandError(f'{url} returned {response.status_code}')
+            size = len(response.getvalue())
+        elapsed = time.perf_counter() - start
+        return requests / elapsed, size
@@ -0,0 +1,146 @@
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.test import Client
+from django.urls import reverse
+
+from library import names, search
+from library.metrics import Histogram
+from library.models import Author, Book, Student
+from library.pagination import encode_cursor
+
+
+class Command(BaseCommand):
+    help = ('Concurrent borrow/return and catalogue list throughput through the full request stack, '
+            'on the configured database. --compare runs it under the development and the production '
+            'profile (blog/settings.py), each on a fresh temporary SQLite database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='half borrow/return, half list')
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--books', type=int, default=2000)
+        parser.add_argument('--compare', action='store_true')
+        parser.add_argument('--fresh', action='store_true',
+                            help='migrate and seed the (empty) configured database first')
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            return self.compare(options)
+        if options['fresh']:
+            self.seed(options['books'])
+
+        books = list(Book.objects.order_by('id').values_list('id', 'title'))
+        students = list(Student.objects.values_list('id', flat=True)[:100])
+        if not books or not students:
+            raise CommandError('needs books and students, use --fresh on an empty database')
+
+        borrowers = max(1, options['threads'] // 2)
+        listers = max(1, options['threads'] - borrowers)
+        deadline = time.monotonic() + options['seconds']
+        results = {'borrow': Histogram(), 'list': Histogram()}
+        errors = {'borrow': 0, 'list': 0}
+        lock = threading.Lock()
+
+        def timed(kind, func):
+            start = time.perf_counter_ns()
+            try:
+                ok = func()
+            except OperationalError:
+                ok = False
+            elapsed = (time.perf_counter_ns() - start) // 1000
+            with lock:
+                results[kind].record(elapsed)
+                errors[kind] += not ok
+
+        def borrower(index):
+            # every borrower cycles through its own books, so they never collide on a book
+            client = self.client()
+            mine = books[index::borrowers]
+            student = students[index % len(students)]
+            while time.monotonic() < deadline:
+                book_id = random.choice(mine)[0]
+
+                def borrow_and_return():
+                    response = client.post(reverse('library_borrow_book', args=[book_id]), {'student': student})
+                    loan_id = Book.objects.filter(pk=book_id).values_list('current_loan_id', flat=True).get()
+                    if response.status_code != 302 or loan_id is None:
+                        return False
+                    return client.post(reverse('library_return_loan', args=[loan_id])).status_code == 302
+
+                timed('borrow', borrow_and_return)
+            connection.close()
+
+        def lister(index):
+            client = self.client()
+            while time.monotonic() < deadline:
+                title, book_id = random.choice(books)[::-1]
+                cursor = encode_cursor([title, book_id])
+                timed('list', lambda: client.get(reverse('book_list'), {'cursor': cursor}).status_code == 200)
+            connection.close()
+
+        threads = ([threading.Thread(target=borrower, args=(i,)) for i in range(borrowers)]
+                   + [threading.Thread(target=lister, args=(i,)) for i in range(listers)])
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        vendor = connection.vendor
+        self.stdout.write(f'profile={settings.PROFILE} db={vendor} debug={settings.DEBUG} '
+                          f"conn_max_age={settings.DATABASES['default'].get('CONN_MAX_AGE', 0)}")
+        for kind, histogram in results.items():
+            summary = histogram.summary()
+            self.stdout.write(
+                f"  {kind:<7} {histogram.total / options['seconds']:8.0f} ops/s  "
+                f"p50 {summary['p50'] / 1000:6.1f} ms  p99 {summary['p99'] / 1000:6.1f} ms  "
+                f"errors {errors[kind]}"
+            )
+
+    def client(self):
+        host = next((host for host in settings.ALLOWED_HOSTS if host not in ('*', '')), 'localhost')
+        return Client(HTTP_HOST=host.lstrip('.'))
+
+    def seed(self, count):
+        call_command('migrate', verbosity=0)
+        if Book.objects.exists():
+            raise CommandError('--fresh expects an empty database')
+        authors = Author.objects.bulk_create(names.fill(Author(name=f'Author {i}')) for i in range(max(1, count // 20)))
+        Book.objects.bulk_create(Book(title=f'Book {i:06d}', author=authors[i % len(authors)])
+                                 for i in range(count))
+        Student.objects.bulk_create(names.fill(Student(full_name=f'Student {i}', grade=i % 12 + 1))
+                                    for i in range(100))
+        search.rebuild_index()
+
+    def compare(self, options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('--compare runs on temporary SQLite databases; run without it on PostgreSQL')
+        manage = Path(settings.BASE_DIR) / 'manage.py'
+        with tempfile.TemporaryDirectory() as directory:
+            for profile in ('development', 'production'):
+                environ = {
+                    **os.environ,
+                    'DJANGO_PROFILE': profile,
+                    'DJANGO_DB_ENGINE': 'sqlite',
+                    'DJANGO_DB_NAME': os.path.join(directory, f'{profile}.sqlite3'),
+                    'DJANGO_SECRET_KEY': os.environ.get('DJANGO_SECRET_KEY', 'bench-db'),
+                    'DJANGO_ALLOWED_HOSTS': 'localhost',
+                    'DJANGO_SECURE_COOKIES': '0',
+                }
+                environ.pop('DJANGO_SQLITE_TUNED', None)
+                environ.pop('DJANGO_DEBUG', None)
+                subprocess.run(
+                    [sys.executable, str(manage), 'bench_db', '--fresh',
+                     '--threads', str(options['threads']), '--seconds', str(options['seconds']),
+                     '--books', str(options['books'])],
+                    env=environ, check=True,
+                )
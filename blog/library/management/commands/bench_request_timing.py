@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import resolve
+
+from library import metrics
+from library.middleware import RequestTimingMiddleware
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-request overhead of RequestTimingMiddleware.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200000)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        request = RequestFactory().get('/library/')
+        request.resolver_match = resolve('/library/')
+        response = HttpResponse()
+
+        def view(request):
+            return response
+
+        timed = RequestTimingMiddleware(view)
+
+        def run(handler):
+            start = time.perf_counter_ns()
+            for _ in range(iterations):
+                handler(request)
+            return (time.perf_counter_ns() - start) / iterations
+
+        run(timed)  # warm up the thread shard and route entry
+        bare = min(run(view) for _ in range(3))
+        wrapped = min(run(timed) for _ in range(3))
+        metrics.registry.reset()
+
+        self.stdout.write(f'bare view:        {bare:8.0f} ns/request')
+        self.stdout.write(f'with middleware:  {wrapped:8.0f} ns/request')
+        self.stdout.write(self.style.SUCCESS(f'overhead:         {wrapped - bare:8.0f} ns/request'))
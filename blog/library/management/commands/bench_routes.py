@@ -0,0 +1,351 @@
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from importlib import import_module
+from io import StringIO
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import URLPattern, URLResolver, reverse
+
+from djangoapp.models import Post
+from library import maintenance
+from library.metrics import RouteStats
+from library.models import Author, Book, Loan, Student
+
+# End-to-end benchmark of every named route of library.urls (with the JSON API),
+# djangoapp.urls and accounts.urls, through the test client - no server, no network.
+#
+# For every --size the command creates a scratch database next to the configured one
+# (the test database, like manage.py test), fills it with seed_data and runs each scenario
+# --warmup + --requests times. Per scenario it records latency, queries and database time
+# per request (p50/p95/p99/max, library.metrics histograms) and the peak Python memory of
+# one extra request under tracemalloc, kept out of the timed ones as it slows everything.
+# --size current runs against the configured database as it is, without seeding.
+#
+# Writes (borrow, return, posts, login, ...) run inside a transaction that is rolled back,
+# so every request sees the same data; their on_commit work (cache bumps, events) is
+# skipped. The login/registration throttles are switched off, they would answer 429.
+# Read views mostly answer from the cache once warm; --cold clears it before every request.
+#
+# --output writes the results as JSON; --baseline compares them with an earlier file and
+# fails when a route got slower than --threshold times the baseline (latency p50/p95,
+# database time, memory) or runs more queries. --candidate compares two files without
+# running anything:
+#
+#   manage.py bench_routes --output before.json
+#   (change the code)
+#   manage.py bench_routes --output after.json --baseline before.json
+
+ROUTE_MODULES = ('library.urls', 'djangoapp.urls', 'accounts.urls')
+SIZES = {
+    'small': {'authors': 200, 'books': 2_000, 'tags': 50, 'students': 500, 'loans': 20_000, 'posts': 500},
+    'medium': {'authors': 2_000, 'books': 20_000, 'tags': 200, 'students': 5_000, 'loans': 200_000,
+               'posts': 5_000},
+    'large': {'authors': 10_000, 'books': 100_000, 'tags': 500, 'students': 20_000, 'loans': 2_000_000,
+              'posts': 50_000},
+}
+PASSWORD = 'bench-Password-1'
+
+# below these a difference is noise, whatever the ratio
+MIN_DELTA_US = 500
+MIN_DELTA_KB = 64
+
+
+def route_names(modules=ROUTE_MODULES):
+    def walk(patterns):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                yield from walk(pattern.url_patterns)
+            elif isinstance(pattern, URLPattern) and pattern.name:
+                yield pattern.name
+
+    return {name for module in modules for name in walk(import_module(module).urlpatterns)}
+
+
+def fixtures():
+    # ids and search terms taken from the data; None when the database has no such row
+    first = lambda queryset: queryset.order_by('id').values_list('id', flat=True).first()
+    post = Post.objects.order_by('id').only('title').first()
+    book = Book.objects.order_by('id').only('title').first()
+    return {
+        'book': book and book.pk,
+        'available_book': first(Book.objects.available()),
+        'open_loan': first(Loan.objects.filter(returned_at__isnull=True)),
+        'author': first(Author.objects),
+        'student': first(Student.objects),
+        'post': post and post.pk,
+        'book_word': book.title.split()[0].lower() if book else 'book',
+        'post_word': post.title.split()[0].lower() if post else 'post',
+    }
+
+
+def scenarios(data):
+    # (label, route name, client: None/'user'/'staff', method, path, form data, expected status);
+    # a scenario whose fixture is missing from the database is left out
+    needs = {'book': data['book'], 'borrow': data['available_book'] and data['student'],
+             'loan': data['open_loan'], 'author': data['author'], 'post': data['post']}
+    table = [
+        ('catalogue', 'book_list', None, 'GET', (), {}, 200, None),
+        ('catalogue search', 'book_list', None, 'GET', (), {'q': data['book_word']}, 200, None),
+        ('catalogue by author', 'book_list', None, 'GET', (), {'author': data['author']}, 200, 'author'),
+        ('book detail', 'book_detail', None, 'GET', (data['book'],), {}, 200, 'book'),
+        ('add book form', 'add_book', 'staff', 'GET', (), {}, 200, None),
+        ('add author form', 'add_author', 'staff', 'GET', (), {}, 200, None),
+        ('edit book form', 'edit_book', 'staff', 'GET', (data['book'],), {}, 200, 'book'),
+        ('borrow', 'library_borrow_book', 'staff', 'POST', (data['available_book'],),
+         {'student': data['student']}, 302, 'borrow'),
+        ('return', 'library_return_loan', 'staff', 'POST', (data['open_loan'],), {}, 302, 'loan'),
+        ('student picker', 'student_autocomplete', 'staff', 'GET', (), {'q': 'n'}, 200, None),
+        ('author picker', 'author_autocomplete', 'staff', 'GET', (), {'q': 'g'}, 200, None),
+        ('loan reports', 'library_loan_reports', 'staff', 'GET', (), {}, 200, None),
+        ('request metrics', 'library_request_metrics', 'staff', 'GET', (), {}, 200, None),
+        ('api books', 'api_book_list', None, 'GET', (), {}, 200, None),
+        ('api book detail', 'api_book_detail', None, 'GET', (data['book'],), {}, 200, 'book'),
+        ('api authors', 'api_author_list', None, 'GET', (), {}, 200, None),
+        ('api open loans', 'api_loan_list', None, 'GET', (), {'open': '1'}, 200, None),
+        ('posts', 'all_post', None, 'GET', (), {}, 200, None),
+        ('post search', 'search_posts', None, 'GET', (), {'q': data['post_word']}, 200, None),
+        ('post detail', 'detail_post', None, 'GET', (data['post'],), {}, 200, 'post'),
+        ('add post form', 'add_post', None, 'GET', (), {}, 200, None),
+        ('add post', 'add_post', None, 'POST', (),
+         {'title': 'Benchmark post', 'content': 'gamarjoba ' * 200}, 302, None),
+        ('edit post form', 'edit_post', None, 'GET', (data['post'],), {}, 200, 'post'),
+        ('delete post', 'delete_post', None, 'POST', (data['post'],), {}, 302, 'post'),
+        ('register form', 'register', None, 'GET', (), {}, 200, None),
+        ('register', 'register', None, 'POST', (),
+         {'username': 'bench-new', 'email': 'bench-new@example.com', 'password1': PASSWORD,
+          'password2': PASSWORD}, 302, None),
+        ('login form', 'login', None, 'GET', (), {}, 200, None),
+        ('login', 'login', None, 'POST', (), {'username': 'bench-user', 'password': PASSWORD}, 302, None),
+        ('logout', 'logout', 'user', 'POST', (), {}, 302, None),
+        ('profile', 'profile', 'user', 'GET', (), {}, 200, None),
+    ]
+    return [(label, route, user, method, reverse(route, args=args), form, status)
+            for label, route, user, method, args, form, status, need in table
+            if need is None or needs[need]]
+
+
+def compare(baseline, candidate, threshold, stdout=None):
+    # -> [regression], every scenario present in both result files
+    regressions = []
+
+    def check(label, metric, old, new, min_delta):
+        ratio = new / old if old else float('inf') if new else 1.0
+        if ratio > threshold and new - old > min_delta:
+            regressions.append(f'{label}: {metric} {old} -> {new} ({ratio:.2f}x)')
+        return ratio
+
+    for size, routes in candidate['results'].items():
+        for label, new in routes.items():
+            old = baseline['results'].get(size, {}).get(label)
+            if old is None:
+                continue
+            name = f'{size} / {label}'
+            ratios = [check(name, f'latency {p}', old['latency_us'][p], new['latency_us'][p], MIN_DELTA_US)
+                      for p in ('p50', 'p95')]
+            check(name, 'db time p50', old['db_time_us']['p50'], new['db_time_us']['p50'], MIN_DELTA_US)
+            check(name, 'peak memory', old['peak_memory_kb'], new['peak_memory_kb'], MIN_DELTA_KB)
+            # query counts don't jitter: any increase is a regression
+            if new['queries']['max'] > old['queries']['max']:
+                regressions.append(f"{name}: queries {old['queries']['max']} -> {new['queries']['max']}")
+            if stdout:
+                stdout.write(f"{size:<8} {label:<22} p50 {ratios[0]:5.2f}x  p95 {ratios[1]:5.2f}x  "
+                             f"queries {old['queries']['max']:>3} -> {new['queries']['max']:<3}")
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Benchmark every library, post and account route through the test client on seeded databases '
+            'of several sizes; JSON results and a regression check against a baseline file.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', action='append', dest='sizes', choices=[*SIZES, 'current'],
+                            help='dataset, repeatable (default: small and medium)')
+        parser.add_argument('--requests', type=int, default=30, help='timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--cold', action='store_true',
+                            help='clear the cache before every request: no cached pages, fragments or sessions')
+        parser.add_argument('--route', action='append', dest='labels', help='only these scenarios, repeatable')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='write the results to this JSON file')
+        parser.add_argument('--baseline', help='results of an earlier run to compare with')
+        parser.add_argument('--candidate', help='compare this results file with --baseline instead of running')
+        parser.add_argument('--threshold', type=float, default=1.25,
+                            help='slowdown factor against the baseline that counts as a regression')
+
+    def handle(self, *args, **options):
+        if options['candidate']:
+            if not options['baseline']:
+                raise CommandError('--candidate needs a --baseline to compare with')
+            self.check_regressions(options, self.load(options['candidate']))
+            return
+
+        results = {
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'requests': options['requests'],
+            'cold': options['cold'],
+            'results': {},
+        }
+        # throttling would turn the login/register scenarios into 429s
+        with override_settings(ACCOUNTS_RATELIMIT_ENABLED=False):
+            for size in options['sizes'] or ['small', 'medium']:
+                results['results'][size] = self.run_size(size, options)
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2) + '\n')
+            self.stdout.write(f"Results written to {options['output']}")
+        if options['baseline']:
+            self.check_regressions(options, results)
+
+    def load(self, path):
+        try:
+            return json.loads(Path(path).read_text())
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'cannot read results {path}: {exc}')
+
+    def check_regressions(self, options, candidate):
+        baseline = self.load(options['baseline'])
+        self.stdout.write(f"Against {options['baseline']} (commit {baseline.get('commit') or '?'}):")
+        if baseline.get('cold') != candidate.get('cold'):
+            self.stdout.write(self.style.WARNING('one run is --cold and the other is not, the numbers differ anyway'))
+        regressions = compare(baseline, candidate, options['threshold'], self.stdout)
+        if regressions:
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(f'REGRESSION  {regression}'))
+            raise CommandError(f'{len(regressions)} regressions over {options["threshold"]}x the baseline')
+        self.stdout.write(self.style.SUCCESS('No regressions'))
+
+    def run_size(self, size, options):
+        if size == 'current':
+            return self.run_scenarios(size, options)
+        old_name = connection.settings_dict['NAME']
+        # a throwaway database, never the configured one
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            started = time.perf_counter()
+            out = self.stdout if options['verbosity'] > 1 else StringIO()
+            call_command('seed_data', seed=options['seed'], stdout=out, **SIZES[size])
+            self.stdout.write(f'{size}: seeded in {time.perf_counter() - started:.0f}s')
+            return self.run_scenarios(size, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run_scenarios(self, size, options):
+        cache.clear()
+        maintenance.invalidate()
+        User.objects.filter(username__in=['bench-user', 'bench-staff', 'bench-new']).delete()
+        self.users = {
+            'user': User.objects.create_user('bench-user', password=PASSWORD),
+            'staff': User.objects.create_superuser('bench-staff', password=PASSWORD),
+        }
+        self.host = next((host for host in settings.ALLOWED_HOSTS if host not in ('*', '')), 'localhost')
+        selected = scenarios(fixtures())
+        if options['labels']:
+            selected = [scenario for scenario in selected if scenario[0] in options['labels']]
+        else:
+            missing = route_names() - {scenario[1] for scenario in selected}
+            if missing:
+                self.stdout.write(self.style.WARNING(f'{size}: not benchmarked: {", ".join(sorted(missing))}'))
+
+        self.stdout.write(f"{size:<8} {'scenario':<22} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                          f"{'queries':>7} {'db ms':>7} {'peak KB':>8}")
+        results = {}
+        try:
+            for scenario in selected:
+                result = results[scenario[0]] = self.measure(scenario, options)
+                latency, db_time = result['latency_us'], result['db_time_us']
+                self.stdout.write(
+                    f"{size:<8} {scenario[0]:<22} {latency['p50'] / 1000:8.2f} {latency['p95'] / 1000:8.2f} "
+                    f"{latency['p99'] / 1000:8.2f} {result['queries']['max']:7d} {db_time['p50'] / 1000:7.2f} "
+                    f"{result['peak_memory_kb']:8d}"
+                )
+        finally:
+            User.objects.filter(username__in=['bench-user', 'bench-staff']).delete()
+        return results
+
+    def client(self, user):
+        client = Client(HTTP_HOST=self.host.lstrip('.'))
+        if user:
+            client.force_login(self.users[user])
+        return client
+
+    def request(self, client, method, path, data):
+        if method == 'GET':
+            return client.get(path, data)
+        # every request sees the same data
+        with transaction.atomic():
+            response = client.post(path, data)
+            transaction.set_rollback(True)
+        return response
+
+    def measure(self, scenario, options):
+        label, route, user, method, path, data, expected = scenario
+        requests, warmup = options['requests'], options['warmup']
+        stats = RouteStats()
+        shared = self.client(user)
+        response = None
+        counted = [0, 0]  # queries, database time in ns
+
+        def count(execute, sql, params, many, context):
+            start = time.perf_counter_ns()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                counted[0] += 1
+                counted[1] += time.perf_counter_ns() - start
+
+        for i in range(warmup + requests + 1):
+            # a write changes the session (login, logout): a fresh client each time, made untimed
+            client = self.client(user) if method == 'POST' else shared
+            if options['cold']:
+                cache.clear()
+            counted[:] = [0, 0]
+            last = i == warmup + requests
+            if last:
+                tracemalloc.start()
+            with connection.execute_wrapper(count):
+                start = time.perf_counter_ns()
+                response = self.request(client, method, path, data)
+                elapsed = time.perf_counter_ns() - start
+            if last:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            if response.status_code != expected:
+                raise CommandError(f'{label}: {method} {path} returned {response.status_code}, expected {expected}')
+            if warmup <= i < warmup + requests:
+                stats.latency_us.record(elapsed // 1000)
+                stats.queries.record(counted[0])
+                stats.db_time_us.record(counted[1] // 1000)
+
+        return {
+            'route': route,
+            'method': method,
+            'user': user,
+            'status': response.status_code,
+            'bytes': len(response.content) if not response.streaming else None,
+            **stats.summary(),
+            'peak_memory_kb': peak // 1024,
+        }
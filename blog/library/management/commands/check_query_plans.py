@@ -0,0 +1,134 @@
+import re
+from datetime import timedelta
+
+from django.contrib import admin
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.utils import timezone
+
+from library import names, reports
+from library.api.views import _loans
+from library.models import Author, Book, DailyBookStat, Loan, Student
+from library.pagination import keyset_filter
+from library.views import BookListView
+
+# EXPLAIN for every hot query of the library, built the way the views and admin build them.
+# A query fails when its plan reads a whole table. Ordered index scans are fine: they stop
+# after LIMIT rows. Sorts of a filtered result are reported but don't fail.
+#
+# Substring search (admin search_fields, icontains -> LIKE '%...%') can't use a b-tree
+# index and is not checked.
+#
+# On PostgreSQL sequential scans are disabled for the check, otherwise the planner prefers
+# them on small tables; a Seq Scan then means no index can serve the query at all.
+
+PAGE = 25
+ADMIN_PAGE = 100
+
+SQLITE_SCAN = re.compile(r'\bSCAN (?!CONSTANT ROW)(\S+)(?!.*\bUSING\b)(?!.*VIRTUAL TABLE)')
+SQLITE_SORT = re.compile(r'USE TEMP B-TREE FOR (?:RIGHT PART OF )?ORDER BY')
+POSTGRES_SCAN = re.compile(r'Seq Scan on (\S+)')
+POSTGRES_SORT = re.compile(r'^\s*(?:->\s*)?(?:Incremental )?Sort\b', re.MULTILINE)
+
+
+def catalogue(params, cursor=None):
+    view = BookListView()
+    view.setup(RequestFactory().get('/library/', params))
+    ordering = view.get_ordering()
+    queryset = view.get_queryset().order_by(*ordering)
+    if cursor:
+        queryset = queryset.filter(keyset_filter(ordering, cursor))
+    return queryset[:PAGE + 1]
+
+
+def picker(model, q, cursor=None):
+    ordering = ('search_name', 'id')
+    queryset = model.objects.filter(names.prefix_filter(q)).order_by(*ordering)
+    if cursor:
+        queryset = queryset.filter(keyset_filter(ordering, cursor))
+    return queryset[:PAGE + 1]
+
+
+def changelist(model, **filters):
+    # the rows query of the changelist: ModelAdmin ordering plus the -pk tie breaker
+    model_admin = admin.site._registry[model]
+    request = RequestFactory().get('/admin/')
+    ordering = list(model_admin.get_ordering(request) or ())
+    if not {'pk', '-pk', 'id', '-id'} & set(ordering):
+        ordering.append('-pk')
+    return model_admin.get_queryset(request).filter(**filters).order_by(*ordering)[:ADMIN_PAGE]
+
+
+def queries():
+    since = timezone.now() - timedelta(days=7)
+    return [
+        ('catalogue', lambda: catalogue({})),
+        ('catalogue, next page', lambda: catalogue({}, ['M', 1])),
+        ('catalogue by author', lambda: catalogue({'author': '1'})),
+        ('catalogue by author, next page', lambda: catalogue({'author': '1'}, ['M', 1])),
+        # a search page is ranked by the full-text index, then only its books are loaded
+        ('catalogue search, books of a page',
+         lambda: Book.objects.select_related('author', 'current_loan__student').filter(id__in=[1, 2, 3])),
+        ('tags of a page', lambda: Book.tags.through.objects.filter(book_id__in=[1, 2, 3])),
+        ('available books', lambda: Book.objects.available().order_by('title', 'id')[:PAGE]),
+        ('book detail', lambda: Book.objects.select_related('author', 'current_loan__student').filter(pk=1)),
+        ('borrow: open loan of a book', lambda: Loan.objects.filter(book_id=1, returned_at__isnull=True)),
+        ('return: open loan', lambda: Loan.objects.filter(pk=1, returned_at__isnull=True)),
+        ('loans of a book', lambda: Loan.objects.filter(book_id=1).order_by('-id')[:PAGE]),
+        ('loans of a student', lambda: Loan.objects.filter(student_id=1).order_by('-id')[:PAGE]),
+        ('api open loans', lambda: _loans(RequestFactory().get('/', {'open': '1'})).order_by('-id')[:PAGE]),
+        ('api authors', lambda: Author.objects.order_by('name', 'id')[:PAGE]),
+        ('student picker', lambda: picker(Student, 'nino')),
+        ('student picker, next page', lambda: picker(Student, 'nino', ['nino b', 1])),
+        ('author picker', lambda: picker(Author, 'rust')),
+        ('BookAdmin', lambda: changelist(Book)),
+        ('BookAdmin, active', lambda: changelist(Book, is_active=True)),
+        ('BookAdmin, year', lambda: changelist(Book, published_year=1990)),
+        ('BookAdmin, author', lambda: changelist(Book, author_id=1)),
+        ('LoanAdmin', lambda: changelist(Loan)),
+        ('LoanAdmin, past 7 days', lambda: changelist(Loan, borrowed_at__gte=since)),
+        ('LoanAdmin, not returned', lambda: changelist(Loan, returned_at__isnull=True)),
+        ('StudentAdmin', lambda: changelist(Student)),
+        ('StudentAdmin, grade', lambda: changelist(Student, grade=5)),
+        ('overdue loans', lambda: Loan.objects.filter(returned_at__isnull=True, borrowed_at__lt=since)
+         .order_by('borrowed_at')[:PAGE]),
+        ('returns of a day', lambda: Loan.objects.filter(returned_at__gte=since, returned_at__lt=timezone.now())),
+        ('report: book aggregates', lambda: DailyBookStat.objects.filter(day__range=reports.period(30))),
+    ]
+
+
+def explain(queryset):
+    # -> (plan text, tables read in full, sorts)
+    if connection.vendor == 'sqlite':
+        plan = queryset.explain()
+        return plan, SQLITE_SCAN.findall(plan), SQLITE_SORT.findall(plan)
+    if connection.vendor == 'postgresql':
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+        return plan, POSTGRES_SCAN.findall(plan), POSTGRES_SORT.findall(plan)
+    raise CommandError(f'no plan checks for {connection.vendor}')
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the hot library queries and fail if one of them reads a whole table (-v 2 prints the plans).'
+
+    def handle(self, *args, **options):
+        failed = []
+        for label, build in queries():
+            plan, scans, sorts = explain(build())
+            if scans:
+                failed.append(label)
+                self.stdout.write(self.style.ERROR(f'FULL SCAN  {label}: {", ".join(scans)}'))
+            elif sorts:
+                self.stdout.write(self.style.WARNING(f'sort       {label}'))
+            else:
+                self.stdout.write(f'ok         {label}')
+            if options['verbosity'] > 1:
+                self.stdout.write('    ' + plan.replace('\n', '\n    '))
+
+        if failed:
+            raise CommandError(f'{len(failed)} queries read a whole table: {", ".join(failed)}')
+        self.stdout.write(self.style.SUCCESS('No full table scans'))
@@ -0,0 +1,59 @@
+import sys
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from library.catalogue_io import RowWriter, chunked, detect_format
+from library.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Stream the catalogue to CSV or JSONL without loading it into memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="file to write, or - for stdout")
+        parser.add_argument('--format', choices=['csv', 'jsonl'])
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = detect_format(path, options['format'])
+        chunk_size = options['chunk_size']
+
+        rows = (Book.objects.order_by('id')
+                .values_list('id', 'title', 'author__name', 'published_year', 'is_active')
+                .iterator(chunk_size=chunk_size))
+
+        stream = sys.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+        started = time.perf_counter()
+        count = 0
+        try:
+            writer = RowWriter(stream, fmt)
+            for chunk in chunked(rows, chunk_size):
+                # one query for the tags of the whole chunk
+                tags = defaultdict(list)
+                tag_rows = (Book.tags.through.objects
+                            .filter(book_id__in=[row[0] for row in chunk])
+                            .order_by('tag__name')
+                            .values_list('book_id', 'tag__name'))
+                for book_id, name in tag_rows:
+                    tags[book_id].append(name)
+
+                for book_id, title, author, published_year, is_active in chunk:
+                    writer.write({
+                        'id': book_id,
+                        'title': title,
+                        'author': author,
+                        'published_year': published_year,
+                        'is_active': is_active,
+                        'tags': tags[book_id],
+                    })
+                count += len(chunk)
+                self.stderr.write(f'  {count} rows')
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+
+        elapsed = time.perf_counter() - started
+        self.stderr.write(self.style.SUCCESS(f'Exported {count} books in {elapsed:.1f}s'))
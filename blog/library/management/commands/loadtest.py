@@ -0,0 +1,110 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.metrics import Histogram
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test running servers: requests/s and latency percentiles per URL. '
+        'Serve the project under WSGI and ASGI with the same number of workers, e.g. '
+        '"gunicorn blog.wsgi -w 4 -b 127.0.0.1:8001" and '
+        '"uvicorn blog.asgi:application --workers 4 --port 8002", '
+        'then pass both base URLs to compare them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_urls', nargs='+', help='e.g. http://127.0.0.1:8001')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='path to request, repeatable (default: the catalogue read views)')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=10.0)
+        parser.add_argument('--warmup', type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or ['/library/', '/library/1/', '/library/api/v1/books/', '/posts/']
+        self.stdout.write(f"{'server':<28} {'path':<26} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+                          f"{'p99 ms':>8} {'max ms':>8} {'errors':>7}")
+        for base_url in options['base_urls']:
+            url = urlsplit(base_url)
+            if url.scheme != 'http' or not url.hostname:
+                raise CommandError(f'expected a plain http:// base URL, got {base_url!r}')
+            for path in paths:
+                rate, latency, errors = asyncio.run(self.run(
+                    url.hostname, url.port or 80, path, options['concurrency'],
+                    options['duration'], options['warmup'],
+                ))
+                summary = latency.summary()
+                self.stdout.write(
+                    f"{base_url:<28} {path:<26} {rate:8.0f} {summary['p50'] / 1000:8.1f} "
+                    f"{summary['p95'] / 1000:8.1f} {summary['p99'] / 1000:8.1f} "
+                    f"{summary['max'] / 1000:8.1f} {errors:7d}"
+                )
+
+    async def run(self, host, port, path, concurrency, duration, warmup):
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+        except OSError as exc:
+            raise CommandError(f'cannot connect to {host}:{port}: {exc}')
+        writer.close()
+
+        latency = Histogram()  # microseconds
+        errors = [0]
+        start = time.monotonic()
+        measure_from = start + warmup
+        deadline = measure_from + duration
+
+        async def client():
+            request = f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n'.encode()
+            reader = writer = None
+            while time.monotonic() < deadline:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(host, port)
+                sent = time.perf_counter_ns()
+                try:
+                    writer.write(request)
+                    status, keep_alive = await read_response(reader)
+                except (OSError, asyncio.IncompleteReadError, ValueError):
+                    status, keep_alive = 0, False
+                elapsed = time.perf_counter_ns() - sent
+                if time.monotonic() >= measure_from:
+                    latency.record(elapsed // 1000)
+                    if not 200 <= status < 400:
+                        errors[0] += 1
+                if not keep_alive:
+                    writer.close()
+                    writer = None
+            if writer is not None:
+                writer.close()
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        return latency.total / duration, latency, errors[0]
+
+
+async def read_response(reader):
+    # -> (status, keep_alive); reads and discards the body
+    status_line = await reader.readuntil(b'\r\n')
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readuntil(b'\r\n')
+        if line == b'\r\n':
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip().lower()
+
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif status not in (204, 304):
+        await reader.read()
+        return status, False
+    return status, headers.get('connection') != 'close'
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from library import reports
+
+
+class Command(BaseCommand):
+    help = 'Print the circulation report: overdue loans, most borrowed books and authors, students, grades and tags.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30)
+        parser.add_argument('--limit', type=int, default=10)
+
+    def section(self, title, rows, line):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{title} ({len(rows)})'))
+        for row in rows:
+            self.stdout.write('  ' + line(row))
+
+    def handle(self, *args, **options):
+        report = reports.circulation(options['days'], options['limit'])
+        self.stdout.write(f'{report["start"]} - {report["end"]}, loan period {report["loan_days"]} days')
+
+        self.section('Overdue', report['overdue'],
+                     lambda loan: f'{loan.borrowed_at:%Y-%m-%d}  {loan.book.title} - {loan.student.full_name}')
+        self.section('Books', report['books'], lambda row: f'{row["loans"]:6}  {row["title"]}')
+        self.section('Authors', report['authors'], lambda row: f'{row["loans"]:6}  {row["name"]}')
+        self.section('Students', report['students'],
+                     lambda row: f'{row["loans"]:6}  {row["name"]} ({row["grade"]}), '
+                                 f'{row["returns"]} returned, {row["late_returns"]} late')
+        self.section('Grades', report['grades'],
+                     lambda row: f'{row["grade"]!s:>6}  {row["students"]} students, {row["loans"]} loans, '
+                                 f'{row["late_returns"]} late')
+        self.section('Tags', report['tags'],
+                     lambda row: f'{row["loans"]:6}  {row["name"]}, {row["on_loan"]}/{row["books"]} on loan '
+                                 f'({row["utilisation"]:.0%})')
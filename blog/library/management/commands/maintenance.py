@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from library import maintenance
+from library.models import MaintenanceMode
+
+
+class Command(BaseCommand):
+    help = 'Turn maintenance mode on or off at runtime, for the whole site or a path prefix.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('state', choices=['on', 'off', 'status'])
+        parser.add_argument('--prefix', default='/', help="path prefix, e.g. /library/ (default: whole site)")
+
+    def handle(self, *args, **options):
+        if options['state'] != 'status':
+            maintenance.set_enabled(options['prefix'], options['state'] == 'on')
+
+        rows = MaintenanceMode.objects.order_by('path_prefix')
+        if not rows:
+            self.stdout.write('maintenance: off')
+        for row in rows:
+            self.stdout.write(f"{row.path_prefix}: {'on' if row.is_enabled else 'off'} (since {row.updated_at:%Y-%m-%d %H:%M})")
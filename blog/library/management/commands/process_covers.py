@@ -0,0 +1,57 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from library import covers
+from library.models import Book
+
+
+def _init_worker():
+    # spawned workers start without Django, forked ones must not share the parent's connections
+    django.setup()
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Generate the resized cover variants of existing books in parallel.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--all', action='store_true',
+                            help='also books whose cover was already processed (missing files are regenerated)')
+
+    def handle(self, *args, **options):
+        books = Book.objects.exclude(cover='').exclude(cover__isnull=True)
+        if not options['all']:
+            books = books.filter(cover_hash='')
+        book_ids = list(books.order_by('id').values_list('id', flat=True))
+
+        started = time.perf_counter()
+        if options['workers'] > 1 and len(book_ids) > 1:
+            connections.close_all()
+            with ProcessPoolExecutor(options['workers'], initializer=_init_worker) as pool:
+                results = pool.map(covers.process_cover, book_ids, chunksize=8)
+                processed = self.report(zip(book_ids, results), len(book_ids))
+        else:
+            processed = self.report(((book_id, covers.process_cover(book_id)) for book_id in book_ids),
+                                    len(book_ids))
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {processed} of {len(book_ids)} covers in {elapsed:.1f}s'
+        ))
+
+    def report(self, results, total):
+        processed = 0
+        for done, (book_id, variants) in enumerate(results, 1):
+            if variants is None:
+                self.stderr.write(f'  book {book_id}: skipped')
+            else:
+                processed += 1
+            if done % 100 == 0:
+                self.stdout.write(f'  {done}/{total}')
+        return processed
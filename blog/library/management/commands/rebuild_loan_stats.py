@@ -0,0 +1,27 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library import reports
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily loan aggregates behind library.reports from the loans.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=date.fromisoformat, help='first day (YYYY-MM-DD), default: the first loan')
+        parser.add_argument('--until', type=date.fromisoformat, help='last day (YYYY-MM-DD), default: today')
+        parser.add_argument('--window', type=int, default=31, help='days per transaction')
+
+    def handle(self, *args, **options):
+        if options['window'] < 1:
+            raise CommandError('--window must be at least 1')
+        if options['since'] and options['until'] and options['since'] > options['until']:
+            raise CommandError('--since is after --until')
+
+        def progress(start, end, written):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {start} - {end}: {written} rows')
+
+        written = reports.rebuild(options['since'], options['until'], options['window'], progress)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} aggregate rows'))
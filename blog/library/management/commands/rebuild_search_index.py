@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from library import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the library full-text search index from scratch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def progress(done, total):
+            self.stdout.write(f'  indexed up to id {done}/{total}')
+
+        count = search.rebuild_index(batch_size=options['batch_size'], progress=progress)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} books in {elapsed:.2f}s'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef, Subquery
+
+from library import caching
+from library.models import Book, Loan
+
+
+class Command(BaseCommand):
+    help = 'Fix Book.current_loan values that drifted from the actual open loans.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        open_loan = Loan.objects.filter(book=OuterRef('pk'), returned_at__isnull=True).values('id')[:1]
+        books = (Book.objects.annotate(expected=Subquery(open_loan))
+                 .values_list('id', 'current_loan_id', 'expected')
+                 .order_by('id'))
+
+        drift = [(book_id, expected) for book_id, current, expected
+                 in books.iterator(chunk_size=options['batch_size'])
+                 if current != expected]
+
+        for book_id, expected in drift:
+            self.stdout.write(f'  book {book_id}: current_loan -> {expected}')
+            if not options['dry_run']:
+                Book.objects.filter(pk=book_id).update(current_loan_id=expected)
+        if drift and not options['dry_run']:
+            # update() sends no signals: the cached cards and list pages of these books
+            caching.bump_books(book_id for book_id, _ in drift)
+
+        verb = 'Found' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {len(drift)} drifted books'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from library import metrics
+
+
+class Command(BaseCommand):
+    help = 'Show per-route p50/p95/p99 latency, query count and DB time from the running workers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='delete the dumped histograms')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            for path in metrics.metrics_dir().glob('*.json'):
+                path.unlink(missing_ok=True)
+            self.stdout.write(self.style.SUCCESS('Request metrics reset'))
+            return
+
+        routes = metrics.collect()
+        if not routes:
+            self.stdout.write(f'No request metrics in {metrics.metrics_dir()}')
+            return
+
+        header = f"{'route':40} {'count':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'q p95':>6} {'db p95 ms':>10}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for route, stats in routes.items():
+            latency = stats['latency_us']
+            self.stdout.write(
+                f"{route[:40]:40} {latency['count']:>8} "
+                f"{latency['p50'] / 1000:>8.2f} {latency['p95'] / 1000:>8.2f} {latency['p99'] / 1000:>8.2f} "
+                f"{stats['queries']['p95']:>6} {stats['db_time_us']['p95'] / 1000:>10.2f}"
+            )
@@ -0,0 +1,350 @@
+import itertools
+import math
+import multiprocessing
+import random
+from bisect import bisect
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from djangoapp import search as post_search
+from djangoapp.models import Post, summarize
+from library import caching, names, reports, search
+from library.models import Author, Book, Loan, Student, Tag
+
+# Synthetic library and blog data for load tests, deterministic from --seed:
+#
+#   authors   Georgian-looking names; books per author Zipf distributed
+#   books     published years skewed to recent decades; tags per book Zipf distributed
+#             (most books have one or two, few have many), and so is tag popularity
+#   students  grades 1-12, a few of them borrow far more than the rest
+#   loans     --years of history, loans per book Zipf distributed (at most one a day).
+#             The loans of a book follow each other without overlapping, most are
+#             returned within the loan period, some late; the last loan of --open-share
+#             of the books is still open
+#   posts     Zipf vocabulary, dates spread evenly over the same history
+#
+# Everything goes in with bulk_create, one transaction per --batch-size rows. Loans are
+# generated and written by --workers processes, BOOKS_PER_TASK books at a time, each
+# block from its own seed: any number of workers produces the same rows (only the ids
+# differ). The workers also rebuild the loan report aggregates, a range of days each.
+# Denormalised state - Book.current_loan, the search indexes, the aggregates - is rebuilt
+# at the end, as bulk_create sends no signals.
+#
+# SQLite takes one writer at a time, so there the workers mostly parallelise building
+# the rows; they wait for each other's transactions (busy_timeout) instead of failing.
+
+BOOKS_PER_TASK = 500
+ZIPF_S = 1.1
+SQLITE_BUSY_TIMEOUT_MS = 10 * 60 * 1000
+
+FIRST_NAMES = ('Nino', 'Giorgi', 'Mariam', 'Luka', 'Ana', 'Davit', 'Elene', 'Levan', 'Tamar', 'Irakli',
+               'Salome', 'Nika', 'Keti', 'Sandro', 'Natia', 'Zurab', 'Eka', 'Lasha', 'Maia', 'Otar')
+LAST_STEMS = ('Berid', 'Lomid', 'Kapanad', 'Tsereteli', 'Javakhishvil', 'Chavchavad', 'Gelashvil',
+              'Abashid', 'Kvaratskhel', 'Mchedlishvil', 'Dumbad', 'Amirejib', 'Gogolad', 'Shengelia')
+LAST_ENDINGS = ('ze', 'shvili', 'ia', 'ani', 'ava', 'eli')
+TITLE_WORDS = ('Mountain', 'River', 'Letters', 'Summer', 'Stone', 'Wine', 'Garden', 'Road', 'Night', 'Sea',
+               'Bread', 'Song', 'Winter', 'City', 'Bridge', 'Fire', 'Tower', 'Valley', 'Sun', 'Glass')
+TAG_WORDS = ('novel', 'poetry', 'history', 'science', 'drama', 'classic', 'children', 'travel', 'art',
+             'philosophy', 'biography', 'mystery', 'fantasy', 'essays', 'music', 'nature', 'war', 'myth')
+
+
+def zipf_weights(count, s=ZIPF_S):
+    return [1 / rank ** s for rank in range(1, count + 1)]
+
+
+def cumulative(weights):
+    return list(itertools.accumulate(weights))
+
+
+def pick(rng, values, cum_weights):
+    return values[bisect(cum_weights, rng.random() * cum_weights[-1])]
+
+
+def spread(total, weights, most):
+    # `total` split in proportion to `weights`, none above `most`; what the capped ones
+    # can't take goes to the others
+    counts = [0] * len(weights)
+    free = range(len(weights))
+    while free and total > 0:
+        scale = total / sum(weights[i] for i in free)
+        capped = {i for i in free if weights[i] * scale >= most}
+        if not capped:
+            for i in free:
+                counts[i] = round(weights[i] * scale)
+            break
+        for i in capped:
+            counts[i] = most
+        total -= most * len(capped)
+        free = [i for i in free if i not in capped]
+    return counts
+
+
+def person_name(rng):
+    stem = rng.choice(LAST_STEMS)
+    last = stem + rng.choice(LAST_ENDINGS) if stem.endswith(('d', 'l')) else stem
+    return f'{rng.choice(FIRST_NAMES)} {last}'
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+@contextmanager
+def explicit_dates(*fields):
+    # bulk_create would overwrite auto_now(_add) fields with the current time
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field, _, _ in saved:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+# -- the worker side; set before the pool forks
+
+_students = None
+
+
+def _init_worker():
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}')
+
+
+def book_loans(seed, block, start, end, loan_days, books):
+    # [Loan] of one block of (book id, number of loans, last one open)
+    student_ids, student_cum = _students
+    rng = random.Random(f'{seed}:loans:{block}')
+    span = (end - start).total_seconds()
+    loans = []
+    for book_id, count, is_open in books:
+        slot = span / count if count else 0
+        for i in range(count):
+            # some time on the shelf, then a loan that mostly ends within the loan period
+            gap = rng.uniform(0, slot * 0.3)
+            borrowed = start + timedelta(seconds=slot * i + gap)
+            days = rng.uniform(loan_days, loan_days * 3) if rng.random() < 0.15 else rng.uniform(1, loan_days)
+            duration = max(min(days * 86400, slot - gap - 1), 60)
+            returned = None if is_open and i == count - 1 else borrowed + timedelta(seconds=duration)
+            loans.append(Loan(book_id=book_id, student_id=pick(rng, student_ids, student_cum),
+                              borrowed_at=borrowed, returned_at=returned))
+    return loans
+
+
+def write_loans(task):
+    *args, batch_size = task
+    loans = book_loans(*args)
+    with explicit_dates(Loan._meta.get_field('borrowed_at')):
+        for batch in _batched(loans, batch_size):
+            with transaction.atomic():
+                Loan.objects.bulk_create(batch)
+    return len(loans)
+
+
+def rebuild_stats(days):
+    return reports.rebuild(*days)
+
+
+class Command(BaseCommand):
+    help = ('Fill an empty database with synthetic authors, books, tags, students, loan history and '
+            'posts, deterministic from --seed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--authors', type=int, default=2_000)
+        parser.add_argument('--books', type=int, default=50_000)
+        parser.add_argument('--tags', type=int, default=300)
+        parser.add_argument('--max-tags', type=int, default=8, help='tags of one book at most')
+        parser.add_argument('--students', type=int, default=5_000)
+        parser.add_argument('--loans', type=int, default=500_000)
+        parser.add_argument('--years', type=float, default=3.0, help='length of the loan history')
+        parser.add_argument('--until', type=date.fromisoformat, help='end of the history, default: today')
+        parser.add_argument('--open-share', type=float, default=0.1, help='share of the books on loan now')
+        parser.add_argument('--posts', type=int, default=10_000)
+        parser.add_argument('--post-words', type=int, default=300)
+        parser.add_argument('--batch-size', type=int, default=5_000)
+        parser.add_argument('--workers', type=int, default=1,
+                            help='processes writing loans and aggregates, 0: one per CPU')
+        parser.add_argument('--skip-stats', action='store_true',
+                            help="don't rebuild the loan report aggregates (rebuild_loan_stats can do it later)")
+
+    def handle(self, *args, **options):
+        if Book.objects.exists() or Student.objects.exists() or Post.objects.exists():
+            raise CommandError('seed_data expects an empty database (manage.py flush)')
+        self.options = options
+        self.seed = options['seed']
+        self.batch_size = options['batch_size']
+        self.workers = options['workers'] or multiprocessing.cpu_count()
+        # midnight, so the same seed and day give the same rows
+        self.end = timezone.make_aware(datetime.combine(options['until'] or timezone.localdate(), time.min))
+        self.start = self.end - timedelta(days=365 * options['years'])
+        started = perf_counter()
+
+        authors = self.step('authors', self.seed_authors)
+        tags = self.step('tags', self.seed_tags)
+        books = self.step('books', lambda: self.seed_books(authors, tags))
+        students = self.step('students', self.seed_students)
+        self.prepare_students(students)
+
+        pool = None
+        if self.workers > 1:
+            # forked children must not share our connections
+            connections.close_all()
+            pool = multiprocessing.get_context('fork').Pool(self.workers, _init_worker)
+        try:
+            self.step('loans', lambda: self.seed_loans(pool, books))
+            self.step('posts', self.seed_posts)
+            self.step('search indexes', lambda: search.rebuild_index() + post_search.rebuild_index())
+            if not options['skip_stats']:
+                self.step('loan report aggregates', lambda: self.seed_stats(pool))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        caching.bump_catalogue()
+        caching.bump_names(Author)
+        caching.bump_names(Student)
+        self.stdout.write(self.style.SUCCESS(f'Done in {perf_counter() - started:.1f}s'))
+
+    def step(self, label, func):
+        started = perf_counter()
+        result = func()
+        count = result if isinstance(result, int) else len(result)
+        self.stdout.write(f'{label:<24} {count:>10}  {perf_counter() - started:7.1f}s')
+        return result
+
+    def create(self, model, objects):
+        # -> primary keys, in order
+        ids = []
+        for batch in _batched(objects, self.batch_size):
+            with transaction.atomic():
+                ids.extend(obj.pk for obj in model.objects.bulk_create(batch))
+        return ids
+
+    def seed_authors(self):
+        rng = random.Random(f'{self.seed}:authors')
+        return self.create(Author, (
+            names.fill(Author(name=person_name(rng), birth_year=rng.randint(1800, 2000)))
+            for _ in range(self.options['authors'])
+        ))
+
+    def seed_tags(self):
+        count = self.options['tags']
+        words = [f'{word}-{n}' if n else word
+                 for n in range(math.ceil(count / len(TAG_WORDS))) for word in TAG_WORDS]
+        return self.create(Tag, (Tag(name=name) for name in words[:count]))
+
+    def seed_books(self, authors, tags):
+        rng = random.Random(f'{self.seed}:books')
+        # which authors and tags are the popular ones is random, their weights are Zipf
+        rng.shuffle(authors)
+        rng.shuffle(tags)
+        author_cum, tag_weights = cumulative(zipf_weights(len(authors))), zipf_weights(len(tags))
+        tag_counts = list(range(1, min(self.options['max_tags'], len(tags)) + 1))
+        tag_count_cum = cumulative(zipf_weights(len(tag_counts)))
+
+        def books():
+            for i in range(self.options['books']):
+                year = self.end.year - int(rng.expovariate(1 / 25))
+                yield Book(
+                    title=f"{' '.join(rng.choices(TITLE_WORDS, k=rng.randint(1, 4)))} {i + 1}",
+                    author_id=pick(rng, authors, author_cum),
+                    published_year=max(year, 1500),
+                    is_active=rng.random() > 0.02,
+                )
+
+        def book_tags():
+            for book_id in book_ids:
+                count = pick(rng, tag_counts, tag_count_cum)
+                chosen = set()
+                while len(chosen) < count:
+                    chosen.update(rng.choices(tags, tag_weights, k=count - len(chosen)))
+                for tag_id in sorted(chosen):
+                    yield Book.tags.through(book_id=book_id, tag_id=tag_id)
+
+        book_ids = self.create(Book, books())
+        if tag_counts:
+            self.create(Book.tags.through, book_tags())
+        return book_ids
+
+    def seed_students(self):
+        rng = random.Random(f'{self.seed}:students')
+        return self.create(Student, (
+            names.fill(Student(full_name=person_name(rng), grade=rng.randint(1, 12)))
+            for _ in range(self.options['students'])
+        ))
+
+    def prepare_students(self, students):
+        global _students
+        rng = random.Random(f'{self.seed}:borrowers')
+        students = list(students)
+        rng.shuffle(students)
+        _students = (students, cumulative(zipf_weights(len(students), s=0.8)))
+
+    def seed_loans(self, pool, books):
+        if not books or not _students[0] or not self.options['loans']:
+            return 0
+        rng = random.Random(f'{self.seed}:loan-counts')
+        weights = zipf_weights(len(books))
+        rng.shuffle(weights)
+        counts = spread(self.options['loans'], weights, max(1, (self.end - self.start).days))
+        open_books = [rng.random() < self.options['open_share'] for _ in books]
+
+        loan_days = reports.loan_period().days
+        blocks = zip(*(_batched(column, BOOKS_PER_TASK) for column in (books, counts, open_books)))
+        tasks = [(self.seed, i, self.start, self.end, loan_days, list(zip(*block)), self.batch_size)
+                 for i, block in enumerate(blocks)]
+        if pool is None:
+            created = sum(map(write_loans, tasks))
+        else:
+            created = sum(pool.imap_unordered(write_loans, tasks))
+
+        # Loan.save() keeps current_loan, bulk_create doesn't
+        open_loan = Loan.objects.filter(book=OuterRef('pk'), returned_at__isnull=True).values('id')[:1]
+        Book.objects.filter(pk__in=Loan.objects.filter(returned_at__isnull=True).values('book_id')).update(
+            current_loan=Subquery(open_loan))
+        return created
+
+    def seed_posts(self):
+        rng = random.Random(f'{self.seed}:posts')
+        vocab = [''.join(rng.choices('aeioubdgklmnrstvz', k=rng.randint(2, 9))) for _ in range(20_000)]
+        vocab_cum = cumulative(zipf_weights(len(vocab)))
+        words = self.options['post_words']
+        count = self.options['posts']
+        span = (self.end - self.start).total_seconds()
+
+        def text(length):
+            return ' '.join(pick(rng, vocab, vocab_cum) for _ in range(length))
+
+        def posts():
+            for i in range(count):
+                content = text(rng.randint(max(words // 2, 1), max(words * 3 // 2, 1)))
+                excerpt, word_count = summarize(content)
+                # ids in date order, like posts written one after another
+                created = self.start + timedelta(seconds=span * (i + rng.random()) / count)
+                yield Post(title=text(rng.randint(2, 6)).capitalize()[:200], content=content, excerpt=excerpt,
+                           word_count=word_count, create_date=created, update_date=created)
+
+        with explicit_dates(Post._meta.get_field('create_date'), Post._meta.get_field('update_date')):
+            return self.create(Post, posts())
+
+    def seed_stats(self, pool):
+        start, end = timezone.localdate(self.start), timezone.localdate(self.end)
+        if pool is None:
+            return reports.rebuild(start, end)
+        # a few ranges of days per worker, so one busy range doesn't hold up the rest
+        days = (end - start).days + 1
+        step = math.ceil(days / (self.workers * 4))
+        ranges = [(start + timedelta(days=first), min(start + timedelta(days=first + step - 1), end))
+                  for first in range(0, days, step)]
+        return sum(pool.imap_unordered(rebuild_stats, ranges))
@@ -0,0 +1,278 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+
+# Per-route request metrics kept in HDR-style log-linear histograms.
+#
+# Every thread records into its own shard, so the hot path takes no lock (the registry
+# lock is only taken once, when a thread records its first request). Readers merge the
+# shards. The shard of a thread that has exited is folded into a merged total when the
+# next thread registers or on the next snapshot, so thread-per-request servers don't
+# grow the list without bound. Each process also dumps its merged histograms to LIBRARY_METRICS_DIR every
+# LIBRARY_METRICS_FLUSH_INTERVAL seconds, so the staff endpoint and the request_stats
+# command can report across all worker processes. Dumps of exited processes are removed,
+# dumps older than LIBRARY_METRICS_MAX_AGE seconds are ignored.
+
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS  # 32 sub-buckets per power of two, ~3% relative error
+BUCKETS = 1024  # covers values up to ~2**36 (about 19 hours in microseconds)
+
+
+def bucket_index(value):
+    if value < 2 * SUB_BUCKETS:
+        return max(value, 0)
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return min(shift * SUB_BUCKETS + (value >> shift), BUCKETS - 1)
+
+
+def bucket_value(index):
+    # midpoint of the bucket
+    if index < 2 * SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    low = (index - shift * SUB_BUCKETS) << shift
+    return low + ((1 << shift) >> 1)
+
+
+class Histogram:
+    __slots__ = ('counts', 'total', 'max')
+
+    def __init__(self, counts=None, total=0, max=0):
+        self.counts = counts or [0] * BUCKETS
+        self.total = total
+        self.max = max
+
+    def record(self, value):
+        self.counts[bucket_index(value)] += 1
+        self.total += 1
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        counts = self.counts
+        for index, count in enumerate(other.counts):
+            if count:
+                counts[index] += count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        if not self.total:
+            return 0
+        rank = max(1, round(self.total * p / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bucket_value(index), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.total,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+    def to_dict(self):
+        # sparse, only non-empty buckets
+        return {'counts': {i: c for i, c in enumerate(self.counts) if c}, 'total': self.total, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, data):
+        counts = [0] * BUCKETS
+        for index, count in data['counts'].items():
+            counts[int(index)] = count
+        return cls(counts, data['total'], data['max'])
+
+
+class RouteStats:
+    __slots__ = ('latency_us', 'queries', 'db_time_us')
+
+    def __init__(self):
+        self.latency_us = Histogram()
+        self.queries = Histogram()
+        self.db_time_us = Histogram()
+
+    def merge(self, other):
+        self.latency_us.merge(other.latency_us)
+        self.queries.merge(other.queries)
+        self.db_time_us.merge(other.db_time_us)
+
+    def summary(self):
+        return {
+            'latency_us': self.latency_us.summary(),
+            'queries': self.queries.summary(),
+            'db_time_us': self.db_time_us.summary(),
+        }
+
+    def to_dict(self):
+        return {name: getattr(self, name).to_dict() for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        for name in cls.__slots__:
+            setattr(stats, name, Histogram.from_dict(data[name]))
+        return stats
+
+
+class Registry:
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []  # [(owning thread, shard)]
+        self._retired = {}  # the merged shards of exited threads
+        self._lock = threading.Lock()
+        self._next_flush = time.monotonic() + getattr(settings, 'LIBRARY_METRICS_FLUSH_INTERVAL', 10)
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._sweep()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _sweep(self):
+        # with the lock held; an exited thread no longer writes to its shard
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                for route, stats in shard.items():
+                    self._retired.setdefault(route, RouteStats()).merge(stats)
+        self._shards = live
+
+    def record(self, route, elapsed_ns, queries, db_time_ns):
+        shard = self._shard()
+        stats = shard.get(route)
+        if stats is None:
+            stats = shard[route] = RouteStats()
+        stats.latency_us.record(elapsed_ns // 1000)
+        stats.queries.record(queries)
+        stats.db_time_us.record(db_time_ns // 1000)
+
+        now = time.monotonic()
+        if now > self._next_flush:
+            self._next_flush = now + getattr(settings, 'LIBRARY_METRICS_FLUSH_INTERVAL', 10)
+            self.flush()
+
+    def snapshot(self):
+        merged = {}
+        with self._lock:
+            self._sweep()
+            for route, stats in self._retired.items():
+                merged.setdefault(route, RouteStats()).merge(stats)
+            shards = [shard for _, shard in self._shards]
+        for shard in shards:
+            for route, stats in list(shard.items()):
+                merged.setdefault(route, RouteStats()).merge(stats)
+        return merged
+
+    def reset(self):
+        with self._lock:
+            self._retired.clear()
+            for _, shard in self._shards:
+                shard.clear()
+
+    def flush(self):
+        directory = metrics_dir()
+        data = {route: stats.to_dict() for route, stats in self.snapshot().items()}
+        path = directory / f'{os.getpid()}.json'
+        tmp = path.with_suffix('.tmp')
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(json.dumps(data))
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+
+registry = Registry()
+
+
+def metrics_dir():
+    return Path(getattr(settings, 'LIBRARY_METRICS_DIR', None)
+                or Path(tempfile.gettempdir()) / 'library-metrics')
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # exists, but belongs to another user
+    return True
+
+
+def _dumps(own_pid):
+    # dumps of the other live processes. A dump of a process that exited is deleted; an
+    # old one (a reused pid, a worker on another host sharing the directory) is skipped.
+    oldest = time.time() - getattr(settings, 'LIBRARY_METRICS_MAX_AGE', 3600)
+    for path in metrics_dir().glob('*.json'):
+        try:
+            pid = int(path.stem)
+            if pid == own_pid:
+                continue
+            if not _alive(pid):
+                path.unlink(missing_ok=True)
+                continue
+            if path.stat().st_mtime < oldest:
+                continue
+            yield json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+
+
+def collect(all_processes=True):
+    # live histograms of this process plus the last dump of every other live process
+    merged = registry.snapshot()
+    if all_processes and metrics_dir().is_dir():
+        for data in _dumps(os.getpid()):
+            for route, stats in data.items():
+                merged.setdefault(route, RouteStats()).merge(RouteStats.from_dict(stats))
+    return {route: stats.summary() for route, stats in sorted(merged.items())}
+
+
+class QueryTimer:
+    # query count and DB time of one request, works with DEBUG = False
+    __slots__ = ('count', 'time_ns')
+
+    def __init__(self):
+        self.count = 0
+        self.time_ns = 0
+
+
+# the timer of the request running in this thread/task. Wrapping every request in
+# connection.execute_wrapper() costs microseconds (connection lookup + context manager),
+# so a single wrapper is installed per connection and only looks this up.
+active_timer = ContextVar('library_query_timer', default=None)
+
+
+def time_query(execute, sql, params, many, context):
+    timer = active_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter_ns()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.time_ns += time.perf_counter_ns() - start
+        timer.count += 1
+
+
+def install_query_timer(sender, connection, **kwargs):
+    # connection_created receiver, see LibraryConfig.ready
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
@@ -1,45 +1,101 @@
 import time
-from django.conf import settings
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.http import HttpResponse
 
+from . import maintenance, metrics
+
+
+class SyncAsyncMiddleware:
+    # runs natively under both WSGI and ASGI: Django hands an async get_response to
+    # async-capable middleware, and __call__ then returns the coroutine of __acall__
+    sync_capable = True
+    async_capable = True
 
-class RequestLoggingMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        start_time = time.time()
-        response = self.get_response(request)
-        duration = time.time() - start_time
+        if self.is_async:
+            return self.__acall__(request)
+        return self.handle(request)
+
 
-        user = request.user.username if request.user.is_authenticated else "Anonymous"
+class RequestTimingMiddleware(SyncAsyncMiddleware):
+    # per-route latency, query count and DB time into library.metrics histograms.
+    # keyed by the resolved URL name, so /library/1/ and /library/2/ are one route.
+    # The query timer is a ContextVar, so it follows the request into sync_to_async threads.
 
-        print(
-            f"{request.method} {request.path} --  User: {user} --  Duration: {duration} seconds")
+    def handle(self, request):
+        timer = metrics.QueryTimer()
+        token = metrics.active_timer.set(timer)
+        start = time.perf_counter_ns()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.active_timer.reset(token)
+        self.record(request, time.perf_counter_ns() - start, timer)
         return response
 
+    async def __acall__(self, request):
+        timer = metrics.QueryTimer()
+        token = metrics.active_timer.set(timer)
+        start = time.perf_counter_ns()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.active_timer.reset(token)
+        self.record(request, time.perf_counter_ns() - start, timer)
+        return response
+
+    def record(self, request, elapsed, timer):
+        match = request.resolver_match
+        route = match.view_name if match is not None else '<unresolved>'
+        metrics.registry.record(route, elapsed, timer.count, timer.time_ns)
+
 
 # MAINTENANCE_MODE
-class MaintenanceModeMiddleware:
-    def __init__(self, get_response):
-        self.get_response = get_response
+MAINTENANCE_PAGE = """
+<html>
+<body style="text-align: center; padding: 50px">
+<h1>საიტი მიუწვდომელია</h1>
+<p>მიმდინარეობს ტექნიკური სამუშაოები</p>
+</body>
+</html>
+""".encode()
+
+
+def maintenance_response():
+    response = HttpResponse(MAINTENANCE_PAGE, status=503, content_type='text/html; charset=utf-8')
+    response['Retry-After'] = '120'
+    return response
 
-    def __call__(self, request):
-        maintanance = getattr(settings, "MAINTENANCE_MODE", False)
 
-        if maintanance:
+class MaintenanceModeMiddleware(SyncAsyncMiddleware):
+    # prefixes come from library.maintenance (admin / `manage.py maintenance`), memoised per process
+
+    def handle(self, request):
+        prefixes = maintenance.active_prefixes()
+
+        if prefixes and request.path.startswith(prefixes):
             if request.path.startswith("/admin/"):
                 return self.get_response(request)
             if request.user.is_authenticated and request.user.is_superuser:
                 return self.get_response(request)
+            return maintenance_response()
+        return self.get_response(request)
 
-            return HttpResponse("""
-            <html>
-            <body style="text-align: center; padding: 50px">
-            <h1>საიტი მიუწვდომელია</h1>
-            <p>მიმდინარეობს ტექნიკური სამუშაოები</p>
-            </body>
-            </html>
+    async def __acall__(self, request):
+        prefixes = await maintenance.aactive_prefixes()
 
-            """, status=503)
-        return self.get_response(request)
\ No newline at end of file
+        if prefixes and request.path.startswith(prefixes):
+            if request.path.startswith("/admin/"):
+                return await self.get_response(request)
+            user = await request.auser()
+            if user.is_authenticated and user.is_superuser:
+                return await self.get_response(request)
+            return maintenance_response()
+        return await self.get_response(request)
@@ -0,0 +1,57 @@
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE library_book_fts USING fts5("
+    "title, author, tags, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    "INSERT INTO library_book_fts (rowid, title, author, tags) "
+    "SELECT b.id, b.title, a.name, COALESCE((SELECT group_concat(t.name, ' ') FROM library_book_tags bt "
+    "JOIN library_tag t ON t.id = bt.tag_id WHERE bt.book_id = b.id), '') "
+    "FROM library_book b JOIN library_author a ON a.id = b.author_id",
+]
+SQLITE_BACKWARD = [
+    "DROP TABLE IF EXISTS library_book_fts",
+]
+
+POSTGRES_FORWARD = [
+    "CREATE TABLE library_book_search ("
+    "book_id bigint PRIMARY KEY REFERENCES library_book (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+    "document tsvector NOT NULL)",
+    "CREATE INDEX library_book_search_document_gin ON library_book_search USING GIN (document)",
+    "INSERT INTO library_book_search (book_id, document) "
+    "SELECT b.id, setweight(to_tsvector('simple', b.title), 'A') || "
+    "setweight(to_tsvector('simple', a.name), 'B') || "
+    "setweight(to_tsvector('simple', COALESCE((SELECT string_agg(t.name, ' ') FROM library_book_tags bt "
+    "JOIN library_tag t ON t.id = bt.tag_id WHERE bt.book_id = b.id), '')), 'C') "
+    "FROM library_book b JOIN library_author a ON a.id = b.author_id",
+]
+POSTGRES_BACKWARD = [
+    "DROP TABLE IF EXISTS library_book_search",
+]
+
+STATEMENTS = {
+    'sqlite': (SQLITE_FORWARD, SQLITE_BACKWARD),
+    'postgresql': (POSTGRES_FORWARD, POSTGRES_BACKWARD),
+}
+
+
+def create_search_index(apps, schema_editor):
+    forward, _ = STATEMENTS.get(schema_editor.connection.vendor, ([], []))
+    for sql in forward:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    _, backward = STATEMENTS.get(schema_editor.connection.vendor, ([], []))
+    for sql in backward:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0002_book_cover'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 6.0.1 on 2026-10-18 08:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_current_loan(apps, schema_editor):
+    Book = apps.get_model('library', 'Book')
+    Loan = apps.get_model('library', 'Loan')
+
+    # older data may hold several open loans for one book; keep the latest one open
+    # so the one-open-loan constraint below can be created
+    current = {}
+    stale = []
+    for loan_id, book_id in (Loan.objects.filter(returned_at__isnull=True)
+                             .order_by('book_id', '-borrowed_at', '-id')
+                             .values_list('id', 'book_id')):
+        if book_id in current:
+            stale.append(loan_id)
+        else:
+            current[book_id] = loan_id
+
+    Loan.objects.filter(pk__in=stale).update(returned_at=timezone.now())
+    for book_id, loan_id in current.items():
+        Book.objects.filter(pk=book_id).update(current_loan_id=loan_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0003_book_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='current_loan',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='library.loan'),
+        ),
+        migrations.RunPython(backfill_current_loan, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['is_active', 'current_loan'], name='library_book_available_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='loan',
+            constraint=models.UniqueConstraint(condition=models.Q(('returned_at__isnull', True)), fields=('book',), name='library_loan_one_open_per_book'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 6.0.1 on 2026-10-18 08:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0004_book_current_loan'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaintenanceMode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path_prefix', models.CharField(default='/', max_length=200, unique=True)),
+                ('is_enabled', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:10
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+# a copy of library.names.normalize as of this migration, so later changes to it don't
+# change what the backfill does
+def normalize(name):
+    decomposed = unicodedata.normalize('NFKD', (name or '').casefold())
+    return ' '.join(''.join(char for char in decomposed if not unicodedata.combining(char)).split())
+
+
+def backfill_search_names(apps, schema_editor):
+    for model_name, source in (('Author', 'name'), ('Student', 'full_name')):
+        model = apps.get_model('library', model_name)
+        batch = []
+        for obj in model.objects.only('id', source).iterator(chunk_size=2000):
+            obj.search_name = normalize(getattr(obj, source))
+            batch.append(obj)
+            if len(batch) == 2000:
+                model.objects.bulk_update(batch, ['search_name'])
+                batch = []
+        model.objects.bulk_update(batch, ['search_name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0007_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='search_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='search_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=200),
+        ),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['search_name', 'id'], name='library_author_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['search_name', 'id'], name='library_student_search_idx'),
+        ),
+        migrations.RunPython(backfill_search_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0008_search_names'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBookStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('loans', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+                ('late_returns', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyStudentStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('loans', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+                ('late_returns', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyTagStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('loans', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(condition=models.Q(('returned_at__isnull', True)), fields=['borrowed_at'], name='library_loan_overdue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['returned_at'], name='library_loan_returned_idx'),
+        ),
+        migrations.AddField(
+            model_name='dailybookstat',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='library.book'),
+        ),
+        migrations.AddField(
+            model_name='dailystudentstat',
+            name='student',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='library.student'),
+        ),
+        migrations.AddField(
+            model_name='dailytagstat',
+            name='tag',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='library.tag'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailybookstat',
+            constraint=models.UniqueConstraint(fields=('day', 'book'), name='library_dailybookstat_day_book'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailystudentstat',
+            constraint=models.UniqueConstraint(fields=('day', 'student'), name='library_dailystudentstat_day_student'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailytagstat',
+            constraint=models.UniqueConstraint(fields=('day', 'tag'), name='library_dailytagstat_day_tag'),
+        ),
+    ]
@@ -1,15 +1,30 @@
 from django.db import models
 
+from .tracking import TrackChangesMixin
+
+
+class Author(TrackChangesMixin, models.Model):
+    tracked_fields = ('name',)
+    search_name_source = 'name'
 
-class Author(models.Model):
     name = models.CharField(max_length=200)
     birth_year = models.IntegerField(null=True, blank=True)
+    # normalized name for the author picker, see library.names
+    search_name = models.CharField(max_length=200, blank=True, default='', editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name', 'id'], name='library_author_name_idx'),
+            models.Index(fields=['search_name', 'id'], name='library_author_search_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class Tag(models.Model):
+class Tag(TrackChangesMixin, models.Model):
+    tracked_fields = ('name',)
+
     name = models.CharField(max_length=50, unique=True)
 
     def __str__(self):
@@ -21,38 +36,182 @@ class BookQuerySet(models.QuerySet):
         return self.filter(is_active=True)
 
     def available(self):
-        return self.active().exclude(loans__returned_at__isnull=True).distinct()
+        return self.active().filter(current_loan__isnull=True)
 
+    def borrowed(self):
+        return self.filter(current_loan__isnull=False)
+
+
+class Book(TrackChangesMixin, models.Model):
+    tracked_fields = ('title', 'author', 'is_active', 'cover')
 
-class Book(models.Model):
     title = models.CharField(max_length=200)
     published_year = models.IntegerField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
 
     cover = models.ImageField(upload_to='book_covers/', null=True, blank=True)
+    # filled in by library.covers after upload
+    cover_hash = models.CharField(max_length=64, blank=True, default='', editable=False, db_index=True)
+    cover_variants = models.JSONField(default=list, blank=True, editable=False)
     author = models.ForeignKey(Author, on_delete=models.PROTECT, related_name='books')
     tags = models.ManyToManyField(Tag, blank=True, related_name='books')
 
+    # open loan of this book, maintained by Loan.save(), so availability never needs a loans scan
+    current_loan = models.ForeignKey(
+        'Loan', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='+',
+    )
+
     objects = BookQuerySet.as_manager()
 
+    class Meta:
+        # matched to the query shapes, see the check_query_plans command
+        indexes = [
+            models.Index(fields=['is_active', 'current_loan'], name='library_book_available_idx'),
+            # catalogue order and its keyset cursor, overall and per author
+            models.Index(fields=['title', 'id'], name='library_book_title_idx'),
+            models.Index(fields=['author', 'title', 'id'], name='library_book_author_title_idx'),
+            # BookAdmin ordering (-published_year, -pk) and its year filter
+            models.Index(fields=['published_year', 'id'], name='library_book_year_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
+    @property
+    def is_available(self):
+        return self.current_loan_id is None
+
+    def cover_sources(self):
+        # srcsets of the generated cover variants, {} until the cover has been processed
+        if not self.cover_variants:
+            return {}
+        url = self.cover.storage.url
+        srcsets = {}
+        for variant in self.cover_variants:
+            srcsets.setdefault(variant['format'], []).append(f"{url(variant['name'])} {variant['width']}w")
+        # plain src for browsers without srcset support
+        fallback = next((v for v in self.cover_variants if v['format'] == 'jpeg' and v['width'] >= 320),
+                        self.cover_variants[-1])
+        return {
+            **{fmt: ', '.join(srcset) for fmt, srcset in srcsets.items()},
+            'src': url(fallback['name']),
+            'width': fallback['width'],
+            'height': fallback['height'],
+        }
+
+
+class Student(TrackChangesMixin, models.Model):
+    tracked_fields = ('full_name',)
+    search_name_source = 'full_name'
 
-class Student(models.Model):
     full_name = models.CharField(max_length=200)
     grade = models.IntegerField(null=True, blank=True)
+    # normalized name for the student picker, see library.names
+    search_name = models.CharField(max_length=200, blank=True, default='', editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['full_name', 'id'], name='library_student_name_idx'),
+            models.Index(fields=['grade', 'full_name'], name='library_student_grade_idx'),
+            models.Index(fields=['search_name', 'id'], name='library_student_search_idx'),
+        ]
 
     def __str__(self):
         return self.full_name
 
 
-class Loan(models.Model):
+class Loan(TrackChangesMixin, models.Model):
+    tracked_fields = ('returned_at',)
+
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='loans')
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='loans')
 
     borrowed_at = models.DateTimeField(auto_now_add=True)
     returned_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['book'],
+                condition=models.Q(returned_at__isnull=True),
+                name='library_loan_one_open_per_book',
+            ),
+        ]
+        indexes = [
+            # LoanAdmin ordering and date filter
+            models.Index(fields=['borrowed_at', 'id'], name='library_loan_borrowed_idx'),
+            # open loans, newest first (API ?open=1, LoanAdmin "No date")
+            models.Index(fields=['-id'], condition=models.Q(returned_at__isnull=True), name='library_loan_open_idx'),
+            # overdue loans, oldest first (library.reports)
+            models.Index(fields=['borrowed_at'], condition=models.Q(returned_at__isnull=True),
+                         name='library_loan_overdue_idx'),
+            # returns per day, for rebuilding the report aggregates
+            models.Index(fields=['returned_at'], name='library_loan_returned_idx'),
+        ]
+
     def __str__(self):
         return f"{self.book} -> {self.student}"
+
+    @property
+    def was_returned(self):
+        # open -> returned transition in this save
+        return self.previous('returned_at') is None and self.returned_at is not None
+
+    def save(self, *args, **kwargs):
+        opened = self.returned_at is None and (self._state.adding or self.has_changed('returned_at'))
+        returned = not self._state.adding and self.was_returned
+        super().save(*args, **kwargs)
+        if opened:
+            Book.objects.filter(pk=self.book_id).update(current_loan=self)
+        elif returned:
+            Book.objects.filter(pk=self.book_id, current_loan=self).update(current_loan=None)
+
+
+# Daily loan aggregates behind library.reports, maintained from the loan events and
+# rebuilt by the rebuild_loan_stats command. `day` is the local date of the loan/return.
+
+class DailyBookStat(models.Model):
+    day = models.DateField()
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    loans = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    late_returns = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'book'], name='library_dailybookstat_day_book'),
+        ]
+
+
+class DailyStudentStat(models.Model):
+    day = models.DateField()
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='+')
+    loans = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    late_returns = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'student'], name='library_dailystudentstat_day_student'),
+        ]
+
+
+class DailyTagStat(models.Model):
+    day = models.DateField()
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='+')
+    loans = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'tag'], name='library_dailytagstat_day_tag'),
+        ]
+
+
+class MaintenanceMode(models.Model):
+    # '/' closes the whole site, '/library/' only the catalogue; see library.maintenance
+    path_prefix = models.CharField(max_length=200, unique=True, default='/')
+    is_enabled = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.path_prefix} ({'on' if self.is_enabled else 'off'})"
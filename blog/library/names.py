@@ -0,0 +1,34 @@
+import unicodedata
+
+from django.db.models import Q
+
+# Student and author pickers search a normalized copy of the name, `search_name`:
+# case-folded, accents stripped, whitespace collapsed. Models opt in with
+# `search_name_source` (the field it is derived from); a pre_save receiver keeps it up to
+# date, bulk_create callers call fill() themselves.
+#
+# A prefix search is a plain range on the (search_name, id) index:
+#   search_name >= 'nino b' AND search_name < 'nino b\U0010ffff'
+# LIKE 'nino b%' can't use that index on SQLite (its LIKE is case-insensitive), and
+# istartswith (UPPER(...) LIKE) can't use it anywhere.
+
+PREFIX_END = '\U0010ffff'
+
+
+def normalize(name):
+    decomposed = unicodedata.normalize('NFKD', (name or '').casefold())
+    return ' '.join(''.join(char for char in decomposed if not unicodedata.combining(char)).split())
+
+
+def fill(instance):
+    source = getattr(type(instance), 'search_name_source', None)
+    if source:
+        instance.search_name = normalize(getattr(instance, source))
+    return instance
+
+
+def prefix_filter(prefix):
+    prefix = normalize(prefix)
+    if not prefix:
+        return Q()
+    return Q(search_name__gte=prefix, search_name__lt=prefix + PREFIX_END)
@@ -0,0 +1,142 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+# keyset (seek) pagination: the next page is fetched with WHERE (title, id) > (...)
+# instead of OFFSET, so page 500 costs the same as page 1.
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder cuts datetimes to milliseconds, the seek needs the exact value
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def keyset_filter(ordering, values):
+    # (a, b, c) > (x, y, z)  ->  a >= x AND (a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z))
+    # descending ('-') fields flip the comparison. The redundant a >= x lets the database
+    # start with a range search on the (a, b, c) index instead of scanning it from the top.
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    if len(ordering) > 1:
+        first = ordering[0]
+        condition &= Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": values[0]})
+    return condition
+
+
+def _seek(queryset, ordering, cursor):
+    # the last ordering field must be unique (e.g. id) and none of them nullable,
+    # otherwise rows can be skipped between pages
+    queryset = queryset.order_by(*ordering)
+    values = decode_cursor(cursor)
+    if values is not None and len(values) == len(ordering):
+        try:
+            queryset = queryset.filter(keyset_filter(ordering, values))
+        except (TypeError, ValueError, ValidationError):
+            # tampered cursor, start from the first page
+            pass
+    return queryset
+
+
+def _page(items, ordering, page_size):
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        # model instances, or the dicts of a values() queryset
+        get = last.__getitem__ if isinstance(last, dict) else last.__getattribute__
+        next_cursor = encode_cursor([get(field.lstrip('-')) for field in ordering])
+    return KeysetPage(items, next_cursor)
+
+
+def paginate_keyset(queryset, ordering, cursor, page_size):
+    # one extra row tells us whether there is a next page without a COUNT(*)
+    items = list(_seek(queryset, ordering, cursor)[:page_size + 1])
+    return _page(items, ordering, page_size)
+
+
+async def apaginate_keyset(queryset, ordering, cursor, page_size):
+    items = [item async for item in _seek(queryset, ordering, cursor)[:page_size + 1]]
+    return _page(items, ordering, page_size)
+
+
+# Admin changelists of big tables: COUNT(*) over the whole table reads all of it, so an
+# unfiltered queryset is counted from the database's own bookkeeping once the table has
+# more than LIBRARY_ADMIN_ESTIMATE_THRESHOLD rows. Filtered querysets are counted exactly.
+
+def estimated_count(queryset):
+    # None if the database keeps no row estimate
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # -1 until the table has been vacuumed/analyzed
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            # the highest rowid is an O(log n) lookup; ids are not reused, so this
+            # overestimates by the number of deleted rows
+            cursor.execute(f'SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}')
+            return cursor.fetchone()[0] or 0
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where and not query.combinator:
+            estimate = estimated_count(self.object_list)
+            if estimate is not None and estimate > getattr(settings, 'LIBRARY_ADMIN_ESTIMATE_THRESHOLD', 50000):
+                return estimate
+        return super().count
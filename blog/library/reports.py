@@ -0,0 +1,213 @@
+import datetime
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, IntegerField, Sum, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Book, DailyBookStat, DailyStudentStat, DailyTagStat, Loan, Tag
+
+# Circulation reports.
+#
+# History (loans and returns per day) is read from the Daily*Stat tables. The loan event
+# handlers (library.handlers) add to one row per book, student and tag of the loan, so a
+# report over a year reads the aggregates of those days, never the Loan history.
+# The current state (overdue loans, books on loan) is read live through the partial
+# open-loan indexes.
+#
+# The event bus never drops an event, but events of a process that dies right after the
+# commit are lost; rebuild_loan_stats recomputes any range of days from the loans.
+
+STAT_MODELS = (DailyBookStat, DailyStudentStat, DailyTagStat)
+
+
+def loan_period():
+    return timedelta(days=getattr(settings, 'LIBRARY_LOAN_DAYS', 14))
+
+
+def period(days, today=None):
+    # the last `days` days, today included
+    end = today or timezone.localdate()
+    return end - timedelta(days=days - 1), end
+
+
+# -- incremental maintenance
+
+def _add(model, key, **deltas):
+    increments = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**key).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **deltas)
+    except IntegrityError:
+        # another worker created the row meanwhile
+        model.objects.filter(**key).update(**increments)
+
+
+def record_loan_opened(loan_id):
+    loan = Loan.objects.filter(pk=loan_id).values('book_id', 'student_id', 'borrowed_at').first()
+    if loan is None:
+        return
+    day = timezone.localdate(loan['borrowed_at'])
+    tag_ids = Book.tags.through.objects.filter(book_id=loan['book_id']).values_list('tag_id', flat=True)
+    with transaction.atomic():
+        _add(DailyBookStat, {'day': day, 'book_id': loan['book_id']}, loans=1)
+        _add(DailyStudentStat, {'day': day, 'student_id': loan['student_id']}, loans=1)
+        for tag_id in tag_ids:
+            _add(DailyTagStat, {'day': day, 'tag_id': tag_id}, loans=1)
+
+
+def record_loan_closed(loan_id):
+    loan = Loan.objects.filter(pk=loan_id).values('book_id', 'student_id', 'borrowed_at', 'returned_at').first()
+    if loan is None or loan['returned_at'] is None:
+        return
+    day = timezone.localdate(loan['returned_at'])
+    late = int(loan['returned_at'] - loan['borrowed_at'] > loan_period())
+    with transaction.atomic():
+        _add(DailyBookStat, {'day': day, 'book_id': loan['book_id']}, returns=1, late_returns=late)
+        _add(DailyStudentStat, {'day': day, 'student_id': loan['student_id']}, returns=1, late_returns=late)
+
+
+# -- rebuilding
+
+def _day_start(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def _rebuild_window(start, end):
+    # aggregates of the days [start, end]; one GROUP BY per table and event kind
+    since, until = _day_start(start), _day_start(end + timedelta(days=1))
+    opened = (Loan.objects.filter(borrowed_at__gte=since, borrowed_at__lt=until)
+              .annotate(day=TruncDate('borrowed_at')))
+    returned = (Loan.objects.filter(returned_at__gte=since, returned_at__lt=until)
+                .annotate(day=TruncDate('returned_at'),
+                          late=Case(When(returned_at__gt=F('borrowed_at') + loan_period(), then=1),
+                                    default=0, output_field=IntegerField())))
+
+    created = 0
+    for model, key in ((DailyBookStat, 'book_id'), (DailyStudentStat, 'student_id')):
+        rows = {}
+        for day, key_id, loans in opened.values_list('day', key).annotate(n=Count('id')).order_by():
+            rows.setdefault((day, key_id), Counter())['loans'] += loans
+        for day, key_id, returns, late in (returned.values_list('day', key)
+                                           .annotate(n=Count('id'), n_late=Sum('late')).order_by()):
+            counts = rows.setdefault((day, key_id), Counter())
+            counts['returns'] += returns
+            counts['late_returns'] += late
+        model.objects.bulk_create(
+            [model(day=day, **{key: key_id}, **counts) for (day, key_id), counts in rows.items()],
+            batch_size=1000,
+        )
+        created += len(rows)
+
+    tags = (opened.filter(book__tags__isnull=False)
+            .values_list('day', 'book__tags').annotate(n=Count('id')).order_by())
+    stats = [DailyTagStat(day=day, tag_id=tag_id, loans=loans) for day, tag_id, loans in tags]
+    DailyTagStat.objects.bulk_create(stats, batch_size=1000)
+    return created + len(stats)
+
+
+def rebuild(start=None, end=None, window_days=31, progress=None):
+    # recompute the aggregates of [start, end] (default: the whole loan history) from Loan,
+    # one transaction per window of days; returns the number of aggregate rows written
+    if start is None:
+        first = Loan.objects.order_by('borrowed_at').values_list('borrowed_at', flat=True).first()
+        if first is None:
+            for model in STAT_MODELS:
+                model.objects.all().delete()
+            return 0
+        start = timezone.localdate(first)
+    end = end or timezone.localdate()
+
+    written = 0
+    window_start = start
+    while window_start <= end:
+        window_end = min(window_start + timedelta(days=window_days - 1), end)
+        with transaction.atomic():
+            for model in STAT_MODELS:
+                model.objects.filter(day__range=(window_start, window_end)).delete()
+            written += _rebuild_window(window_start, window_end)
+        if progress:
+            progress(window_start, window_end, written)
+        window_start = window_end + timedelta(days=1)
+    return written
+
+
+# -- reports
+
+def overdue_loans(limit=None):
+    cutoff = timezone.now() - loan_period()
+    loans = (Loan.objects.filter(returned_at__isnull=True, borrowed_at__lt=cutoff)
+             .select_related('book', 'student').order_by('borrowed_at'))
+    return list(loans[:limit] if limit else loans)
+
+
+def top_books(start, end, limit=20):
+    return list(DailyBookStat.objects.filter(day__range=(start, end))
+                .values('book_id', title=F('book__title'))
+                .annotate(loans=Sum('loans')).filter(loans__gt=0)
+                .order_by('-loans', 'book_id')[:limit])
+
+
+def top_authors(start, end, limit=20):
+    return list(DailyBookStat.objects.filter(day__range=(start, end))
+                .values(author_id=F('book__author_id'), name=F('book__author__name'))
+                .annotate(loans=Sum('loans')).filter(loans__gt=0)
+                .order_by('-loans', 'author_id')[:limit])
+
+
+def top_students(start, end, limit=20):
+    return list(DailyStudentStat.objects.filter(day__range=(start, end))
+                .values('student_id', name=F('student__full_name'), grade=F('student__grade'))
+                .annotate(loans=Sum('loans'), returns=Sum('returns'), late_returns=Sum('late_returns'))
+                .order_by('-loans', 'student_id')[:limit])
+
+
+def grades(start, end):
+    return list(DailyStudentStat.objects.filter(day__range=(start, end))
+                .values(grade=F('student__grade'))
+                .annotate(students=Count('student_id', distinct=True), loans=Sum('loans'),
+                          returns=Sum('returns'), late_returns=Sum('late_returns'))
+                .order_by('grade'))
+
+
+def tag_utilisation(start, end):
+    # loans in the period, and the share of each tag's books that is on loan right now
+    through = Book.tags.through.objects
+    loans = dict(DailyTagStat.objects.filter(day__range=(start, end))
+                 .values_list('tag_id').annotate(n=Sum('loans')).order_by())
+    books = dict(through.values_list('tag_id').annotate(n=Count('book_id')).order_by())
+    on_loan = dict(through.filter(book__current_loan__isnull=False)
+                   .values_list('tag_id').annotate(n=Count('book_id')).order_by())
+    rows = [
+        {
+            'tag_id': tag_id,
+            'name': name,
+            'loans': loans.get(tag_id, 0),
+            'books': books.get(tag_id, 0),
+            'on_loan': on_loan.get(tag_id, 0),
+            'utilisation': on_loan.get(tag_id, 0) / books[tag_id] if books.get(tag_id) else 0.0,
+        }
+        for tag_id, name in Tag.objects.values_list('id', 'name')
+    ]
+    rows.sort(key=lambda row: (-row['loans'], row['name']))
+    return rows
+
+
+def circulation(days=30, limit=20):
+    start, end = period(days)
+    return {
+        'start': start,
+        'end': end,
+        'loan_days': loan_period().days,
+        'overdue': overdue_loans(limit=limit * 5),
+        'books': top_books(start, end, limit),
+        'authors': top_authors(start, end, limit),
+        'students': top_students(start, end, limit),
+        'grades': grades(start, end),
+        'tags': tag_utilisation(start, end),
+    }
@@ -0,0 +1,259 @@
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Book
+from .pagination import KeysetPage, decode_cursor, encode_cursor
+
+# Full-text index over book title, author name and tag names.
+#   sqlite     -> FTS5 virtual table library_book_fts (rowid = book id), ranked by bm25
+#   postgresql -> library_book_search table with a weighted tsvector + GIN index, ranked by ts_rank
+#   other      -> icontains fallback
+# Tables are created in migration 0003_book_search_index.
+#
+# search_books() is a plain filter (admin search, the ndjson export). Ranked pages come from
+# search_page(): the ranking runs inside the index query, ORDER BY rank LIMIT n with a
+# (rank, id) keyset for the next pages, the way djangoapp.search does it, and only the books
+# of the page are loaded. A rank computed per matching row in a correlated subquery (and a
+# sort of the whole match set by it) made a common word take minutes on 100k books.
+# A filtered queryset (e.g. ?author=) is passed into the index query as "id IN (...)", so
+# pages stay full. search_rank is lower for better matches.
+
+BATCH_SIZE = 500
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+TAGS_SUBQUERY = (
+    "SELECT {agg} FROM library_book_tags bt "
+    "JOIN library_tag t ON t.id = bt.tag_id WHERE bt.book_id = b.id"
+)
+
+
+def tokenize(q):
+    return TOKEN_RE.findall(q.lower())
+
+
+def _restriction(queryset):
+    # -> (sql, params) of the ids the queryset is filtered to, None if it isn't
+    if not queryset.query.where:
+        return None
+    return queryset.order_by().values('id').query.sql_with_params()
+
+
+class SQLiteBackend:
+    match_sql = "SELECT rowid FROM library_book_fts WHERE library_book_fts MATCH %s"
+    # column weights: title, author, tags
+    rank = "bm25(library_book_fts, 10.0, 4.0, 2.0)"
+    ranked_sql = (
+        f"SELECT rowid, {rank} FROM library_book_fts WHERE library_book_fts MATCH %s {{where}} "
+        f"ORDER BY {rank}, rowid LIMIT %s"
+    )
+    after_sql = f"AND ({rank}, rowid) > (%s, %s)"
+    insert_sql = (
+        "INSERT INTO library_book_fts (rowid, title, author, tags) "
+        "SELECT b.id, b.title, a.name, COALESCE((" + TAGS_SUBQUERY.format(agg="group_concat(t.name, ' ')") + "), '') "
+        "FROM library_book b JOIN library_author a ON a.id = b.author_id WHERE {where}"
+    )
+
+    def build_query(self, tokens):
+        # every token as a quoted prefix term, so user input can't inject FTS syntax
+        return ' '.join('"%s"*' % token.replace('"', '""') for token in tokens)
+
+    def search(self, queryset, tokens):
+        return queryset.filter(id__in=RawSQL(self.match_sql, (self.build_query(tokens),)))
+
+    def ranked(self, cursor, tokens, queryset, after, limit):
+        where, params = [], [self.build_query(tokens)]
+        if after:
+            where.append(self.after_sql)
+            params.extend(after)
+        restriction = _restriction(queryset)
+        if restriction:
+            where.append(f"AND rowid IN ({restriction[0]})")
+            params.extend(restriction[1])
+        cursor.execute(self.ranked_sql.replace('{where}', ' '.join(where)), [*params, limit])
+        return cursor.fetchall()
+
+    def remove(self, cursor, book_ids):
+        placeholders = ', '.join(['%s'] * len(book_ids))
+        cursor.execute(f"DELETE FROM library_book_fts WHERE rowid IN ({placeholders})", book_ids)
+
+    def index(self, cursor, book_ids):
+        self.remove(cursor, book_ids)
+        placeholders = ', '.join(['%s'] * len(book_ids))
+        cursor.execute(self.insert_sql.format(where=f"b.id IN ({placeholders})"), book_ids)
+
+    def index_range(self, cursor, start, end):
+        cursor.execute("DELETE FROM library_book_fts WHERE rowid > %s AND rowid <= %s", [start, end])
+        cursor.execute(self.insert_sql.format(where="b.id > %s AND b.id <= %s"), [start, end])
+
+    def clear(self, cursor):
+        cursor.execute("DELETE FROM library_book_fts")
+
+
+class PostgresBackend:
+    match_sql = "SELECT book_id FROM library_book_search WHERE document @@ to_tsquery('simple', %s)"
+    rank = "-ts_rank(document, to_tsquery('simple', %s))"
+    ranked_sql = (
+        f"SELECT book_id, {rank} FROM library_book_search WHERE document @@ to_tsquery('simple', %s) {{where}} "
+        f"ORDER BY 2, book_id LIMIT %s"
+    )
+    after_sql = f"AND ({rank}, book_id) > (%s, %s)"
+    insert_sql = (
+        "INSERT INTO library_book_search (book_id, document) "
+        "SELECT b.id, "
+        "setweight(to_tsvector('simple', b.title), 'A') || "
+        "setweight(to_tsvector('simple', a.name), 'B') || "
+        "setweight(to_tsvector('simple', COALESCE((" + TAGS_SUBQUERY.format(agg="string_agg(t.name, ' ')") + "), '')), 'C') "
+        "FROM library_book b JOIN library_author a ON a.id = b.author_id WHERE {where} "
+        "ON CONFLICT (book_id) DO UPDATE SET document = EXCLUDED.document"
+    )
+
+    def build_query(self, tokens):
+        return ' & '.join(f'{token}:*' for token in tokens)
+
+    def search(self, queryset, tokens):
+        return queryset.filter(id__in=RawSQL(self.match_sql, (self.build_query(tokens),)))
+
+    def ranked(self, cursor, tokens, queryset, after, limit):
+        query = self.build_query(tokens)
+        where, params = [], [query, query]
+        if after:
+            where.append(self.after_sql)
+            params.extend([query, *after])
+        restriction = _restriction(queryset)
+        if restriction:
+            where.append(f"AND book_id IN ({restriction[0]})")
+            params.extend(restriction[1])
+        cursor.execute(self.ranked_sql.replace('{where}', ' '.join(where)), [*params, limit])
+        return cursor.fetchall()
+
+    def remove(self, cursor, book_ids):
+        cursor.execute("DELETE FROM library_book_search WHERE book_id = ANY(%s)", [list(book_ids)])
+
+    def index(self, cursor, book_ids):
+        cursor.execute(self.insert_sql.format(where="b.id = ANY(%s)"), [list(book_ids)])
+
+    def index_range(self, cursor, start, end):
+        cursor.execute(self.insert_sql.format(where="b.id > %s AND b.id <= %s"), [start, end])
+
+    def clear(self, cursor):
+        cursor.execute("TRUNCATE library_book_search")
+
+
+class FallbackBackend:
+    def search(self, queryset, tokens):
+        condition = Q()
+        for token in tokens:
+            condition &= Q(title__icontains=token) | Q(author__name__icontains=token)
+        return queryset.filter(condition)
+
+    def ranked(self, cursor, tokens, queryset, after, limit):
+        books = self.search(queryset, tokens).order_by('id')
+        if after:
+            books = books.filter(id__gt=after[1])
+        return [(book_id, 0.0) for book_id in books.values_list('id', flat=True)[:limit]]
+
+    def remove(self, cursor, book_ids):
+        pass
+
+    def index(self, cursor, book_ids):
+        pass
+
+    def index_range(self, cursor, start, end):
+        pass
+
+    def clear(self, cursor):
+        pass
+
+
+BACKENDS = {
+    'sqlite': SQLiteBackend,
+    'postgresql': PostgresBackend,
+}
+
+
+def get_backend():
+    return BACKENDS.get(connection.vendor, FallbackBackend)()
+
+
+def search_books(queryset, q):
+    tokens = tokenize(q)
+    if not tokens:
+        return queryset.none()
+    return get_backend().search(queryset, tokens)
+
+
+def _after(cursor):
+    values = decode_cursor(cursor)
+    if values and len(values) == 2 and all(isinstance(value, (int, float)) for value in values):
+        return values
+    # no or a tampered cursor, start from the first page
+    return None
+
+
+def search_page(queryset, q, cursor=None, page_size=24):
+    # a KeysetPage of the books of `queryset` (instances or values() dicts with 'id') matching q,
+    # best first, each with its search_rank
+    tokens = tokenize(q)
+    if not tokens:
+        return KeysetPage([], None)
+    with connection.cursor() as db_cursor:
+        rows = get_backend().ranked(db_cursor, tokens, queryset, _after(cursor), page_size + 1)
+    found = {}
+    for item in queryset.filter(id__in=[book_id for book_id, _ in rows[:page_size]]):
+        found[item['id'] if isinstance(item, dict) else item.pk] = item
+    items = []
+    for book_id, rank in rows[:page_size]:
+        item = found.get(book_id)
+        if item is None:
+            continue
+        if isinstance(item, dict):
+            item['search_rank'] = rank
+        else:
+            item.search_rank = rank
+        items.append(item)
+    next_cursor = None
+    if len(rows) > page_size:
+        last_id, last_rank = rows[page_size - 1]
+        next_cursor = encode_cursor([last_rank, last_id])
+    return KeysetPage(items, next_cursor)
+
+
+def _chunks(ids, size=BATCH_SIZE):
+    ids = list(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def index_books(book_ids):
+    backend = get_backend()
+    with connection.cursor() as cursor:
+        for chunk in _chunks(book_ids):
+            backend.index(cursor, chunk)
+
+
+def remove_books(book_ids):
+    backend = get_backend()
+    with connection.cursor() as cursor:
+        for chunk in _chunks(book_ids):
+            backend.remove(cursor, chunk)
+
+
+def rebuild_index(batch_size=5000, progress=None):
+    # id ranges instead of OFFSET, one short transaction per batch
+    backend = get_backend()
+    max_id = Book.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    with connection.cursor() as cursor:
+        backend.clear(cursor)
+    start = 0
+    while start < max_id:
+        end = start + batch_size
+        with transaction.atomic(), connection.cursor() as cursor:
+            backend.index_range(cursor, start, end)
+        if progress:
+            progress(min(end, max_id), max_id)
+        start = end
+    return Book.objects.count()
@@ -1,50 +1,147 @@
-from django.db.models.signals import post_save, post_delete, pre_save
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete, m2m_changed
 from django.dispatch import receiver, Signal
 from django.contrib.auth.signals import user_logged_in
-from .models import Book, Loan, Author
+from . import caching, events, maintenance, names, search
+from .models import Book, Loan, Author, Tag, MaintenanceMode, Student
 
 
-
-
-
-
-@receiver(post_save, sender=Book)
+@receiver(pre_save, sender=Book)
 def book_pre_save(sender, instance, **kwargs):
     if instance.title:
         instance.title = instance.title.strip()
-        print("testtt")
+    # a new cover needs new variants, the templates use the original until they exist
+    if instance.has_changed('cover'):
+        instance.cover_hash = ''
+        instance.cover_variants = []
 
 
 @receiver(post_save, sender=Book)
 def book_post_save(sender, instance, created, **kwargs):
     if created:
-        print(f"cigni sheikmna carmatebit {instance.title} avtoria {instance.author}")
+        search.index_books([instance.pk])
+        events.publish(events.BOOK_CREATED, book_id=instance.pk, title=instance.title,
+                       author_id=instance.author_id, cover=instance.cover.name or None)
     else:
-        print(f"########## cigni shvecvalet carmatebit {instance.title}")
+        changed = instance.changed_fields()
+        # cover/is_active are not part of the search document
+        if 'title' in changed or 'author' in changed:
+            search.index_books([instance.pk])
+        events.publish(events.BOOK_UPDATED, book_id=instance.pk, title=instance.title, changed=changed,
+                       cover=instance.cover.name or None)
+    caching.bump_books([instance.pk])
 
 
 @receiver(post_delete, sender=Book)
 def book_post_delete(sender, instance, **kwargs):
-    print(f"cigni caishala {instance.title}")
+    search.remove_books([instance.pk])
+    caching.bump_books([instance.pk])
+    # the cover files are removed by a handler once the delete has committed
+    events.publish(events.BOOK_DELETED, book_id=instance.pk, title=instance.title,
+                   cover=instance.cover.name or None, cover_hash=instance.cover_hash)
+
+
+# author/tag renames and tag (un)assignment change the search document and the cached cards
+
+def books_changed(book_ids):
+    book_ids = list(book_ids)
+    search.index_books(book_ids)
+    caching.bump_books(book_ids)
+
+
+@receiver(post_save, sender=Author)
+def author_post_save(sender, instance, created, **kwargs):
+    # the authors dropdown and the API author list are under the catalogue version
+    caching.bump_catalogue()
+    if not created and instance.has_changed('name'):
+        books_changed(instance.books.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Author)
+def author_post_delete(sender, instance, **kwargs):
+    # books PROTECT their author, so only the dropdown and the API list change
+    caching.bump_catalogue()
+
+
+# the student/author pickers (library.names) search search_name and cache their pages
+
+@receiver(pre_save, sender=Author)
+@receiver(pre_save, sender=Student)
+def search_name_pre_save(sender, instance, **kwargs):
+    names.fill(instance)
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Student)
+def search_name_post_save(sender, instance, created, **kwargs):
+    if created or instance.has_changed(sender.search_name_source):
+        caching.bump_names(sender)
+
+
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Student)
+def search_name_post_delete(sender, instance, **kwargs):
+    caching.bump_names(sender)
+
+
+@receiver(post_save, sender=Tag)
+def tag_post_save(sender, instance, created, **kwargs):
+    if not created and instance.has_changed('name'):
+        books_changed(instance.books.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_pre_delete(sender, instance, **kwargs):
+    instance._tagged_book_ids = list(instance.books.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def tag_post_delete(sender, instance, **kwargs):
+    books_changed(getattr(instance, '_tagged_book_ids', []))
+
+
+@receiver(m2m_changed, sender=Book.tags.through)
+def book_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            books_changed([instance.pk])
+    elif action == 'pre_clear':
+        instance._tagged_book_ids = list(instance.books.values_list('id', flat=True))
+    elif action == 'post_clear':
+        books_changed(getattr(instance, '_tagged_book_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        books_changed(pk_set)
+
+
+@receiver(post_save, sender=Student)
+def student_post_save(sender, instance, created, **kwargs):
+    # the borrower's name is shown on the card of every book they hold
+    if not created and instance.has_changed('full_name'):
+        caching.bump_books(Book.objects.filter(current_loan__student=instance).values_list('id', flat=True))
 
-    if instance.cover:
-        instance.cover.delete(save=False)
 
 @receiver(post_save, sender=Loan)
 def loan_created(sender, instance, created, **kwargs):
     if created:
-        print(f"cigni caigo: {instance.book.title} studentma")
+        caching.bump_books([instance.book_id])
+        events.publish(events.LOAN_OPENED, loan_id=instance.pk, book_id=instance.book_id,
+                       student_id=instance.student_id)
+
+
+@receiver(post_save, sender=Loan)
+def loan_returned(sender, instance, created, **kwargs):
+    # post_save: the tracked snapshot is only reset once save() returns
+    if not created and instance.was_returned:
+        caching.bump_books([instance.book_id])
+        events.publish(events.LOAN_CLOSED, loan_id=instance.pk, book_id=instance.book_id,
+                       student_id=instance.student_id)
 
 
-@receiver(pre_save, sender=Loan)
-def loan_returned(sender, instance, **kwargs):
-    if instance.pk:
-        try:
-            old_loan = Loan.objects.get(pk=instance.pk)
-            if old_loan.returned_at is None and instance.returned_at is not None:
-                print(f"cigni dabrunebulia {instance.book.title}")
-                print(f"studentis saxeli: {instance.student}")
+@receiver(post_delete, sender=Loan)
+def loan_post_delete(sender, instance, **kwargs):
+    caching.bump_books([instance.book_id])
 
-        except Loan.DoesNotExist:
-            print(f"cigni ar caugia aravis")
 
+@receiver(post_save, sender=MaintenanceMode)
+@receiver(post_delete, sender=MaintenanceMode)
+def maintenance_changed(sender, **kwargs):
+    maintenance.invalidate()
@@ -0,0 +1,12 @@
+from django import template
+from django.urls import reverse
+
+from library.assets import hashed_static_name
+
+register = template.Library()
+
+
+@register.simple_tag
+def hashed_static(name):
+    # {% hashed_static 'css/styles.css' %} -> /assets/css/styles.<hash>.css
+    return reverse('hashed_static', args=[hashed_static_name(name)])
@@ -1,3 +1,1245 @@
-from django.test import TestCase
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path, reverse
+from django.utils import timezone
+from PIL import Image
+
+from blog import urls as blog_urls
+from djangoapp import views as post_views
+from djangoapp.models import Post
+
+from . import assets, caching, covers, events, loans, maintenance, metrics, middleware, names, reports, search
+from .models import (Author, Book, DailyBookStat, DailyStudentStat, DailyTagStat, Loan, MaintenanceMode,
+                     Student, Tag)
+from . import views
+from .forms import BookForm, BorrowForm
+from .api import views as api_views
+from .management.commands import bench_routes
+from .management.commands.check_query_plans import explain
+from .pagination import EstimatedCountPaginator, decode_cursor, encode_cursor
+
+
+def make_books(count, author=None, tags=(), prefix='Book'):
+    author = author or Author.objects.create(name='Ilia Chavchavadze')
+    books = []
+    for i in range(count):
+        book = Book.objects.create(title=f'{prefix} {i:04d}', author=author)
+        if tags:
+            book.tags.set(tags)
+        books.append(book)
+    return books
+
+
+class LibraryTestCase(TestCase):
+    def setUp(self):
+        # on_commit never fires inside TestCase, so cached pages/versions would leak between tests
+        cache.clear()
+        # refresh the memoised maintenance switch, so its (rare) cache refill query
+        # doesn't land inside a request's assertNumQueries
+        maintenance.invalidate()
+        maintenance.active_prefixes()
+
+
+class BookListViewTests(LibraryTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = [Tag.objects.create(name='novel'), Tag.objects.create(name='poetry')]
+        cls.books = make_books(30, tags=cls.tags)
+        student = Student.objects.create(full_name='Nino Beridze', grade=9)
+        for book in cls.books[::3]:
+            Loan.objects.create(book=book, student=student)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        # books (+ author and current loan/student joins), tags, authors dropdown
+        for per_page in (5, 30):
+            with self.assertNumQueries(3):
+                response = self.client.get(reverse('book_list'), {'per_page': per_page})
+            self.assertEqual(len(response.context['books']), per_page)
+
+    def test_keyset_pages_cover_catalogue_in_order(self):
+        seen = []
+        params = {'per_page': 7}
+        while True:
+            response = self.client.get(reverse('book_list'), params)
+            seen.extend(book.pk for book in response.context['books'])
+            page = response.context['page_obj']
+            if not page.has_next:
+                break
+            params['cursor'] = page.next_cursor
+        expected = list(Book.objects.order_by('title', 'id').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_filters_and_authors_dropdown(self):
+        other = Author.objects.create(name='Akaki Tsereteli')
+        make_books(2, author=other, prefix='Gamzrdeli')
+        response = self.client.get(reverse('book_list'), {'author': other.pk, 'q': 'gamz'})
+        self.assertEqual(len(response.context['books']), 2)
+        self.assertIn(other, response.context['authors'])
+
+    def test_tampered_cursor_falls_back_to_first_page(self):
+        cursor = encode_cursor(['x', 'not-a-number'])
+        response = self.client.get(reverse('book_list'), {'cursor': cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(decode_cursor('%%%'))
+
+
+class BookSearchTests(LibraryTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rustaveli = Author.objects.create(name='Shota Rustaveli')
+        cls.epic = Tag.objects.create(name='epic')
+        cls.knight = Book.objects.create(title='The Knight in the Panther Skin', author=cls.rustaveli)
+        cls.knight.tags.add(cls.epic)
+        cls.other = Book.objects.create(title='Data Tutashkhia', author=Author.objects.create(name='Chabua Amirejibi'))
+
+    def search(self, q):
+        return search.search_page(Book.objects.all(), q, page_size=100).object_list
+
+    def test_matches_title_author_and_tags_by_prefix(self):
+        self.assertEqual(self.search('panth'), [self.knight])
+        self.assertEqual(self.search('rustaveli'), [self.knight])
+        self.assertEqual(self.search('epic'), [self.knight])
+        self.assertEqual(self.search('"tutash*)'), [self.other])
+        self.assertEqual(self.search('   '), [])
+
+    def test_title_match_ranks_above_tag_match(self):
+        tagged = Book.objects.create(title='Unrelated', author=self.rustaveli)
+        tagged.tags.add(Tag.objects.create(name='knight'))
+        self.assertEqual(self.search('knight'), [self.knight, tagged])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.rustaveli.name = 'Rustaveli Shota'
+        self.rustaveli.save()
+        self.assertEqual(self.search('shota'), [self.knight])
+
+        self.knight.tags.clear()
+        self.assertEqual(self.search('epic'), [])
+        self.epic.books.add(self.other)
+        self.assertEqual(self.search('epic'), [self.other])
+        self.epic.delete()
+        self.assertEqual(self.search('epic'), [])
+
+        self.knight.delete()
+        self.assertEqual(self.search('panther'), [])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            search.get_backend().clear(cursor)
+        self.assertEqual(self.search('panther'), [])
+        call_command('rebuild_search_index', batch_size=1, stdout=StringIO())
+        self.assertEqual(self.search('panther'), [self.knight])
+
+    def test_list_view_uses_ranked_search(self):
+        response = self.client.get(reverse('book_list'), {'q': 'knight panther'})
+        self.assertEqual(list(response.context['books']), [self.knight])
+
+    def test_page_is_ranked_and_limited_inside_the_index_query(self):
+        books = make_books(60, author=self.rustaveli, prefix='Knight')
+        with CaptureQueriesContext(connection) as queries:
+            page = search.search_page(Book.objects.all(), 'knight', None, page_size=25)
+        # one LIMITed index query, no rank subquery per matching row, then only the page's books
+        ranked, loaded = (query['sql'] for query in queries)
+        self.assertRegex(ranked, r'FROM library_book_(fts|search) WHERE .+ ORDER BY .+ LIMIT 26$')
+        self.assertNotIn('library_book.', ranked)
+        self.assertNotIn('LIMIT', loaded)
+
+        seen = list(page.object_list)
+        while page.has_next:
+            page = search.search_page(Book.objects.all(), 'knight', page.next_cursor, page_size=25)
+            seen.extend(page.object_list)
+        self.assertEqual(sorted(book.pk for book in seen), sorted([self.knight.pk] + [book.pk for book in books]))
+        self.assertEqual([book.search_rank for book in seen], sorted(book.search_rank for book in seen))
+
+        # a filtered queryset is applied inside the index query, so pages stay full
+        chosen = Book.objects.filter(id__in=[book.pk for book in books[::2]])
+        self.assertEqual(len(search.search_page(chosen, 'knight', None, page_size=25)), 25)
+
+
+class AvailabilityTests(LibraryTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book, cls.other = make_books(2)
+        cls.student = Student.objects.create(full_name='Giorgi Kapanadze', grade=11)
+
+    def test_loan_open_and_close_maintain_current_loan(self):
+        loan = Loan.objects.create(book=self.book, student=self.student)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.current_loan, loan)
+        self.assertFalse(self.book.is_available)
+        self.assertEqual(list(Book.objects.available()), [self.other])
+
+        loan.returned_at = timezone.now()
+        loan.save(update_fields=['returned_at'])
+        self.book.refresh_from_db()
+        self.assertTrue(self.book.is_available)
+        self.assertEqual(Book.objects.available().count(), 2)
+
+    def test_one_open_loan_per_book(self):
+        Loan.objects.create(book=self.book, student=self.student)
+        with self.assertRaises(IntegrityError):
+            Loan.objects.create(book=self.book, student=self.student)
+
+    def test_detail_view_shows_current_loan(self):
+        Loan.objects.create(book=self.book, student=self.student)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('book_detail', args=[self.book.pk]))
+        self.assertContains(response, self.student.full_name)
+        self.assertNotIn('borrow_form', response.context)
+
+    def test_reconcile_fixes_drift(self):
+        loan = Loan.objects.create(book=self.book, student=self.student)
+        Book.objects.filter(pk=self.book.pk).update(current_loan=None)
+        Book.objects.filter(pk=self.other.pk).update(current_loan=loan)
+
+        before = caching.book_versions([self.book.pk, self.other.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reconcile_availability', '--dry-run', stdout=StringIO())
+        self.assertEqual(caching.book_versions([self.book.pk, self.other.pk]), before)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reconcile_availability', stdout=StringIO())
+        self.assertEqual(
+            dict(Book.objects.values_list('pk', 'current_loan')),
+            {self.book.pk: loan.pk, self.other.pk: None},
+        )
+        after = caching.book_versions([self.book.pk, self.other.pk])
+        self.assertNotEqual(after[self.book.pk], before[self.book.pk])
+        self.assertNotEqual(after[self.other.pk], before[self.other.pk])
+
+
+@override_settings(LIBRARY_EVENTS_SYNC=True)
+class ConcurrentBorrowTests(TransactionTestCase):
+    threads = 200
+
+    def test_only_one_concurrent_borrow_wins(self):
+        book = make_books(1)[0]
+        students = [Student.objects.create(full_name=f'Student {i}') for i in range(self.threads)]
+        barrier = threading.Barrier(self.threads)
+        results = []
+
+        def worker(student):
+            try:
+                barrier.wait()
+                loans.borrow(book.pk, student)
+                results.append('ok')
+            except loans.BookUnavailable:
+                results.append('unavailable')
+            except Exception as exc:
+                results.append(repr(exc))
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(student,)) for student in students]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(Counter(results), {'ok': 1, 'unavailable': self.threads - 1})
+        self.assertEqual(Loan.objects.filter(book=book, returned_at__isnull=True).count(), 1)
+
+    def test_missing_book_is_not_reported_as_on_loan(self):
+        # outside TestCase's transaction, so SQLite checks the foreign keys at commit
+        book = make_books(1)[0]
+        student = Student.objects.create(full_name='Nino Beridze')
+        with self.assertRaises(IntegrityError):
+            loans.borrow(book.pk + 1000, student)
+        with self.assertRaises(IntegrityError):
+            loans.borrow_many([book.pk, book.pk + 1000], student)
+        self.assertFalse(Loan.objects.exists())
+
+
+class LoanServiceTests(LibraryTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = make_books(3)
+        cls.student = Student.objects.create(full_name='Mariam Lomidze', grade=10)
+
+    def test_return_is_idempotent(self):
+        loan = loans.borrow(self.books[0].pk, self.student)
+        self.assertTrue(loans.return_loan(loan.pk))
+        with self.assertNumQueries(3):  # savepoint, SELECT, release - no UPDATE
+            self.assertFalse(loans.return_loan(loan.pk))
+        self.assertTrue(Book.objects.get(pk=self.books[0].pk).is_available)
+
+    def test_borrow_many_is_all_or_nothing(self):
+        loans.borrow(self.books[2].pk, self.student)
+        with self.assertRaises(loans.BookUnavailable) as caught:
+            loans.borrow_many([book.pk for book in self.books], self.student)
+        self.assertEqual(caught.exception.book_ids, [self.books[2].pk])
+        self.assertEqual(Loan.objects.count(), 1)
+
+        cart = [book.pk for book in self.books[:2]]
+        with self.assertNumQueries(4):  # savepoint, INSERT, UPDATE, release
+            created = loans.borrow_many(cart, self.student)
+        self.assertEqual(len(created), 2)
+        self.assertFalse(Book.objects.available().exists())
+
+    def test_views_use_service(self):
+        book = self.books[0]
+        self.client.post(reverse('library_borrow_book', args=[book.pk]), {'student': self.student.pk})
+        loan = Loan.objects.get(book=book)
+        self.client.post(reverse('library_borrow_book', args=[book.pk]), {'student': self.student.pk})
+        self.assertEqual(Loan.objects.filter(book=book).count(), 1)
+
+        response = self.client.post(reverse('library_return_loan', args=[loan.pk]))
+        self.assertRedirects(response, reverse('book_detail', args=[book.pk]))
+        loan.refresh_from_db()
+        self.assertIsNotNone(loan.returned_at)
+
+
+class ChangeTrackingTests(LibraryTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = make_books(1)[0]
+        cls.student = Student.objects.create(full_name='Luka Japaridze', grade=8)
+
+    def test_tracks_loaded_values_without_queries(self):
+        book = Book.objects.get(pk=self.book.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(book.changed_fields(), [])
+            book.title = 'Renamed'
+            self.assertEqual(book.changed_fields(), ['title'])
+            self.assertEqual(book.previous('title'), self.book.title)
+        book.save()
+        self.assertEqual(book.changed_fields(), [])
+
+        deferred = Book.objects.only('id').get(pk=self.book.pk)
+        deferred.is_active = False
+        self.assertFalse(deferred.has_changed('title'))
+
+    def test_loading_a_deferred_field_keeps_changes_in_memory(self):
+        loan = loans.borrow(self.book.pk, self.student)
+        loan = Loan.objects.only('id', 'returned_at').get(pk=loan.pk)
+        loan.returned_at = timezone.now()
+        self.assertEqual(loan.book_id, self.book.pk)  # loads the deferred book_id
+        self.assertTrue(loan.has_changed('returned_at'))
+        with mock.patch.object(events, 'publish') as publish:
+            loan.save()
+        self.assertTrue(Book.objects.get(pk=self.book.pk).is_available)
+        self.assertEqual(publish.call_args.args, (events.LOAN_CLOSED,))
+
+    def test_borrow_and_return_query_counts(self):
+        # savepoint, INSERT loan, UPDATE book.current_loan, release
+        with self.assertNumQueries(4):
+            loan = loans.borrow(self.book.pk, self.student)
+        # savepoint, SELECT ... FOR UPDATE, UPDATE loan, UPDATE book.current_loan, release
+        with self.assertNumQueries(5):
+            loans.return_loan(loan.pk)
+
+    def test_book_save_reindexes_only_search_fields(self):
+        book = Book.objects.get(pk=self.book.pk)
+        book.is_active = False
+        with self.assertNumQueries(1):
+            book.save()
+        book.title = 'A New Title'
+        # UPDATE + search index DELETE/INSERT
+        with self.assertNumQueries(3):
+            book.save()
+
+
+class EventBusTests(LibraryTestCase):
+    def test_events_published_after_commit_only(self):
+        received = []
+        bus = events.EventBus()
+        bus.subscribe('ping', received.append)
+        with self.settings(LIBRARY_EVENTS_SYNC=True):
+            with self.captureOnCommitCallbacks(execute=True):
+                bus.publish('ping', n=1)
+                self.assertEqual(received, [])
+            self.assertEqual([event.payload for event in received], [{'n': 1}])
+
+    def test_full_queue_drops_instead_of_running_on_the_publisher(self):
+        bus = events.EventBus()
+        release = threading.Event()
+        handled_by = []
+
+        @bus.subscribe('slow')
+        def slow(event):
+            handled_by.append(threading.current_thread().name)
+            release.wait(5)
+
+        with self.settings(LIBRARY_EVENTS_QUEUE_SIZE=1, LIBRARY_EVENTS_WORKERS=1,
+                           LIBRARY_EVENTS_PUT_TIMEOUT=0.01):
+            with self.assertLogs('library.events', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+                for _ in range(4):
+                    bus.publish('slow')
+            release.set()
+            self.assertTrue(bus.drain())
+
+        metrics = bus.metrics()
+        self.assertEqual(metrics['published'], 4)
+        self.assertGreaterEqual(metrics['dropped'], 1)
+        self.assertEqual(metrics['handled'], 4 - metrics['dropped'])
+        self.assertNotIn(threading.current_thread().name, handled_by)
+
+    def test_counters_are_not_lost_under_contention(self):
+        bus = events.EventBus()
+        bus.subscribe('ping', lambda event: None)
+        with self.settings(LIBRARY_EVENTS_SYNC=True):
+            threads = [threading.Thread(target=lambda: [bus._enqueue(events.Event('ping', {})) for _ in range(2000)])
+                       for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(bus.metrics()['published'], 16000)
+        self.assertEqual(bus.metrics()['handled'], 16000)
+
+    def test_book_delete_removes_cover_off_request_path(self):
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root, LIBRARY_EVENTS_SYNC=True):
+            book = make_books(1)[0]
+            book.cover = SimpleUploadedFile('cover.png', b'not really a png')
+            book.save()
+            path = book.cover.path
+            self.assertTrue(os.path.exists(path))
+            with self.captureOnCommitCallbacks(execute=True):
+                book.delete()
+                self.assertTrue(os.path.exists(path))
+            self.assertFalse(os.path.exists(path))
+
+
+class RequestMetricsTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.registry.reset()
+
+    def test_histogram_percentiles_within_bucket_error(self):
+        histogram = metrics.Histogram()
+        for value in range(1, 10001):
+            histogram.record(value)
+        for p, expected in ((50, 5000), (95, 9500), (99, 9900)):
+            self.assertAlmostEqual(histogram.percentile(p), expected, delta=expected * 0.04)
+        restored = metrics.Histogram.from_dict(json.loads(json.dumps(histogram.to_dict())))
+        self.assertEqual(restored.summary(), histogram.summary())
+
+    def test_middleware_records_route_queries_and_db_time(self):
+        make_books(3)
+        self.client.get(reverse('book_list'))
+        self.client.get(reverse('book_detail', args=[Book.objects.first().pk]))
+        self.client.get(reverse('book_detail', args=[Book.objects.last().pk]))
+
+        routes = metrics.collect(all_processes=False)
+        self.assertEqual(routes['book_list']['latency_us']['count'], 1)
+        self.assertEqual(routes['book_list']['queries']['max'], 3)
+        self.assertEqual(routes['book_detail']['latency_us']['count'], 2)
+        self.assertGreater(routes['book_detail']['db_time_us']['max'], 0)
+
+    def test_dumps_of_exited_or_idle_processes_are_left_out(self):
+        stats = metrics.RouteStats()
+        stats.latency_us.record(1000)
+        dump = json.dumps({'book_list': stats.to_dict()})
+        exited = subprocess.Popen(['true'])
+        exited.wait()
+        with tempfile.TemporaryDirectory() as directory, override_settings(LIBRARY_METRICS_DIR=directory):
+            for pid in (os.getppid(), exited.pid, 1):
+                with open(os.path.join(directory, f'{pid}.json'), 'w') as f:
+                    f.write(dump)
+            # pid 1 is alive, but its dump is two hours old
+            os.utime(os.path.join(directory, '1.json'), (time.time() - 7200,) * 2)
+
+            self.assertEqual(metrics.collect()['book_list']['latency_us']['count'], 1)
+            self.assertEqual(sorted(os.listdir(directory)), sorted([f'{os.getppid()}.json', '1.json']))
+
+    def test_shards_of_exited_threads_are_folded_into_the_totals(self):
+        registry = metrics.Registry()
+        for _ in range(50):
+            thread = threading.Thread(target=registry.record, args=('book_list', 2_000_000, 3, 1_000_000))
+            thread.start()
+            thread.join()
+        self.assertLessEqual(len(registry._shards), 1)
+        stats = registry.snapshot()['book_list']
+        self.assertEqual(registry._shards, [])
+        self.assertEqual(stats.latency_us.total, 50)
+        self.assertEqual(stats.queries.max, 3)
+        self.assertEqual(registry.snapshot()['book_list'].latency_us.total, 50)
+
+    def test_metrics_endpoint_is_staff_only(self):
+        url = reverse('library_request_metrics')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        staff = User.objects.create_user('clerk', password='pw', is_staff=True)
+        self.client.force_login(staff)
+        self.client.get(reverse('book_list'))
+        response = self.client.get(url, {'scope': 'process'})
+        self.assertIn('book_list', response.json()['routes'])
+
+
+class MaintenanceModeTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(maintenance.invalidate)
+
+    def test_prefix_switch_at_runtime(self):
+        self.assertEqual(self.client.get(reverse('book_list')).status_code, 200)
+        call_command('maintenance', 'on', prefix='/library/', stdout=StringIO())
+
+        response = self.client.get(reverse('book_list'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.content, middleware.MAINTENANCE_PAGE)
+        self.assertEqual(self.client.get(reverse('login')).status_code, 200)
+
+        call_command('maintenance', 'off', prefix='/library/', stdout=StringIO())
+        self.assertEqual(self.client.get(reverse('book_list')).status_code, 200)
+
+    def test_admin_and_superuser_bypass(self):
+        maintenance.set_enabled('/')
+        self.assertEqual(self.client.get('/admin/login/').status_code, 200)
+        self.client.force_login(User.objects.create_superuser('admin', password='pw'))
+        self.assertEqual(self.client.get(reverse('book_list')).status_code, 200)
+
+    def test_hot_path_is_memoised(self):
+        maintenance.active_prefixes()
+        with self.assertNumQueries(0):
+            for _ in range(100):
+                maintenance.active_prefixes()
+
+    def test_other_processes_pick_up_changes_after_memo_expires(self):
+        maintenance.invalidate()
+        with self.settings(LIBRARY_MAINTENANCE_MEMO_TTL=0):
+            self.assertEqual(maintenance.active_prefixes(), ())
+            # a change made by another process with its own locmem cache: no local invalidation
+            MaintenanceMode.objects.bulk_create([MaintenanceMode(path_prefix='/library/', is_enabled=True)])
+            self.assertEqual(maintenance.active_prefixes(), ())
+            # ...until the cache entry times out (LIBRARY_MAINTENANCE_CACHE_TIMEOUT)
+            cache.delete(maintenance.CACHE_KEY)
+            self.assertEqual(maintenance.active_prefixes(), ('/library/',))
+
+
+class CatalogueCachingTests(LibraryTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = make_books(3)
+        cls.student = Student.objects.create(full_name='Ana Gelashvili', grade=7)
+
+    def test_versions_expire_in_a_per_process_cache(self):
+        key = cache.make_key(caching.VERSION_PREFIX + caching.CATALOGUE)
+        caching.catalogue_version()
+        caching.book_versions([self.books[0].pk])
+        # locmem: another process never sees our bumps, so its versions must age out
+        self.assertLessEqual(cache._expire_info[key], time.time() + caching.PAGE_TIMEOUT)
+        book_key = cache.make_key(f'{caching.VERSION_PREFIX}book:{self.books[0].pk}')
+        self.assertLessEqual(cache._expire_info[book_key], time.time() + caching.PAGE_TIMEOUT)
+
+        cache.clear()
+        with mock.patch.object(caching, 'cache_is_shared', return_value=True):
+            caching.catalogue_version()
+        self.assertIsNone(cache._expire_info[key])
+
+    def test_anonymous_list_page_served_from_cache(self):
+        self.client.get(reverse('book_list'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('book_list'))
+        self.assertContains(response, self.books[0].title)
+
+    def test_conditional_get_returns_304(self):
+        # the first visit sets the CSRF cookie, which is part of the ETag
+        self.client.get(reverse('book_detail', args=[self.books[0].pk]))
+        response = self.client.get(reverse('book_detail', args=[self.books[0].pk]))
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        response = self.client.get(reverse('book_detail', args=[self.books[0].pk]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            loans.borrow(self.books[0].pk, self.student)
+        response = self.client.get(reverse('book_detail', args=[self.books[0].pk]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, self.student.full_name)
+
+    def test_changes_bust_only_affected_cards(self):
+        self.client.get(reverse('book_list'))
+        before = caching.book_versions([book.pk for book in self.books])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            loan = loans.borrow(self.books[1].pk, self.student)
+        after = caching.book_versions([book.pk for book in self.books])
+        self.assertNotEqual(before[self.books[1].pk], after[self.books[1].pk])
+        self.assertEqual(before[self.books[0].pk], after[self.books[0].pk])
+
+        response = self.client.get(reverse('book_list'))
+        self.assertContains(response, self.student.full_name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.full_name = 'Ana Gelashvili-Beridze'
+            self.student.save()
+            loans.return_loan(loan.pk)
+        response = self.client.get(reverse('book_list'))
+        self.assertNotContains(response, 'Ana Gelashvili')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.books[2].author.name = 'Vazha-Pshavela'
+            self.books[2].author.save()
+        self.assertContains(self.client.get(reverse('book_list')), 'Vazha-Pshavela')
+
+    def test_author_edits_and_deletes_bump_the_catalogue(self):
+        author = Author.objects.create(name='Zzz Removable')
+        self.assertContains(self.client.get(reverse('book_list')), 'Zzz Removable')
+
+        version = caching.catalogue_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            author.birth_year = 1900
+            author.save()
+        self.assertNotEqual(caching.catalogue_version(), version)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            author.delete()
+        self.assertNotContains(self.client.get(reverse('book_list')), 'Zzz Removable')
+
+
+class CatalogueImportExportTests(LibraryTestCase):
+    def test_export_import_round_trip(self):
+        poetry = Tag.objects.create(name='poetry')
+        books = make_books(5, tags=[poetry])
+        Book.objects.filter(pk=books[4].pk).update(is_active=False)
+
+        for fmt in ('csv', 'jsonl'):
+            with self.subTest(fmt=fmt):
+                with tempfile.TemporaryDirectory() as directory:
+                    path = os.path.join(directory, f'catalogue.{fmt}')
+                    call_command('export_catalogue', path, stderr=StringIO())
+                    Book.objects.all().delete()
+                    Author.objects.all().delete()
+                    call_command('import_catalogue', path, '--batch-size', '2', stdout=StringIO(), stderr=StringIO())
+
+                self.assertEqual(Book.objects.count(), 5)
+                self.assertEqual(Author.objects.count(), 1)
+                book = Book.objects.get(pk=books[4].pk)
+                self.assertEqual(book.title, books[4].title)
+                self.assertFalse(book.is_active)
+                self.assertEqual(list(book.tags.values_list('name', flat=True)), ['poetry'])
+                # bulk import skips the signals, the command indexes each batch itself
+                self.assertEqual(search.search_books(Book.objects.all(), 'Book 0003').get().pk, books[3].pk)
+
+    def test_import_updates_existing_rows_and_adds_tags(self):
+        book = make_books(1)[0]
+        rows = [
+            {'id': book.pk, 'title': 'Vefkhistkaosani', 'author': 'Shota Rustaveli', 'tags': ['epic']},
+            {'title': 'Gandegili', 'author': 'Vazha-Pshavela', 'published_year': '1897'},
+            {'title': '', 'author': 'nobody'},
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as handle:
+            handle.writelines(json.dumps(row) + '\n' for row in rows)
+        self.addCleanup(os.unlink, handle.name)
+
+        out = StringIO()
+        call_command('import_catalogue', handle.name, stdout=out, stderr=StringIO())
+        self.assertIn('1 new and 1 updated books (1 skipped)', out.getvalue())
+
+        book.refresh_from_db()
+        self.assertEqual(book.title, 'Vefkhistkaosani')
+        self.assertEqual(book.author.name, 'Shota Rustaveli')
+        self.assertEqual(list(book.tags.values_list('name', flat=True)), ['epic'])
+        self.assertEqual(Book.objects.get(title='Gandegili').published_year, 1897)
+
+
+def make_png(size=(800, 1200), color=(200, 30, 30, 255)):
+    buffer = BytesIO()
+    Image.new('RGBA', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class CoverPipelineTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        settings = self.settings(MEDIA_ROOT=self.media_root, LIBRARY_EVENTS_SYNC=True)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def upload(self, book, content, name='cover.png'):
+        with self.captureOnCommitCallbacks(execute=True):
+            book.cover = SimpleUploadedFile(name, content)
+            book.save()
+        book.refresh_from_db()
+        return book
+
+    def test_upload_generates_variants_in_background(self):
+        book = self.upload(make_books(1)[0], make_png())
+        self.assertEqual(len(book.cover_hash), 64)
+        self.assertEqual({(v['width'], v['format']) for v in book.cover_variants},
+                         {(w, f) for w in covers.WIDTHS for f in ('webp', 'jpeg')})
+        small = book.cover_variants[0]
+        self.assertEqual((small['width'], small['height']), (160, 240))
+        with Image.open(os.path.join(self.media_root, small['name'])) as image:
+            self.assertEqual(image.size, (160, 240))
+
+        response = self.client.get(reverse('book_detail', args=[book.pk]))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertRegex(response.content.decode(), r'/640\.[0-9a-f]{12}\.webp 640w')
+
+        # a new cover resets the variants until it has been processed again
+        book.cover = SimpleUploadedFile('other.png', make_png(color=(0, 0, 0, 255)))
+        book.save()
+        self.assertEqual(book.cover_variants, [])
+
+    def test_identical_covers_are_stored_once(self):
+        first, second = make_books(2)
+        first = self.upload(first, make_png())
+        second = self.upload(second, make_png(), name='copy.png')
+        self.assertEqual(second.cover.name, first.cover.name)
+        self.assertEqual(second.cover_variants, first.cover_variants)
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, 'book_covers'))), 2)  # original + variants
+
+        # shared files survive until the last book using them is gone
+        variant = os.path.join(self.media_root, first.cover_variants[0]['name'])
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(second.cover.path))
+        self.assertTrue(os.path.exists(variant))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(variant))
+
+    def test_backfill_command(self):
+        books = make_books(2)
+        for book in books:
+            # saved without running the on-commit handlers, like covers from before the pipeline
+            book.cover = SimpleUploadedFile('old.png', make_png((100, 100)))
+            book.save()
+
+        out = StringIO()
+        call_command('process_covers', '--workers', '1', stdout=out, stderr=StringIO())
+        self.assertIn('Processed 2 of 2 covers', out.getvalue())
+        book = Book.objects.get(pk=books[1].pk)
+        # never upscaled
+        self.assertEqual({v['width'] for v in book.cover_variants}, {100})
+
+
+class HashedAssetTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings = self.settings(MEDIA_ROOT=media_root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.content = bytes(range(256)) * 40
+        self.book = make_books(1)[0]
+        self.book.cover = SimpleUploadedFile('cover.png', self.content)
+        self.book.save()
+
+    def test_cover_url_is_content_hashed_and_immutable(self):
+        url = self.book.cover.url
+        digest = assets.file_digest(self.book.cover.path)
+        self.assertTrue(url.endswith(f'.{digest}.png'))
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Cache-Control'], assets.IMMUTABLE)
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        # the plain name still works, but has to be revalidated
+        response = self.client.get('/media/' + self.book.cover.name)
+        self.assertEqual(response['Cache-Control'], assets.REVALIDATE)
+
+    def test_range_requests(self):
+        url = self.book.cover.url
+        response = self.client.get(url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+
+        response = self.client.get(url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-10:])
+
+        response = self.client.get(url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+
+        # a stale If-Range gets the whole file
+        response = self.client.get(url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_path_traversal_is_rejected(self):
+        response = self.client.get('/media/../blog/settings.py')
+        self.assertEqual(response.status_code, 404)
+
+    def test_hashed_static_css(self):
+        response = self.client.get(reverse('book_list'))
+        url = next(line.split('href="')[1].split('"')[0] for line in response.content.decode().splitlines()
+                   if 'stylesheet' in line)
+        self.assertRegex(url, r'^/assets/css/styles\.[0-9a-f]{12}\.css$')
+        response = self.client.get(url)
+        self.assertEqual(response['Cache-Control'], assets.IMMUTABLE)
+        self.assertEqual(response['Content-Type'], 'text/css')
+
+
+class JsonApiTests(LibraryTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = [Tag.objects.create(name='novel'), Tag.objects.create(name='poetry')]
+        cls.books = make_books(30, tags=cls.tags)
+        cls.student = Student.objects.create(full_name='Nino Beridze', grade=9)
+        for book in cls.books[::3]:
+            Loan.objects.create(book=book, student=cls.student)
+
+    def test_book_list_query_count_does_not_grow_with_page_size(self):
+        # books (+ author and current loan joins), tags
+        for per_page in (5, 30):
+            with self.assertNumQueries(2):
+                response = self.client.get(reverse('api_book_list'), {'per_page': per_page})
+            self.assertEqual(len(response.json()['results']), per_page)
+
+        # without tags it is a single query
+        with self.assertNumQueries(1):
+            self.client.get(reverse('api_book_list'), {'fields': 'id,title,available'})
+
+    def test_sparse_fields_and_cursor_pages(self):
+        seen = []
+        url = reverse('api_book_list') + '?per_page=7&fields=id,available,tags'
+        while url:
+            data = self.client.get(url).json()
+            seen.extend(data['results'])
+            url = data['next']
+        self.assertEqual([item['id'] for item in seen],
+                         list(Book.objects.order_by('title', 'id').values_list('pk', flat=True)))
+        self.assertEqual(set(seen[0]), {'id', 'available', 'tags'})
+        self.assertEqual(seen[0]['tags'], ['novel', 'poetry'])
+        self.assertEqual(sum(not item['available'] for item in seen), 10)
+
+        response = self.client.get(reverse('api_book_list'), {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'unknown fields: secret'})
+
+    def test_book_detail_and_etag(self):
+        book = self.books[0]
+        url = reverse('api_book_detail', args=[book.pk])
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.json()['author'], 'Ilia Chavchavadze')
+        self.assertFalse(response.json()['available'])
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            loans.return_loan(Loan.objects.get(book=book).pk)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['available'])
+
+        self.assertEqual(self.client.get(reverse('api_book_detail', args=[0])).status_code, 404)
+        self.assertEqual(self.client.post(url).status_code, 405)
+
+    def test_ndjson_stream_returns_everything(self):
+        response = self.client.get(reverse('api_book_list'), {'format': 'ndjson', 'q': 'book'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 30)
+        self.assertEqual(json.loads(lines[0])['tags'], ['novel', 'poetry'])
+
+    def test_authors_and_loans(self):
+        with self.assertNumQueries(1):
+            data = self.client.get(reverse('api_author_list'), {'fields': 'name,book_count'}).json()
+        self.assertEqual(data['results'], [{'name': 'Ilia Chavchavadze', 'book_count': 30}])
+
+        with self.assertNumQueries(1):
+            data = self.client.get(reverse('api_loan_list'), {'open': '1', 'student': self.student.pk}).json()
+        self.assertEqual(len(data['results']), 10)
+        self.assertEqual(data['results'][0]['student'], 'Nino Beridze')
+
+    def test_author_list_etag_follows_edits_and_deletes(self):
+        author = Author.objects.create(name='Zzz Removable')
+        url = reverse('api_author_list') + '?fields=name,birth_year'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            author.birth_year = 1900
+            author.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn({'name': 'Zzz Removable', 'birth_year': 1900}, response.json()['results'])
+
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            author.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Zzz Removable', [item['name'] for item in response.json()['results']])
+
+
+class AsyncURLConf:
+    # what blog/urls.py routes to under ASGI (LIBRARY_ASYNC_VIEWS)
+    urlpatterns = [
+        path('library/', views.abook_list, name='book_list'),
+        path('library/<int:book_id>/', views.abook_detail, name='book_detail'),
+        path('library/api/v1/books/', api_views.abook_list, name='api_book_list'),
+        path('library/api/v1/books/<int:book_id>/', api_views.abook_detail, name='api_book_detail'),
+        path('library/api/v1/loans/', api_views.aloan_list, name='api_loan_list'),
+        path('posts/', post_views.aall_posts, name='all_post'),
+        path('posts/<int:post_id>/', post_views.adetail_post, name='detail_post'),
+    ] + blog_urls.urlpatterns
+
+
+@override_settings(ROOT_URLCONF=AsyncURLConf)
+class AsyncViewTests(LibraryTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = [Tag.objects.create(name='novel')]
+        cls.books = make_books(10, tags=cls.tags)
+        cls.student = Student.objects.create(full_name='Nino Beridze', grade=9)
+        Loan.objects.create(book=cls.books[0], student=cls.student)
+        cls.post = Post.objects.create(title='Gamarjoba', content='pirveli posti')
+
+    def test_middleware_stack_stays_async(self):
+        with self.assertLogs('django.request', 'DEBUG') as logs:
+            ASGIHandler()
+            logging.getLogger('django.request').debug('loaded')
+        self.assertEqual([line for line in logs.output if 'adapted for middleware' in line], [])
+
+    async def test_book_list_and_detail(self):
+        response = await self.async_client.get(reverse('book_list'), {'per_page': 4, 'q': 'book'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.resolver_match.func.__name__, 'abook_list')
+        self.assertEqual(len(response.context['books']), 4)
+        self.assertIn('cursor=', response.context['next_page_query'])
+
+        response = await self.async_client.get(reverse('book_detail', args=[self.books[0].pk]))
+        self.assertContains(response, 'Nino Beridze')
+        response = await self.async_client.get(reverse('book_detail', args=[self.books[1].pk]))
+        self.assertContains(response, 'data-autocomplete-url="/library/students/autocomplete/"')
+        self.assertNotContains(response, f'<option value="{self.student.pk}"')
+        response = await self.async_client.get(reverse('book_detail', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_json_endpoints(self):
+        data = (await self.async_client.get(reverse('api_book_list'), {'per_page': 3})).json()
+        self.assertEqual(len(data['results']), 3)
+        self.assertEqual(data['results'][0]['tags'], ['novel'])
+        self.assertIsNotNone(data['next'])
+
+        response = await self.async_client.get(reverse('api_book_list'), {'format': 'ndjson'})
+        lines = b''.join([chunk async for chunk in response.streaming_content]).splitlines()
+        self.assertEqual(len(lines), 10)
+
+        response = await self.async_client.get(reverse('api_book_detail', args=[self.books[0].pk]))
+        self.assertFalse(response.json()['available'])
+        data = (await self.async_client.get(reverse('api_loan_list'))).json()
+        self.assertEqual(data['results'][0]['student'], 'Nino Beridze')
+
+    async def test_posts(self):
+        response = await self.async_client.get(reverse('all_post'))
+        self.assertContains(response, 'Gamarjoba')
+        response = await self.async_client.get(reverse('detail_post', args=[self.post.pk]))
+        self.assertContains(response, 'pirveli posti')
+
+    async def test_maintenance_prefix_applies(self):
+        await MaintenanceMode.objects.acreate(path_prefix='/posts/', is_enabled=True)
+        maintenance.invalidate()
+        response = await self.async_client.get(reverse('all_post'))
+        self.assertEqual(response.status_code, 503)
+        response = await self.async_client.get(reverse('book_list'))
+        self.assertEqual(response.status_code, 200)
+
+
+class QueryPlanTests(LibraryTestCase):
+    def test_hot_queries_use_indexes(self):
+        out = StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertIn('No full table scans', out.getvalue())
+        self.assertNotIn('FULL SCAN', out.getvalue())
+
+    def test_full_scan_is_detected(self):
+        _, scans, _ = explain(Student.objects.filter(full_name__icontains='beridze'))
+        self.assertEqual(scans, ['library_student'])
+        _, scans, _ = explain(Student.objects.filter(pk=1))
+        self.assertEqual(scans, [])
+
+
+class AdminPerformanceTests(LibraryTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(name='Vazha-Pshavela')
+        cls.books = make_books(6, author=cls.author, prefix='Aluda')
+        cls.other = Book.objects.create(title='Data Tutashkhia', published_year=1975,
+                                        author=Author.objects.create(name='Chabua Amirejibi'))
+        cls.student = Student.objects.create(full_name='Nino Beridze', grade=9)
+        for book in cls.books[:3]:
+            Loan.objects.create(book=book, student=cls.student)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('admin', password='pw'))
+
+    def changelist(self, model, params=None):
+        return self.client.get(reverse(f'admin:library_{model}_changelist'), params or {})
+
+    def test_loan_changelist_query_count_does_not_grow(self):
+        self.changelist('loan')  # caches the request user
+        with CaptureQueriesContext(connection) as few:
+            self.changelist('loan')
+        for book in self.books[3:]:
+            Loan.objects.create(book=book, student=Student.objects.create(full_name=book.title))
+        with CaptureQueriesContext(connection) as more:
+            response = self.changelist('loan')
+        self.assertEqual(response.context['cl'].result_count, 6)
+        self.assertEqual(len(few), len(more))
+
+    def test_author_filter_is_an_autocomplete(self):
+        response = self.changelist('book', {'author__id__exact': self.author.pk})
+        self.assertEqual(response.context['cl'].result_count, 6)
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertContains(response, f'<option value="{self.author.pk}" selected>Vazha-Pshavela</option>', html=True)
+        self.assertNotContains(response, 'Chabua Amirejibi')
+
+    def test_decade_filter(self):
+        response = self.changelist('book', {'decade': '1970'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.other])
+        self.assertContains(response, '1970s')
+
+    def test_search_goes_through_the_index(self):
+        response = self.changelist('book', {'q': 'tutash'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.other])
+        response = self.changelist('loan', {'q': 'nino'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+        response = self.changelist('loan', {'q': 'aluda 0001'})
+        self.assertEqual([loan.book for loan in response.context['cl'].result_list], [self.books[1]])
+
+    def test_estimated_count_for_big_unfiltered_tables(self):
+        self.books[2].delete()
+        last = Book.objects.order_by('-id').values_list('id', flat=True).first()
+        with self.settings(LIBRARY_ADMIN_ESTIMATE_THRESHOLD=0):
+            self.assertEqual(EstimatedCountPaginator(Book.objects.order_by('id'), 10).count, last)
+            self.assertEqual(EstimatedCountPaginator(Book.objects.filter(author=self.author).order_by('id'), 10).count, 5)
+        self.assertEqual(EstimatedCountPaginator(Book.objects.order_by('id'), 10).count, 6)
+
+
+class NamePickerTests(LibraryTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.students = [Student.objects.create(full_name=f'Nino Beridze {i:02d}', grade=9) for i in range(25)]
+        cls.other = Student.objects.create(full_name='Giorgi  Ákhvlediani')
+        cls.author = Author.objects.create(name='Nodar Dumbadze')
+        cls.book = Book.objects.create(title='Me, Grandma, Iliko and Illarion', author=cls.author)
+
+    def autocomplete(self, url_name, **params):
+        return self.client.get(reverse(url_name), params).json()
+
+    def test_normalized_prefix_search(self):
+        self.assertEqual(names.normalize('  Giorgi  ÁKHVLEDIANI '), 'giorgi akhvlediani')
+        self.assertEqual(self.other.search_name, 'giorgi akhvlediani')
+        data = self.autocomplete('student_autocomplete', q='GIORGI akh')
+        self.assertEqual(data['results'], [{'id': self.other.pk, 'text': 'Giorgi  Ákhvlediani'}])
+        self.assertIsNone(data['next'])
+        data = self.autocomplete('author_autocomplete', q='nod')
+        self.assertEqual([item['id'] for item in data['results']], [self.author.pk])
+
+    def test_pages_follow_the_index_order(self):
+        first = self.autocomplete('student_autocomplete', q='nino')
+        self.assertEqual(len(first['results']), views.NAME_PAGE_SIZE)
+        second = self.autocomplete('student_autocomplete', q='nino', cursor=first['next'])
+        seen = [item['id'] for item in first['results'] + second['results']]
+        self.assertEqual(seen, [student.pk for student in self.students])
+        self.assertIsNone(second['next'])
+
+    def test_cached_pages_follow_renames(self):
+        self.assertEqual(self.autocomplete('student_autocomplete', q='giorgi')['results'][0]['id'], self.other.pk)
+        with self.assertNumQueries(0):
+            self.autocomplete('student_autocomplete', q='giorgi')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.full_name = 'Levan Akhvlediani'
+            self.other.save()
+        self.assertEqual(self.autocomplete('student_autocomplete', q='giorgi')['results'], [])
+        self.assertEqual(self.autocomplete('student_autocomplete', q='levan')['results'][0]['id'], self.other.pk)
+
+    def test_forms_render_and_validate_without_the_whole_table(self):
+        with self.assertNumQueries(0):
+            html = str(BorrowForm()['student'])
+        self.assertNotIn('Nino', html)
+
+        form = BorrowForm({'student': self.other.pk})
+        with self.assertNumQueries(1):
+            self.assertTrue(form.is_valid())
+        self.assertFalse(BorrowForm({'student': 0}).is_valid())
+
+        html = str(BookForm(instance=self.book)['author'])
+        self.assertIn(f'<option value="{self.author.pk}" selected>Nodar Dumbadze</option>', html)
+        self.assertEqual(html.count('<option'), 2)
+
+
+@override_settings(LIBRARY_EVENTS_SYNC=True, LIBRARY_LOAN_DAYS=14)
+class LoanReportTests(LibraryTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.poetry = Tag.objects.create(name='Poetry')
+        cls.books = make_books(3, tags=[cls.poetry])
+        cls.students = [Student.objects.create(full_name=f'Student {i}', grade=5 + i) for i in range(2)]
+
+    def borrow(self, book, student, days_ago):
+        with self.captureOnCommitCallbacks(execute=True):
+            loan = loans.borrow(book.pk, student)
+        Loan.objects.filter(pk=loan.pk).update(borrowed_at=timezone.now() - timedelta(days=days_ago))
+        return loan
+
+    def give_back(self, loan):
+        with self.captureOnCommitCallbacks(execute=True):
+            loans.return_loan(loan.pk)
+
+    def stats(self):
+        return {
+            model.__name__: sorted(model.objects.values_list(*[f.attname for f in model._meta.fields[1:]]))
+            for model in (DailyBookStat, DailyStudentStat, DailyTagStat)
+        }
+
+    def test_aggregates_follow_the_loan_events(self):
+        loan = self.borrow(self.books[0], self.students[0], 0)
+        self.borrow(self.books[1], self.students[0], 0)
+        self.give_back(loan)
+        self.borrow(self.books[0], self.students[1], 0)
+
+        start, end = reports.period(7)
+        self.assertEqual([(row['book_id'], row['loans']) for row in reports.top_books(start, end)],
+                         [(self.books[0].pk, 2), (self.books[1].pk, 1)])
+        self.assertEqual(reports.top_authors(start, end)[0]['loans'], 3)
+        first = reports.top_students(start, end)[0]
+        self.assertEqual((first['student_id'], first['loans'], first['returns']), (self.students[0].pk, 2, 1))
+        self.assertEqual([row['grade'] for row in reports.grades(start, end)], [5, 6])
+        tag, = reports.tag_utilisation(start, end)
+        self.assertEqual((tag['loans'], tag['books'], tag['on_loan']), (3, 3, 2))
+
+    def test_overdue_and_late_returns(self):
+        late = self.borrow(self.books[0], self.students[0], 20)
+        overdue = self.borrow(self.books[1], self.students[1], 15)
+        self.borrow(self.books[2], self.students[1], 3)
+        self.assertEqual(reports.overdue_loans(), [late, overdue])
+
+        self.give_back(late)
+        self.assertEqual(reports.overdue_loans(), [overdue])
+        row = DailyStudentStat.objects.get(student=self.students[0], day=timezone.localdate())
+        self.assertEqual((row.returns, row.late_returns), (1, 1))
+
+    def test_rebuild_matches_the_incremental_aggregates(self):
+        loan = self.borrow(self.books[0], self.students[0], 0)
+        self.give_back(loan)
+        self.borrow(self.books[0], self.students[1], 0)
+        self.borrow(self.books[2], self.students[0], 0)
+        incremental = self.stats()
+
+        # book 0 and 2, student 0 and 1, Poetry
+        self.assertEqual(reports.rebuild(window_days=1), 5)
+        self.assertEqual(self.stats(), incremental)
+        call_command('rebuild_loan_stats', stdout=StringIO())
+        self.assertEqual(self.stats(), incremental)
+
+    def test_report_page_is_staff_only(self):
+        self.borrow(self.books[0], self.students[0], 30)
+        url = reverse('library_loan_reports')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(User.objects.create_superuser('admin', password='pw'))
+        response = self.client.get(url, {'days': 'x'})
+        self.assertContains(response, 'Student 0')
+        self.assertEqual(response.context['days'], 30)
+        out = StringIO()
+        call_command('loan_report', days=7, stdout=out)
+        self.assertIn('Overdue (1)', out.getvalue())
+
+
+class SeedDataTests(LibraryTestCase):
+    def seed(self, **options):
+        options = {'authors': 20, 'books': 60, 'tags': 10, 'students': 30, 'loans': 400, 'posts': 5,
+                   'post_words': 20, 'batch_size': 50, 'until': timezone.localdate(), **options}
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('seed_data', stdout=StringIO(), **options)
+
+    def loans(self):
+        return sorted(Loan.objects.values_list('book__title', 'student__full_name', 'borrowed_at', 'returned_at'))
+
+    def test_same_seed_same_rows(self):
+        self.seed(seed=7)
+        first = self.loans()
+        self.assertGreater(len(first), 350)
+        for model in (Loan, Book, Author, Tag, Student, Post):
+            model.objects.all().delete()
+        self.seed(seed=7)
+        self.assertEqual(self.loans(), first)
+
+    def test_loan_history_is_consistent(self):
+        self.seed(open_share=0.5)
+        now = timezone.now()
+        by_book = {}
+        for loan in Loan.objects.order_by('borrowed_at'):
+            self.assertLess(loan.borrowed_at, now)
+            if loan.returned_at:
+                self.assertGreater(loan.returned_at, loan.borrowed_at)
+            previous = by_book.get(loan.book_id)
+            # a book is lent again only after it came back
+            self.assertTrue(previous is None or previous.returned_at and previous.returned_at <= loan.borrowed_at)
+            by_book[loan.book_id] = loan
+
+        open_loans = {loan.book_id: loan.pk for loan in by_book.values() if loan.returned_at is None}
+        self.assertTrue(open_loans)
+        self.assertEqual(dict(Book.objects.filter(current_loan__isnull=False).values_list('id', 'current_loan')),
+                         open_loans)
+        self.assertTrue(Book.tags.through.objects.exists())
+        self.assertEqual(DailyBookStat.objects.aggregate(n=Sum('loans'))['n'], Loan.objects.count())
+        self.assertTrue(search.search_books(Book.objects.all(), Book.objects.first().title).exists())
+
+    def test_refuses_a_database_with_data(self):
+        make_books(1)
+        with self.assertRaises(CommandError):
+            self.seed()
+
+
+class BenchRoutesTests(LibraryTestCase):
+    def result(self, p50, queries=3, memory=100):
+        return {'latency_us': {'p50': p50, 'p95': p50 * 2}, 'db_time_us': {'p50': 100},
+                'queries': {'max': queries}, 'peak_memory_kb': memory}
+
+    def test_every_route_has_a_scenario(self):
+        student = Student.objects.create(full_name='Nino Beridze')
+        book, = make_books(1)
+        loans.borrow(make_books(1, prefix='Lent')[0].pk, student)
+        Post.objects.create(title='Gamarjoba', content='msoplio')
+        routes = {scenario[1] for scenario in bench_routes.scenarios(bench_routes.fixtures())}
+        self.assertEqual(bench_routes.route_names() - routes, set())
+
+    def test_compare_flags_slowdowns_and_extra_queries(self):
+        baseline = {'results': {'small': {'catalogue': self.result(10_000), 'picker': self.result(200),
+                                          'detail': self.result(5_000)}}}
+        candidate = {'results': {'small': {'catalogue': self.result(14_000), 'picker': self.result(400),
+                                           'detail': self.result(5_000, queries=4), 'new': self.result(1)}}}
+        regressions = bench_routes.compare(baseline, candidate, 1.25)
+        # the picker doubled, but by less than MIN_DELTA_US
+        self.assertEqual(regressions, [
+            'small / catalogue: latency p50 10000 -> 14000 (1.40x)',
+            'small / catalogue: latency p95 20000 -> 28000 (1.40x)',
+            'small / detail: queries 3 -> 4',
+        ])
+        self.assertEqual(bench_routes.compare(baseline, candidate, 1.5)[-1], 'small / detail: queries 3 -> 4')
+
+    def test_runs_scenarios_on_the_current_database(self):
+        make_books(3)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.json')
+            call_command('bench_routes', size=['current'], requests=2, warmup=0, output=path,
+                         labels=['catalogue', 'book detail', 'login'], stdout=StringIO())
+            with open(path) as f:
+                results = json.load(f)['results']['current']
+        self.assertEqual(set(results), {'catalogue', 'book detail', 'login'})
+        self.assertEqual(results['login']['status'], 302)
+        self.assertEqual(results['catalogue']['latency_us']['count'], 2)
+        self.assertFalse(User.objects.filter(username__startswith='bench-').exists())
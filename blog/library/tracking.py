@@ -0,0 +1,64 @@
+from django.db.models import DEFERRED
+
+# Field change tracking without a query: loaded values are snapshotted when the instance
+# is built (Model.from_db goes through __init__ too) and again after every save, so a
+# pre_save/post_save receiver can compare against the previous state in memory.
+#
+#   class Loan(TrackChangesMixin, models.Model):
+#       tracked_fields = ('returned_at',)
+#
+#   if instance.has_changed('returned_at'): ...
+#
+# Fields that were deferred when the instance was loaded never report a change.
+
+
+class TrackChangesMixin:
+    tracked_fields = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._snapshot_tracked()
+
+    @classmethod
+    def _tracked_attnames(cls):
+        # ForeignKeys are tracked by their *_id column, so no related object is fetched
+        attnames = cls.__dict__.get('_tracked_attnames_cache')
+        if attnames is None:
+            attnames = {name: cls._meta.get_field(name).attname for name in cls.tracked_fields}
+            cls._tracked_attnames_cache = attnames
+        return attnames
+
+    def _snapshot_tracked(self, fields=None):
+        # fields: only these (names or attnames), the others keep their snapshot
+        values = self.__dict__
+        snapshot = {
+            name: values.get(attname, DEFERRED) for name, attname in self._tracked_attnames().items()
+            if fields is None or name in fields or attname in fields
+        }
+        if fields is None:
+            self._tracked_values = snapshot
+        else:
+            self._tracked_values.update(snapshot)
+
+    def previous(self, name):
+        value = self._tracked_values[name]
+        return None if value is DEFERRED else value
+
+    def has_changed(self, name):
+        old = self._tracked_values[name]
+        if old is DEFERRED:
+            return False
+        return old != self.__dict__.get(self._tracked_attnames()[name], DEFERRED)
+
+    def changed_fields(self):
+        return [name for name in self.tracked_fields if self.has_changed(name)]
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._snapshot_tracked()
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        # also how a deferred field is loaded on first access: a change made in memory to
+        # another field must survive that
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._snapshot_tracked(None if fields is None else set(fields))
@@ -1,14 +1,28 @@
-from django.urls import path
+from django.conf import settings
+from django.urls import include, path
 from library import views as lib_views
 
+if settings.LIBRARY_ASYNC_VIEWS:
+    # ASGI: native async read views (library.views.abook_list)
+    book_list, book_detail = lib_views.abook_list, lib_views.abook_detail
+else:
+    book_list, book_detail = lib_views.BookListView.as_view(), lib_views.BookDetailView.as_view()
+
 urlpatterns = [
-    path('library/', lib_views.BookListView.as_view(), name='book_list'),
-    path('library/<int:book_id>/', lib_views.BookDetailView.as_view(), name='book_detail'),
+    path('library/', book_list, name='book_list'),
+    path('library/<int:book_id>/', book_detail, name='book_detail'),
     path('library/add/', lib_views.AddBookView.as_view(), name='add_book'),
     path('library/author/add/', lib_views.add_author, name='add_author'),
     path('book/<int:book_id>/borrow/', lib_views.borrow_book, name='library_borrow_book'),
     path('loans/<int:loan_id>/return/', lib_views.return_loan, name='library_return_loan'),
     path('library/<int:pk>/edit/', lib_views.EditBookView.as_view(), name='edit_book'),
+    path('library/students/autocomplete/', lib_views.name_autocomplete, {'kind': 'student'},
+         name='student_autocomplete'),
+    path('library/authors/autocomplete/', lib_views.name_autocomplete, {'kind': 'author'},
+         name='author_autocomplete'),
+    path('library/reports/', lib_views.loan_reports, name='library_loan_reports'),
+    path('library/metrics/', lib_views.request_metrics, name='library_request_metrics'),
+    path('library/api/v1/', include('library.api.urls')),
 
     # path('library/', lib_views.book_list, name='book_list'),
     # path('library/<int:book_id>/', lib_views.book_detail, name='book_detail'),
@@ -1,35 +1,129 @@
+from asgiref.sync import sync_to_async
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.mixins import PermissionRequiredMixin, LoginRequiredMixin, UserPassesTestMixin
 
+from django.conf import settings
+from django.core.cache import cache
 from django.db.models import Prefetch
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy
-from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition, require_safe
 from django.views.generic import ListView, DetailView, CreateView, UpdateView
+from . import assets, caching, loans, metrics, names, reports
 from .forms import BorrowForm, BookForm, AuthorForm
-from .models import Author, Book, Loan
+from .models import Author, Book, Loan, Student
+from .pagination import apaginate_keyset, paginate_keyset
+from .search import search_page
 
 
+# ETag / Last-Modified from the cache versions (library.caching), so unchanged pages are a 304.
+# The CSRF cookie is part of the ETag: a page cached by the browser must not outlive its token.
+
+def _csrf_cookie(request):
+    return request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+
+
+def book_list_etag(request, *args, **kwargs):
+    return caching.etag('list', caching.catalogue_version(), request.get_full_path(), _csrf_cookie(request))
+
+
+def book_list_last_modified(request, *args, **kwargs):
+    return caching.version_time(caching.catalogue_version())
+
+
+def book_detail_etag(request, book_id, **kwargs):
+    return caching.etag('detail', caching.book_version(book_id), _csrf_cookie(request))
+
+
+def book_detail_last_modified(request, book_id, **kwargs):
+    return caching.version_time(caching.book_version(book_id))
+
+
+# ?author= filtering and ?q= search, shared with the JSON API (library.api). A search is
+# ranked by the full-text index itself, see library.search.search_page.
+
+def filter_books(queryset, params):
+    author_id = params.get('author', '').strip()
+    if author_id.isdigit():
+        queryset = queryset.filter(author_id=author_id)
+
+    return queryset
+
+
+def paginate_books(queryset, params, ordering, cursor, page_size):
+    q = params.get('q', '').strip()
+    if q:
+        return search_page(queryset, q, cursor, page_size)
+    return paginate_keyset(queryset, ordering, cursor, page_size)
+
+
+async def apaginate_books(queryset, params, ordering, cursor, page_size):
+    q = params.get('q', '').strip()
+    if q:
+        # raw SQL on the index has no async API, the one thread hop of a search
+        return await sync_to_async(search_page)(queryset, q, cursor, page_size)
+    return await apaginate_keyset(queryset, ordering, cursor, page_size)
+
+
+@method_decorator(condition(etag_func=book_list_etag, last_modified_func=book_list_last_modified), name='dispatch')
 class BookListView(ListView):
     model = Book
     template_name = 'library/book_list.html'
     context_object_name = 'books'
+    paginate_by = 24
+    max_paginate_by = 100
+    ordering = ('title', 'id')
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        q = self.request.GET.get('q', '').strip()
-        if q:
-            queryset = queryset.filter(title__icontains=q)
-
-        author_id = self.request.GET.get('author')
-        if author_id:
-            queryset = queryset.filter(author_id=author_id)
-
-        return queryset
+        # author, current loan and tags in a fixed number of queries, whatever the page size
+        queryset = Book.objects.select_related('author', 'current_loan__student').prefetch_related('tags')
+        return filter_books(queryset, self.request.GET)
+
+    def get_paginate_by(self, queryset):
+        per_page = self.request.GET.get('per_page', '')
+        if per_page.isdigit() and int(per_page) > 0:
+            return min(int(per_page), self.max_paginate_by)
+        return self.paginate_by
+
+    def paginate_queryset(self, queryset, page_size):
+        page = paginate_books(queryset, self.request.GET, self.get_ordering(), self.request.GET.get('cursor'),
+                              page_size)
+        return None, page, page.object_list, page.has_next
+
+    def get(self, request, *args, **kwargs):
+        # anonymous visitors share one rendered page per URL and catalogue version
+        if request.user.is_authenticated:
+            return super().get(request, *args, **kwargs)
+
+        key = caching.page_key(request, caching.catalogue_version())
+        content = cache.get(key)
+        if content is not None:
+            return HttpResponse(content)
+        response = super().get(request, *args, **kwargs).render()
+        cache.set(key, response.content, caching.PAGE_TIMEOUT)
+        return response
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['q'] = self.request.GET.get('q', '')
+        context.update(self.catalogue_context(context['page_obj'],
+                                              Author.objects.only('id', 'name').order_by('name')))
+        return context
+
+    def catalogue_context(self, page, authors):
+        # everything but the queries, shared with abook_list
+        context = {
+            'cards': caching.render_book_cards(page.object_list),
+            'q': self.request.GET.get('q', ''),
+            'author_id': self.request.GET.get('author', ''),
+            'authors': authors,
+        }
+        if page.has_next:
+            params = self.request.GET.copy()
+            params['cursor'] = page.next_cursor
+            context['next_page_query'] = params.urlencode()
         return context
 
 
@@ -61,12 +155,66 @@ class BookListView(ListView):
 #         },
 #     )
 
+@method_decorator(condition(etag_func=book_detail_etag, last_modified_func=book_detail_last_modified),
+                  name='dispatch')
 class BookDetailView(DetailView):
     model = Book
     template_name = 'library/book_detail.html'
     context_object_name = 'book'
     pk_url_kwarg = 'book_id'  # URL-shi book_id gamoikeneba pk-is nacvlad
 
+    def get_queryset(self):
+        return Book.objects.select_related('author', 'current_loan__student').prefetch_related('tags')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['current_loan'] = self.object.current_loan
+        if self.object.is_available:
+            context['borrow_form'] = BorrowForm()
+        return context
+
+
+# Native async versions of the read views. blog/urls.py routes to them instead of the
+# class-based views when LIBRARY_ASYNC_VIEWS is on (the default under blog/asgi.py), so an
+# ASGI worker serves the catalogue without a sync_to_async thread hop. They reuse the
+# views' querysets, caches and ETags; only the queries themselves are awaited, and nothing
+# lazy reaches the templates.
+
+@condition(etag_func=book_list_etag, last_modified_func=book_list_last_modified)
+async def abook_list(request):
+    user = await request.auser()
+    key = None
+    if not user.is_authenticated:
+        key = caching.page_key(request, caching.catalogue_version())
+        content = await cache.aget(key)
+        if content is not None:
+            return HttpResponse(content)
+
+    view = BookListView(request=request, args=(), kwargs={})
+    page = await apaginate_books(view.get_queryset(), request.GET, view.get_ordering(), request.GET.get('cursor'),
+                                 view.get_paginate_by(None))
+    authors = [author async for author in Author.objects.only('id', 'name').order_by('name')]
+    context = {'books': page.object_list, 'page_obj': page, 'is_paginated': page.has_next,
+               **view.catalogue_context(page, authors)}
+    response = render(request, view.template_name, context)
+    if key is not None:
+        await cache.aset(key, response.content, caching.PAGE_TIMEOUT)
+    return response
+
+
+@condition(etag_func=book_detail_etag, last_modified_func=book_detail_last_modified)
+async def abook_detail(request, book_id):
+    view = BookDetailView(request=request, args=(), kwargs={'book_id': book_id})
+    try:
+        book = await view.get_queryset().aget(pk=book_id)
+    except Book.DoesNotExist:
+        raise Http404('No book found matching the query')
+    context = {'book': book, 'object': book, 'current_loan': book.current_loan}
+    if book.is_available:
+        # an unbound picker renders without a query
+        context['borrow_form'] = BorrowForm()
+    return render(request, view.template_name, context)
+
 
 #
 # def book_detail(request, book_id):
@@ -93,20 +241,51 @@ class BookDetailView(DetailView):
 #     )
 
 
+# name pickers of BorrowForm / BookForm (library.widgets.AutocompleteSelect): a prefix of the
+# normalized name (library.names), keyset-paginated on the (search_name, id) index. Pages are
+# cached per names version, which any add/rename/delete of a student or author bumps.
+
+NAME_PAGE_SIZE = 20
+NAME_PICKERS = {
+    'student': (Student, 'full_name'),
+    'author': (Author, 'name'),
+}
+
+
+@require_safe
+def name_autocomplete(request, kind):
+    model, label = NAME_PICKERS[kind]
+    q = names.normalize(request.GET.get('q', ''))
+    cursor = request.GET.get('cursor', '')
+    key = f'library:names:{kind}:{caching.etag(caching.names_version(model), q, cursor)}'
+    data = cache.get(key)
+    if data is None:
+        queryset = model.objects.filter(names.prefix_filter(q)).values('id', label, 'search_name')
+        page = paginate_keyset(queryset, ('search_name', 'id'), cursor, NAME_PAGE_SIZE)
+        data = {
+            'results': [{'id': row['id'], 'text': row[label]} for row in page],
+            'next': page.next_cursor,
+        }
+        cache.set(key, data, caching.PAGE_TIMEOUT)
+    return JsonResponse(data)
+
+
 def borrow_book(request, book_id):
     if request.method != 'POST':
         return redirect('book_detail', book_id=book_id)
-    book = get_object_or_404(Book, id=book_id)
+    book = get_object_or_404(Book.objects.only('id', 'current_loan'), id=book_id)
 
-    if Loan.objects.filter(book=book, returned_at__isnull=True).exists():
+    if not book.is_available:
         return redirect('book_detail', book_id=book_id)
 
     form = BorrowForm(request.POST)
 
     if form.is_valid():
-        loan = form.save(commit=False)
-        loan.book = book
-        loan.save()
+        try:
+            loans.borrow(book.pk, form.cleaned_data['student'])
+        except loans.BookUnavailable:
+            # sxva tanamshromelma ukve gaitana
+            pass
 
     return redirect('book_detail', book_id=book_id)
 
@@ -114,10 +293,8 @@ def borrow_book(request, book_id):
 def return_loan(request, loan_id):
     if request.method != 'POST':
         return redirect('book_list')
-    loan = get_object_or_404(Loan, id=loan_id)
-    if loan.returned_at is None:
-        loan.returned_at = timezone.now()
-    loan.save(update_fields=['returned_at'])
+    loan = get_object_or_404(Loan.objects.only('id', 'book_id'), id=loan_id)
+    loans.return_loan(loan.pk)
     return redirect('book_detail', book_id=loan.book_id)
 
 
@@ -179,3 +356,30 @@ def add_author(request):
     else:
         form = AuthorForm()
     return render(request, 'library/add_author.html', {'form': form})
+
+
+@staff_member_required
+def request_metrics(request):
+    # p50/p95/p99 per route; ?scope=process limits it to the process serving this request
+    all_processes = request.GET.get('scope') != 'process'
+    return JsonResponse({'routes': metrics.collect(all_processes=all_processes)})
+
+
+@staff_member_required
+def loan_reports(request):
+    # ?days=30: period of the circulation tables; overdue loans are always the current ones
+    try:
+        days = min(max(int(request.GET.get('days', 30)), 1), 366)
+    except ValueError:
+        days = 30
+    return render(request, 'library/reports.html', {'report': reports.circulation(days), 'days': days})
+
+
+# covers and CSS under content-hashed URLs, see library.assets
+
+def serve_media(request, path):
+    return assets.serve(request, path, assets.media_path(path))
+
+
+def serve_static(request, path):
+    return assets.serve(request, path, assets.static_path(assets.split_hashed_name(path)[0]))
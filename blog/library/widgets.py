@@ -0,0 +1,37 @@
+from django import forms
+from django.core.exceptions import ValidationError
+from django.urls import reverse
+
+
+class AutocompleteSelect(forms.Select):
+    # a <select> of a ModelChoiceField that renders only the selected option; the rest
+    # is fetched from `url_name` (see library.views.name_autocomplete) by
+    # static/js/autocomplete.js while the user types
+
+    def __init__(self, url_name, attrs=None):
+        super().__init__(attrs)
+        self.url_name = url_name
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs']['data-autocomplete-url'] = reverse(self.url_name)
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        field = self.choices.field
+        choices = [('', field.empty_label)] if field.empty_label is not None else []
+        submitted = next((v for v in value if v not in field.empty_values), None)
+        if submitted is not None:
+            try:
+                # the same single lookup the field validates with
+                obj = field.to_python(submitted)
+            except ValidationError:
+                obj = None
+            if obj is not None:
+                choices.append((field.prepare_value(obj), field.label_from_instance(obj)))
+
+        all_choices, self.choices = self.choices, choices
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = all_choices
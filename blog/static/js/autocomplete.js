@@ -0,0 +1,78 @@
+// Name pickers (library.widgets.AutocompleteSelect): the page only carries the selected
+// <option>, a search box in front of the <select> fetches the matching names page by page.
+(function () {
+    'use strict';
+
+    function enhance(select) {
+        var url = select.dataset.autocompleteUrl;
+        var empty = select.querySelector('option[value=""]');
+        var search = document.createElement('input');
+        search.type = 'search';
+        search.className = select.className;
+        search.placeholder = '...';
+        search.autocomplete = 'off';
+        select.parentNode.insertBefore(search, select);
+
+        var more = null;
+        var timer = null;
+        var latest = 0;
+
+        function load(cursor) {
+            var request = ++latest;
+            var params = new URLSearchParams({q: search.value.trim()});
+            if (cursor) {
+                params.set('cursor', cursor);
+            }
+            fetch(url + '?' + params, {headers: {Accept: 'application/json'}})
+                .then(function (response) { return response.json(); })
+                .then(function (data) {
+                    if (request !== latest) {
+                        return;  // a newer search is under way
+                    }
+                    if (more) {
+                        more.remove();
+                        more = null;
+                    }
+                    if (!cursor) {
+                        select.options.length = 0;
+                        if (empty) {
+                            select.add(empty);
+                        }
+                    }
+                    data.results.forEach(function (item) {
+                        select.add(new Option(item.text, item.id));
+                    });
+                    if (data.next) {
+                        more = new Option('…', '');
+                        more.dataset.cursor = data.next;
+                        select.add(more);
+                    }
+                    if (!cursor && data.results.length === 1) {
+                        select.value = String(data.results[0].id);
+                    }
+                });
+        }
+
+        search.addEventListener('input', function () {
+            clearTimeout(timer);
+            timer = setTimeout(function () { load(null); }, 200);
+        });
+        select.addEventListener('change', function () {
+            // the trailing "..." option loads the next page
+            if (more && select.selectedOptions[0] === more) {
+                select.value = '';
+                load(more.dataset.cursor);
+            }
+        });
+        select.addEventListener('focus', function first() {
+            select.removeEventListener('focus', first);
+            if (!search.value && select.options.length <= 2) {
+                load(null);
+            }
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('select[data-autocomplete-url]').forEach(enhance);
+    });
+})();